@@ -1,44 +1,91 @@
 # app.py
 import sys
 import os
-import io
-import random
-import string
-import datetime
+import asyncio
+import time
+from functools import partial
+from contextlib import asynccontextmanager
 from typing import List, Optional
 from fastapi.staticfiles import StaticFiles
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Query
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
 from pydantic import BaseModel
 from pathlib import Path
 import json
 import re
 
 from dotenv import load_dotenv
-from openai import OpenAI
 load_dotenv()
 
 # allow importing from utils if needed
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../utils'))
 sys.path.append(r"D:\Work\Question generator AI\ai-qgen\utils")
 
-from prompt_builder import build_generation_prompt
-from llm_engine import generate_questions as llm_generate
-from markdown_builder import generate_markdown, save_markdown_as_excel
+from prompt_builder import build_budgeted_prompt, tokenizer_name
+from llm_engine import agenerate_questions as llm_generate, astream_questions as llm_stream
+from llm_client import close_async_client, limit_llm_concurrency
+from llm_cache import cache_stats
+from llm_gateway import LLMUnavailableError, gateway_stats
+from chunking import chunk_failed
+from dedup import DEDUP_MODE, DEDUP_RETRIES, near_duplicates
+from frame_cache import frame_cache
+from curated_watcher import WATCH_ENABLED, curated_watcher
+from catalog import CATALOG_MAX_AGE, catalog, etag_for, fold
+from jobs import job_queue
+from warmup import WARMUP_ENABLED, warmup
+from metrics import end_request, http_request_seconds, register_collector, render_metrics, span, start_request
+from question_pool import QUESTION_POOL_ENABLED, pool_key, question_pool
+from chunking import GENERATION_CHUNK_SIZE, generate_in_chunks
+from markdown_builder import agenerate_markdown
+from exporter import MEDIA_TYPES, download_name, export_store, render
 from fewshot import (
     get_fewshot_examples,
     get_fewshot_examples_alevel,
-    get_fewshot_examples_science
+    get_fewshot_examples_science,
+    _read_excel_cached,
+    read_science_workbook,
+    FEWSHOT_SAMPLING
 )
 
 # Ensure folders exist
 Path("curated_excels").mkdir(parents=True, exist_ok=True)
-Path("outputs").mkdir(parents=True, exist_ok=True)
 Path("frontend").mkdir(parents=True, exist_ok=True)
 
-app = FastAPI(title="AI Question Generator Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # parse static_data once up front; later requests only re-stat it
+    catalog.load()
+    # load the vendored prompt tokenizer off the event loop
+    await run_in_threadpool(tokenizer_name)
+    if QUESTION_POOL_ENABLED:
+        question_pool.start(_fill_pool, catalog.snapshot)
+    job_queue.start(_run_job)
+    # retention / size cleanup of stored exports
+    export_store.start()
+    # load every curated frame (and then the near-duplicate index) before reporting ready;
+    # the server already answers meanwhile, /healthz/ready says 503 until it is done
+    after = [near_duplicates.load] if DEDUP_MODE != "off" else []
+    if WARMUP_ENABLED:
+        warming = asyncio.create_task(run_in_threadpool(warmup.run, after))
+    else:
+        warming = asyncio.get_running_loop().run_in_executor(None, lambda: [step() for step in after])
+        warmup.mark_ready()
+    # reparse edited curated workbooks in the background and swap in the new frames/catalog
+    if WATCH_ENABLED:
+        curated_watcher.start()
+    yield
+    await curated_watcher.stop()
+    if not warming.done():
+        warming.cancel()
+    await job_queue.stop()
+    await question_pool.stop()
+    await export_store.stop()
+    # release the pooled LLM HTTP connections
+    await close_async_client()
+
+app = FastAPI(title="AI Question Generator Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,6 +95,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    # per-request stage spans -> Server-Timing header; request duration -> /metrics
+    token = start_request()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        timing = end_request(token)
+    route = request.scope.get("route")
+    http_request_seconds.observe(time.perf_counter() - start, getattr(route, "path", "unmatched"), response.status_code)
+    response.headers["Server-Timing"] = ", ".join(filter(None, [timing, f"total;dur={(time.perf_counter() - start) * 1000:.1f}"]))
+    return response
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable(request: Request, exc: LLMUnavailableError):
+    # rate limited / degraded upstream: tell the client to come back instead of a bare 500
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(max(1, int(exc.retry_after + 0.5)))})
+
 # Request model
 class QuestionRequest(BaseModel):
     subject: Optional[str] = "Math"    # Math, Physics or Chemistry
@@ -58,10 +125,24 @@ class QuestionRequest(BaseModel):
     question_type: Optional[str] = None
     difficulty: str
     num_questions: int
+    # split generation into concurrent chunks of this size (None: GENERATION_CHUNK_SIZE, 0: off)
+    chunk_size: Optional[int] = None
+    # skip the LLM response cache and ask the model again
+    regenerate: bool = False
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+@app.get("/healthz/ready")
+def healthz_ready():
+    """Readiness: 200 once the curated workbooks are loaded, 503 while warming up."""
+    status = warmup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
 
 # static files mounts
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
-app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
 app.mount("/static_data", StaticFiles(directory="static_data"), name="static_data")
 
 @app.get("/", include_in_schema=False)
@@ -76,71 +157,80 @@ MATH_ALEVEL_TOPICS_FILE = Path("static_data/math_topics_alevel.json")
 MATH_ALEVEL_CHAPTERS_FILE = Path("static_data/math_chapters_alevel.json")
 SCIENCE_TOPICS_GCSE_DIR = Path("static_data")
 
+def _catalog_response(request: Request, payload):
+    """JSON response with ETag/Cache-Control; 304 when the browser already has it."""
+    etag = etag_for(payload)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
+def _catalog_error(snap, name):
+    if name in snap.errors:
+        raise HTTPException(status_code=500, detail=f"Failed to read {name}: {snap.errors[name]}")
+
 @app.get("/math_topics")
 def topics_for_chapter(
+    request: Request,
     curriculum: str = Query("GCSE", description="GCSE or ALEVEL"),
     chapter_num: Optional[int] = Query(None, description="Chapter number for GCSE"),
     chapter_name: Optional[str] = Query(None, description="Chapter name (sheet) for A-LEVEL")
 ):
+    snap = catalog.snapshot()
     # A-LEVEL static JSON branch
     if curriculum and curriculum.upper() == "ALEVEL":
-        if not MATH_ALEVEL_TOPICS_FILE.exists():
-            raise HTTPException(status_code=500, detail="A-level topics file not found; run scripts/generate_alevel_topics.py")
-        data = json.loads(MATH_ALEVEL_TOPICS_FILE.read_text(encoding="utf-8"))
+        _catalog_error(snap, MATH_ALEVEL_TOPICS_FILE.name)
+        if snap.math_alevel is None:
+            raise HTTPException(status_code=500, detail="A-level topics file not found; run scripts/build_catalog.py")
         if chapter_name is None:
             # return available chapter names (keys)
-            return {"chapters": list(data.keys())}
-        topics = data.get(chapter_name, [])
-        return {"chapter": chapter_name, "topics": topics}
+            return _catalog_response(request, {"chapters": snap.alevel_topic_chapters})
+        _, topics = snap.alevel_topics(chapter_name)
+        return _catalog_response(request, {"chapter": chapter_name, "topics": topics})
 
     # GCSE / default branch (static JSON)
-    if not MATH_TOPICS_FILE.exists():
-        raise HTTPException(status_code=500, detail="Topics file not found. Run scripts/generate_topics.py")
+    _catalog_error(snap, MATH_TOPICS_FILE.name)
+    if snap.math_gcse is None:
+        raise HTTPException(status_code=500, detail="Topics file not found. Run scripts/build_catalog.py")
     if chapter_num is None:
         raise HTTPException(status_code=400, detail="chapter_num is required for GCSE")
-    data = json.loads(MATH_TOPICS_FILE.read_text(encoding="utf-8"))
-    return {"chapter": chapter_num, "topics": data.get(str(chapter_num), [])}
+    return _catalog_response(request, {"chapter": chapter_num, "topics": snap.math_gcse.get(str(chapter_num), [])})
 
 
 @app.get("/math_chapters_alevel")
-def alevel_chapters():
-    if not MATH_ALEVEL_CHAPTERS_FILE.exists():
+def alevel_chapters(request: Request):
+    snap = catalog.snapshot()
+    _catalog_error(snap, MATH_ALEVEL_CHAPTERS_FILE.name)
+    data = snap.alevel_chapters
+    if data is None:
         raise HTTPException(
             status_code=500,
             detail="A-level chapters file not found; create static_data/math_chapters_alevel.json"
         )
-    try:
-        data = json.loads(MATH_ALEVEL_CHAPTERS_FILE.read_text(encoding="utf-8"))
-        if "chapters" not in data or not isinstance(data["chapters"], list):
-            raise HTTPException(status_code=500, detail="alevel_chapters.json malformed; expected {\"chapters\": [...]}")
+    if not isinstance(data, dict) or not isinstance(data.get("chapters"), list):
+        raise HTTPException(status_code=500, detail="alevel_chapters.json malformed; expected {\"chapters\": [...]}")
+    return _catalog_response(request, data)
+
+def _science_catalog(snap, subject_clean: str, curriculum: str):
+    """Catalog entry for static_data/{subject}_topics_{gcse|alevel}.json (any filename case)."""
+    suffix = "gcse" if curriculum.upper() == "GCSE" else "alevel"
+    entry = snap.science_entry(subject_clean, suffix)
+    if entry is None:
+        _catalog_error(snap, f"{subject_clean}_topics_{suffix}.json")
+    return entry
 
-        return data
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
 @app.get("/science_chapters")
-def science_chapters(subject: str = Query(..., description="Physics|Chemistry"),
+def science_chapters(request: Request,
+                     subject: str = Query(..., description="Physics|Chemistry"),
                      curriculum: str = Query("GCSE", description="GCSE|ALEVEL")):
     """
     Return list of chapter names for the requested science subject and curriculum.
     Prefers static JSON file: static_data/{Subject}_topics_gcse.json or {subject}_topics_alevel.json
     """
     subject_clean = str(subject).strip()
-    if curriculum.upper() == "GCSE":
-        json_path = SCIENCE_TOPICS_GCSE_DIR / f"{subject_clean}_topics_gcse.json"
-    else:
-        json_path = SCIENCE_TOPICS_GCSE_DIR / f"{subject_clean}_topics_alevel.json"
-
-    if json_path.exists():
-        try:
-            payload = json.loads(json_path.read_text(encoding="utf-8"))
-            # payload structure assumed: { "Chapter Name": {"topics": [...], "question_types":[...]} ... }
-            chapters = list(payload.keys())
-            return {"subject": subject_clean, "chapters": chapters}
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to read {json_path.name}: {e}")
+    entry = _science_catalog(catalog.snapshot(), subject_clean, curriculum)
+    if entry is not None:
+        return _catalog_response(request, {"subject": subject_clean, "chapters": entry["chapters"]})
 
     # Fallback: attempt to scan curated_excels/<Subject> folder for filenames (simple fallback)
     folder = Path("curated_excels") / subject_clean
@@ -159,10 +249,11 @@ def science_chapters(subject: str = Query(..., description="Physics|Chemistry"),
             names.append(name)
     if not names:
         raise HTTPException(status_code=404, detail=f"No chapter files found for {subject_clean}")
-    return {"subject": subject_clean, "chapters": sorted(names)}
+    return _catalog_response(request, {"subject": subject_clean, "chapters": sorted(names)})
 
 @app.get("/science_topics")
-def science_topics(subject: str = Query(..., description="Physics|Chemistry"),
+def science_topics(request: Request,
+                   subject: str = Query(..., description="Physics|Chemistry"),
                    curriculum: str = Query("GCSE", description="GCSE|ALEVEL"),
                    chapter: str = Query(..., description="chapter name")):
     """
@@ -172,29 +263,11 @@ def science_topics(subject: str = Query(..., description="Physics|Chemistry"),
     subject_clean = str(subject).strip()
     chapter_name = str(chapter).strip()
 
-    if curriculum.upper() == "GCSE":
-        json_path = SCIENCE_TOPICS_GCSE_DIR / f"{subject_clean}_topics_gcse.json"
-    else:
-        json_path = SCIENCE_TOPICS_GCSE_DIR / f"{subject_clean}_topics_alevel.json"
-
-    if json_path.exists():
-        try:
-            payload = json.loads(json_path.read_text(encoding="utf-8"))
-            chapter_data = payload.get(chapter_name)
-            if not chapter_data:
-                # try fuzzy keys (case-insensitive)
-                for k in payload.keys():
-                    if k.lower() == chapter_name.lower():
-                        chapter_data = payload[k]
-                        break
-            if not chapter_data:
-                return {"chapter": chapter_name, "topics": [], "question_types": []}
-            # expect fields "topics" and "question_types"
-            topics = chapter_data.get("topics", []) or []
-            qtypes = chapter_data.get("question_types", []) or []
-            return {"chapter": chapter_name, "topics": topics, "question_types": qtypes}
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to read {json_path.name}: {e}")
+    entry = _science_catalog(catalog.snapshot(), subject_clean, curriculum)
+    if entry is not None:
+        # exact or case-insensitive chapter match
+        _, topics, qtypes = entry["by_chapter"].get(fold(chapter_name), (chapter_name, [], []))
+        return _catalog_response(request, {"chapter": chapter_name, "topics": topics, "question_types": qtypes})
 
     # Fallback: try to read Excel file for the chapter (simple heuristic)
     excel_path = Path("curated_excels") / subject_clean / f"{subject_clean} Chapter {chapter_name}.xlsx"
@@ -213,18 +286,16 @@ def science_topics(subject: str = Query(..., description="Physics|Chemistry"),
         else:
             return {"chapter": chapter_name, "topics": [], "question_types": []}
 
-    # read excel and attempt to extract "Subtopic" and "Question type" columns
+    # read excel (compiled corpus / mtime cache) and extract "Subtopic" and "Question type" columns
     try:
-        df = pd.read_excel(excel_path)
-        # normalize cols
-        df.columns = [str(c).strip() for c in df.columns]
+        df = _read_excel_cached(excel_path, reader=read_science_workbook)
         topics = []
         qtypes = []
         if "Subtopic" in df.columns:
             topics = sorted(set([str(x).strip() for x in df["Subtopic"].dropna().astype(str)]))
         if "Question type" in df.columns:
             qtypes = sorted(set([str(x).strip() for x in df["Question type"].dropna().astype(str)]))
-        return {"chapter": chapter_name, "topics": topics, "question_types": qtypes}
+        return _catalog_response(request, {"chapter": chapter_name, "topics": topics, "question_types": qtypes})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read excel {excel_path}: {e}")
 
@@ -236,102 +307,46 @@ def _safe_filename(s: str) -> str:
     s = s.strip().replace(" ", "_")
     return s
 
-@app.post("/generate")
-def generate_questions(req: QuestionRequest):
-    # Validate inputs
-    if req.num_questions < 1 or req.num_questions > 40:
-        raise HTTPException(status_code=400, detail="num_questions must be between 1 and 40")
-
+def _resolve_request(req: QuestionRequest):
+    """
+    Validate `req` for its subject/curriculum flow and return
+    (flow label, select_fewshots callable, output filename stem, message when no few-shots match).
+    """
     # GCSE flow
     if req.subject.lower() == "math":
         if req.curriculum.upper() == "GCSE":
             if req.chapter_num is None:
                 raise HTTPException(status_code=400, detail="chapter_num is required for GCSE")
 
-            try:
-                fewshots = get_fewshot_examples(
-                    chapter_num=req.chapter_num,
-                    topic=req.topic,
-                    difficulty=req.difficulty,
-                    k=min(10, req.num_questions)
-                )
-            except FileNotFoundError as e:
-                raise HTTPException(status_code=404, detail=str(e))
-            except KeyError as e:
-                raise HTTPException(status_code=500, detail=str(e))
-
-            print(f"[generate:GCSE] num_questions={req.num_questions}, chapter={req.chapter_num}, topic='{req.topic}', difficulty='{req.difficulty}'")
-            print(f"[generate:GCSE] fewshots found: {len(fewshots)} examples")
-            print(f"[generate] using_fallback={any(fs['difficulty'].lower() != req.difficulty.lower() for fs in fewshots)}")
-
-            if not fewshots:
-                return {"error": f"No few-shot examples found for topic '{req.topic}' and difficulty '{req.difficulty}' in chapter {req.chapter_num}"}
-
-            # Build prompt -> LLM
-            prompt = build_generation_prompt(req.subject, req.curriculum,
-                                             req.topic, None, req.difficulty, 
-                                             fewshots, req.num_questions)
-            generated = llm_generate(prompt)
-
-            # Convert to markdown (second LLM call inside generate_markdown)
-            markdown_list = generate_markdown(generated)
-
-            # Save markdown list into Excel (.xlsx)
+            select_fewshots = partial(
+                get_fewshot_examples,
+                chapter_num=req.chapter_num,
+                topic=req.topic,
+                difficulty=req.difficulty,
+                k=min(10, req.num_questions)
+            )
             safe_topic = _safe_filename(req.topic)
-            out_file_md = Path("outputs") / f"GCSE_Chapter{req.chapter_num}_{safe_topic}_{req.difficulty}_{len(markdown_list)}.xlsx"
-            save_markdown_as_excel(markdown_list, out_file_md)
-
-            return {
-                "generated_questions": generated,
-                "output_file": str(out_file_md),
-                "fewshots_used": len(fewshots),
-                "fewshots_preview": fewshots[:5]
-            }
+            out_stem = f"GCSE_Chapter{req.chapter_num}_{safe_topic}_{req.difficulty}"
+            empty = f"No few-shot examples found for topic '{req.topic}' and difficulty '{req.difficulty}' in chapter {req.chapter_num}"
+            return "GCSE", select_fewshots, out_stem, empty
 
         # A-LEVEL flow
         elif req.curriculum.upper() == "ALEVEL":
             if not req.chapter_name:
                 raise HTTPException(status_code=400, detail="chapter_name is required for ALEVEL")
 
-            try:
-                fewshots = get_fewshot_examples_alevel(
-                    sheet_name=req.chapter_name,
-                    topic=req.topic,
-                    difficulty=req.difficulty,
-                    k=min(10, req.num_questions)
-                )
-            except FileNotFoundError as e:
-                raise HTTPException(status_code=404, detail=str(e))
-            except KeyError as e:
-                raise HTTPException(status_code=500, detail=str(e))
-
-            print(f"[generate:ALEVEL] num_questions={req.num_questions}, sheet='{req.chapter_name}', topic='{req.topic}', difficulty='{req.difficulty}'")
-            print(f"[generate:ALEVEL] fewshots found: {len(fewshots)} examples")
-            print(f"[generate] using_fallback={any(fs['difficulty'].lower() != req.difficulty.lower() for fs in fewshots)}")
-
-            if not fewshots:
-                return {"error": f"No few-shot examples found for topic '{req.topic}' and difficulty '{req.difficulty}' in sheet '{req.chapter_name}'"}
-
-            # Build prompt -> LLM
-            prompt = build_generation_prompt(req.subject, req.curriculum, 
-                                             req.topic, None, req.difficulty,
-                                             fewshots, req.num_questions)
-            generated = llm_generate(prompt)
-            # Convert to markdown
-            markdown_list = generate_markdown(generated)
-
-            # Save markdown list into Excel (.xlsx)
+            select_fewshots = partial(
+                get_fewshot_examples_alevel,
+                sheet_name=req.chapter_name,
+                topic=req.topic,
+                difficulty=req.difficulty,
+                k=min(10, req.num_questions)
+            )
             safe_topic = _safe_filename(req.topic)
             safe_sheet = _safe_filename(req.chapter_name)
-            out_file_md = Path("outputs") / f"ALEvel_{safe_sheet}_{safe_topic}_{req.difficulty}_{len(markdown_list)}.xlsx"
-            save_markdown_as_excel(markdown_list, out_file_md)
-
-            return {
-                "generated_questions": generated,
-                "output_file": str(out_file_md),
-                "fewshots_used": len(fewshots),
-                "fewshots_preview": fewshots[:5]
-            }
+            out_stem = f"ALEvel_{safe_sheet}_{safe_topic}_{req.difficulty}"
+            empty = f"No few-shot examples found for topic '{req.topic}' and difficulty '{req.difficulty}' in sheet '{req.chapter_name}'"
+            return "ALEVEL", select_fewshots, out_stem, empty
 
     # SCIENCE SUBJECTS (Physics / Chemistry)
     elif req.subject.lower() in ["physics", "chemistry"]:
@@ -341,48 +356,524 @@ def generate_questions(req: QuestionRequest):
         if not req.question_type:
             raise HTTPException(status_code=400, detail="question_type is required for science subjects")
 
-        try:
-            fewshots = get_fewshot_examples_science(
-                subject=req.subject,
-                chapter_name=req.chapter_name,
-                qtype=req.question_type,
-                topic = req.topic,
-                k=min(10, req.num_questions)
-            )
-        except FileNotFoundError as e:
-            raise HTTPException(status_code=404, detail=str(e))
-        except KeyError as e:
-            raise HTTPException(status_code=500, detail=str(e))
+        select_fewshots = partial(
+            get_fewshot_examples_science,
+            subject=req.subject,
+            chapter_name=req.chapter_name,
+            qtype=req.question_type,
+            topic=req.topic,
+            k=min(10, req.num_questions)
+        )
+        safe_chapter = _safe_filename(req.chapter_name)
+        safe_qtype = _safe_filename(req.question_type)
+        out_stem = f"{req.subject}_{safe_chapter}_{safe_qtype}_{req.difficulty}"
+        empty = f"No examples found in {req.subject} chapter '{req.chapter_name}' with question_type '{req.question_type}'"
+        return "SCIENCE", select_fewshots, out_stem, empty
 
-        print(f"[generate:SCIENCE] subject={req.subject}, chapter='{req.chapter_name}', qtype='{req.question_type}', difficulty='{req.difficulty}'")
-        print(f"[generate:SCIENCE] fewshots found: {len(fewshots)} examples")
+    # Invalid curriculum
+    raise HTTPException(status_code=400, detail="Invalid curriculum type")
 
-        if not fewshots:
-            return {
-                "error": f"No examples found in {req.subject} chapter '{req.chapter_name}' with question_type '{req.question_type}'"
-            }
+async def _load_fewshots(select_fewshots):
+    """Run a few-shot selector in the threadpool, mapping loader errors to HTTP errors."""
+    try:
+        return await run_in_threadpool(select_fewshots)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        prompt = build_generation_prompt(req.subject, req.curriculum, 
-                                        req.topic, req.question_type, req.difficulty,
-                                        fewshots, req.num_questions)
+def _build_prompt(req: QuestionRequest, fewshots, num_questions: int):
+    with span("build_generation_prompt"):
+        prompt, stats = build_budgeted_prompt(req.subject, req.curriculum,
+                                              req.topic, req.question_type, req.difficulty,
+                                              fewshots, num_questions)
+    if stats["prompt_tokens"] < stats["untrimmed_tokens"]:
+        print(f"[prompt] trimmed to {stats['prompt_tokens']}/{stats['budget']} tokens (from {stats['untrimmed_tokens']}): "
+              f"fewshots kept={stats['fewshots_kept']}/{stats['fewshots']}, hints_dropped={stats['hints_dropped']}, "
+              f"answer_cap={stats['answer_cap']}")
+    return prompt
+
+async def _drop_near_duplicates(req: QuestionRequest, fewshots, select_fewshots, generated, replayed=()):
+    """
+    Drop generated questions that near-duplicate the curated corpus, earlier outputs
+    or each other (see dedup.py), then ask the LLM again for just the dropped slots.
+    `replayed` are the items that came from the generation cache; they were checked
+    when first generated and are not dropped now.
+    """
+    if DEDUP_MODE == "off" or chunk_failed(generated):
+        return generated
+    kept, dropped = await run_in_threadpool(near_duplicates.filter, generated, (), replayed)
+    for attempt in range(DEDUP_RETRIES):
+        if not dropped:
+            break
+        print(f"[dedup] dropped {len(dropped)}/{len(generated)} near-duplicates, requesting replacements")
+        refill_fewshots = await run_in_threadpool(select_fewshots) if FEWSHOT_SAMPLING != "stable" else fewshots
+        more = await llm_generate(_build_prompt(req, refill_fewshots or fewshots, len(dropped)),
+                                  use_cache=False)
+        if chunk_failed(more):
+            break
+        more_kept, dropped = await run_in_threadpool(near_duplicates.filter, more[:len(dropped)], kept)
+        kept.extend(more_kept)
+    if dropped:
+        print(f"[dedup] returning {len(kept)}/{len(generated)} questions, {len(dropped)} slots stayed duplicates")
+    await run_in_threadpool(near_duplicates.remember, kept)
+    return kept
+
+async def _format_parts(generated, part_size: int):
+    """Markdown-format `generated` in concurrent parts of part_size items."""
+    part_size = max(1, part_size)
+    parts = await asyncio.gather(*(agenerate_markdown(generated[i:i + part_size])
+                                   for i in range(0, len(generated), part_size)))
+    return [item for part in parts for item in part]
+
+async def _generate_items(req: QuestionRequest, fewshots, select_fewshots):
+    """
+    Generate and markdown-format req.num_questions items. Large requests are split into
+    concurrent chunks, each prompted with its own few-shot sample (see chunking.py).
+    Near-duplicates are replaced before formatting. Returns (generated, markdown_list).
+    """
+    chunk_size = GENERATION_CHUNK_SIZE if req.chunk_size is None else req.chunk_size
+    if not chunk_size or req.num_questions <= chunk_size:
+        # Build prompt -> LLM
+        generated, from_cache = await llm_generate(_build_prompt(req, fewshots, req.num_questions),
+                                                   use_cache=not req.regenerate, with_source=True)
+        generated = await _drop_near_duplicates(req, fewshots, select_fewshots, generated,
+                                                generated if from_cache else ())
+        # Convert to markdown (second LLM call inside generate_markdown)
+        markdown_list = await _format_parts(generated, len(generated))
+        return generated, markdown_list
+
+    replayed = []  # items of chunks answered from the generation cache
+
+    async def run_chunk(count, chunk_index):
+        # a fresh sample per chunk, unless sampling is stable (it would return the same rows)
+        resample = chunk_index > 0 and FEWSHOT_SAMPLING != "stable"
+        chunk_fewshots = await run_in_threadpool(select_fewshots) if resample else fewshots
+        questions, from_cache = await llm_generate(_build_prompt(req, chunk_fewshots or fewshots, count),
+                                                   use_cache=not req.regenerate, cache_variant=chunk_index,
+                                                   with_source=True)
+        if from_cache:
+            replayed.extend(questions)
+        return questions
+
+    generated = await generate_in_chunks(req.num_questions, chunk_size, run_chunk)
+    generated = await _drop_near_duplicates(req, fewshots, select_fewshots, generated, replayed)
+    # markdown pass per chunk, concurrently
+    markdown_list = await _format_parts(generated, chunk_size)
+    return generated, markdown_list
+
+async def _stream_items(req: QuestionRequest, fewshots, select_fewshots, emit):
+    """
+    Streaming counterpart of _generate_items: the completion is parsed as it arrives
+    (llm_engine.astream_questions) and every question is checked for near-duplicates
+    and markdown-formatted as soon as its object is complete, then
+    `await emit(index, item, markdown)` is called. Dropped near-duplicates are replaced
+    by further streamed requests (at most DEDUP_RETRIES). Returns (generated, markdown_list).
+    """
+    kept, formatting = [], []
+
+    async def format_item(index, item):
+        md = (await agenerate_markdown([item]) or [{}])[0]
+        await emit(index, item, md)
+        return md
+
+    async def stream(prompt, use_cache):
+        """Emit the items of one streamed reply; returns how many were dropped as near-duplicates."""
+        dropped = 0
+        async for item, from_cache in llm_stream(prompt, use_cache=use_cache, with_source=True):
+            if len(kept) >= req.num_questions:
+                continue  # the model wrote more than asked for
+            if DEDUP_MODE != "off" and not chunk_failed([item]):
+                ok, _ = await run_in_threadpool(near_duplicates.filter, [item], kept,
+                                                [item] if from_cache else ())
+                if not ok:
+                    dropped += 1
+                    continue
+                item = ok[0]
+            formatting.append(asyncio.create_task(format_item(len(kept), item)))
+            kept.append(item)
+        return dropped
 
-        generated = llm_generate(prompt)
-        markdown_list = generate_markdown(generated)
+    try:
+        dropped = await stream(_build_prompt(req, fewshots, req.num_questions), not req.regenerate)
+        for attempt in range(DEDUP_RETRIES):
+            missing = req.num_questions - len(kept)
+            if not dropped or missing <= 0 or chunk_failed(kept):
+                break
+            print(f"[dedup] dropped {dropped} streamed near-duplicates, requesting replacements")
+            refill_fewshots = await run_in_threadpool(select_fewshots) if FEWSHOT_SAMPLING != "stable" else fewshots
+            dropped = await stream(_build_prompt(req, refill_fewshots or fewshots, missing), False)
+        markdown_list = await asyncio.gather(*formatting)
+    finally:
+        # client disconnected or generation failed: stop formatting
+        for task in formatting:
+            task.cancel()
+    if DEDUP_MODE != "off" and not chunk_failed(kept):
+        await run_in_threadpool(near_duplicates.remember, kept)
+    return kept, markdown_list
+
+async def _questions_for(req: QuestionRequest, fewshots, select_fewshots, emit=None):
+    """
+    (generated, markdown_list, from_pool): pooled questions when available, else the LLM.
+    With `emit` (streaming), `await emit(index, item, markdown)` is called per item as
+    soon as it is ready and the LLM reply is streamed (see _stream_items).
+    """
+    pooled = None if req.regenerate else question_pool.take(pool_key(req.model_dump()), req.num_questions)
+    if pooled:
+        if emit is not None:
+            for index, (item, md) in enumerate(pooled):
+                await emit(index, item, md)
+        return [q for q, _ in pooled], [md for _, md in pooled], True
+    if emit is not None:
+        generated, markdown_list = await _stream_items(req, fewshots, select_fewshots, emit)
+    else:
+        generated, markdown_list = await _generate_items(req, fewshots, select_fewshots)
+    return generated, markdown_list, False
+
+async def _fill_pool(fields, count):
+    """Question pool refill: run the /generate pipeline for one combination."""
+    req = QuestionRequest(**fields, num_questions=count, regenerate=True)
+    _, select_fewshots, _, _ = _resolve_request(req)
+    fewshots = await run_in_threadpool(select_fewshots)
+    if not fewshots:
+        return []
+    generated, markdown_list = await _generate_items(req, fewshots, select_fewshots)
+    if chunk_failed(generated):
+        return []
+    return list(zip(generated, markdown_list))
+
+def _validate_count(req: QuestionRequest):
+    if req.num_questions < 1 or req.num_questions > 40:
+        raise HTTPException(status_code=400, detail="num_questions must be between 1 and 40")
 
-        safe_chapter = _safe_filename(req.chapter_name)
-        safe_qtype = _safe_filename(req.question_type)
+async def _run_generation(req: QuestionRequest, set_stage=None):
+    """
+    The /generate pipeline: few-shots -> prompt -> LLM -> markdown -> Excel.
+    `set_stage(name)` is called as it progresses (used by background jobs).
+    """
+    set_stage = set_stage or (lambda stage: None)
+    flow, select_fewshots, out_stem, empty = _resolve_request(req)
+    set_stage("fewshots")
+    fewshots = await _load_fewshots(select_fewshots)
+
+    print(f"[generate:{flow}] subject={req.subject}, num_questions={req.num_questions}, chapter='{req.chapter_num or req.chapter_name}', topic='{req.topic}', qtype='{req.question_type}', difficulty='{req.difficulty}'")
+    print(f"[generate:{flow}] fewshots found: {len(fewshots)} examples")
+    if flow != "SCIENCE":
+        print(f"[generate] using_fallback={any(fs['difficulty'].lower() != req.difficulty.lower() for fs in fewshots)}")
+
+    if not fewshots:
+        return {"error": empty}
+
+    set_stage("generating")
+    generated, markdown_list, from_pool = await _questions_for(req, fewshots, select_fewshots)
+
+    # Store the set; it is rendered to .xlsx (or CSV/JSON/Markdown) on download
+    set_stage("saving")
+    export = await run_in_threadpool(export_store.save, markdown_list, f"{out_stem}_{len(markdown_list)}")
+
+    return {
+        "generated_questions": generated,
+        "output_file": export["output_file"],
+        "downloads": export["downloads"],
+        "fewshots_used": len(fewshots),
+        "fewshots_preview": fewshots[:5],
+        "from_pool": from_pool
+    }
 
-        out_file_md = Path("outputs") / f"{req.subject}_{safe_chapter}_{safe_qtype}_{req.difficulty}_{len(markdown_list)}.xlsx"
-        save_markdown_as_excel(markdown_list, out_file_md)
+@app.post("/generate")
+async def generate_questions(req: QuestionRequest):
+    # Validate inputs
+    _validate_count(req)
+    return await _run_generation(req)
+
+
+BATCH_MAX_SPECS = int(os.getenv("BATCH_MAX_SPECS", "30"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "400"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+class BatchRequest(BaseModel):
+    # one worksheet section per spec; num_questions is the count for that section
+    specs: List[QuestionRequest]
+    title: Optional[str] = "Worksheet"
+
+def _sheet_name(index: int, req: QuestionRequest, used: set) -> str:
+    """Excel sheet title: at most 31 chars, no []:*?/\\ and unique within the workbook."""
+    base = re.sub(r"[\[\]\:\*\?\/\\]", "", f"{index + 1} {req.topic or req.chapter_name or req.chapter_num} {req.difficulty}")
+    name = base[:31].strip()
+    n = 2
+    while name.lower() in used:
+        suffix = f" ({n})"
+        name = base[:31 - len(suffix)].strip() + suffix
+        n += 1
+    used.add(name.lower())
+    return name
+
+@app.post("/generate/batch")
+async def generate_batch(batch: BatchRequest):
+    """
+    Generate a whole worksheet in one request: every spec is resolved and its few-shots
+    selected in a single pass, the LLM calls run concurrently (at most
+    BATCH_LLM_CONCURRENCY at a time) and the results land in one workbook, one sheet per spec.
+    A spec that fails is reported in its entry and left out of the workbook.
+    """
+    specs = batch.specs
+    if not specs or len(specs) > BATCH_MAX_SPECS:
+        raise HTTPException(status_code=400, detail=f"specs must contain 1 to {BATCH_MAX_SPECS} entries")
+    for req in specs:
+        _validate_count(req)
+    if sum(req.num_questions for req in specs) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"a batch may request at most {BATCH_MAX_QUESTIONS} questions")
+    resolved = [_resolve_request(req) for req in specs]
+
+    def select_all():
+        # one threadpool hop; the workbooks and few-shot indexes are cached after the first spec
+        results = []
+        for _, select_fewshots, _, _ in resolved:
+            try:
+                results.append(select_fewshots())
+            except (FileNotFoundError, KeyError) as e:
+                results.append(e)
+        return results
 
-        return {
-            "generated_questions": generated,
-            "output_file": str(out_file_md),
-            "fewshots_used": len(fewshots),
-            "fewshots_preview": fewshots[:5]
-        }
+    fewshot_sets = await run_in_threadpool(select_all)
+    print(f"[generate/batch] {len(specs)} specs, {sum(req.num_questions for req in specs)} questions")
 
-    # Invalid curriculum
-    else:
-        raise HTTPException(status_code=400, detail="Invalid curriculum type")
+    # caps this request's LLM calls; the tasks spawned by gather inherit the limit
+    limit_llm_concurrency(BATCH_LLM_CONCURRENCY)
 
+    async def run_spec(req, resolved_spec, fewshots):
+        _, select_fewshots, _, empty = resolved_spec
+        if isinstance(fewshots, Exception):
+            raise fewshots
+        if not fewshots:
+            raise ValueError(empty)
+        generated, markdown_list, _ = await _questions_for(req, fewshots, select_fewshots)
+        return generated, markdown_list
+
+    outcomes = await asyncio.gather(
+        *(run_spec(req, r, fs) for req, r, fs in zip(specs, resolved, fewshot_sets)),
+        return_exceptions=True
+    )
+
+    sheets, entries, used = {}, [], set()
+    for i, (req, outcome) in enumerate(zip(specs, outcomes)):
+        entry = {"spec": req.model_dump(exclude_none=True)}
+        if isinstance(outcome, Exception):
+            entry["error"] = str(outcome)
+        else:
+            generated, markdown_list = outcome
+            entry["sheet"] = _sheet_name(i, req, used)
+            entry["generated_questions"] = generated
+            sheets[entry["sheet"]] = markdown_list
+        entries.append(entry)
+
+    if not sheets:
+        return {"error": "No spec produced any questions", "results": entries}
+
+    total = sum(len(items) for items in sheets.values())
+    stem = f"{_safe_filename(batch.title) or 'Worksheet'}_{len(sheets)}sheets_{total}"
+    export = await run_in_threadpool(export_store.save, sheets, stem)
+    return {"output_file": export["output_file"], "downloads": export["downloads"], "results": entries}
+
+
+
+EXPORT_CHUNK = 64 * 1024
+
+@app.get("/exports/{export_id}/{filename}")
+async def download_export(export_id: str, filename: str):
+    """Stream a stored question set as .xlsx, .csv, .json or .md (picked by the extension)."""
+    stem, _, fmt = filename.rpartition(".")
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, use one of {list(MEDIA_TYPES)}")
+    data = await run_in_threadpool(export_store.load, export_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Export not found or expired")
+    buf = await run_in_threadpool(render, data, fmt)
+    return StreamingResponse(iter(lambda: buf.read(EXPORT_CHUNK), b""), media_type=MEDIA_TYPES[fmt], headers={
+        "Content-Disposition": f'attachment; filename="{download_name(stem)}.{fmt}"',
+        # content-addressed: the same URL always serves the same bytes
+        "Cache-Control": "private, max-age=86400, immutable",
+    })
+
+
+class JobRequest(QuestionRequest):
+    priority: str = "normal"   # "high", "normal" or "low"
+
+async def _run_job(request: dict, set_stage):
+    result = await _run_generation(QuestionRequest(**request), set_stage)
+    if "error" in result:
+        raise ValueError(result["error"])
+    return result
+
+def _job_view(job):
+    return {
+        "job_id": job["id"],
+        "status": job["status"],       # queued, running, done, failed or cancelled
+        "stage": job["stage"],         # while running: fewshots, generating or saving
+        "priority": job["priority"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+@app.post("/jobs", status_code=202)
+def submit_job(req: JobRequest):
+    """Queue a /generate request; poll GET /jobs/{job_id} for progress and the result."""
+    _validate_count(req)
+    _resolve_request(req)  # reject invalid requests up front
+    try:
+        job_id = job_queue.submit(req.model_dump(exclude={"priority"}), req.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return _job_view(job)
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    if job["status"] != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return _job_view(job)
+
+
+@app.get("/admin/llm_cache")
+def llm_cache_stats():
+    """Hit/miss/eviction counters of the LLM response caches."""
+    return cache_stats()
+
+@app.get("/admin/llm_gateway")
+def llm_gateway_stats():
+    """Circuit breaker state, configured rate limits and token usage (incl. cached prompt tokens)."""
+    return gateway_stats()
+
+@app.get("/admin/question_pool")
+def question_pool_stats():
+    """Size and hit counters of the pre-generated question pool."""
+    return question_pool.stats()
+
+def _pipeline_counters():
+    """Token usage, cache, pool, dedup and frame cache counters for /metrics."""
+    usage = gateway_stats()["usage"]
+    caches = cache_stats()
+    pool = question_pool.stats()
+    dedup = near_duplicates.stats()
+    frames = frame_cache.stats()
+    return [
+        ("qgen_llm_calls_total", "counter", "Completed LLM calls.",
+         [({"model": m}, u["calls"]) for m, u in usage.items()]),
+        ("qgen_llm_tokens_total", "counter", "LLM tokens by kind (cached is part of prompt).",
+         [({"model": m, "kind": kind}, u[f"{kind}_tokens"]) for m, u in usage.items()
+          for kind in ("prompt", "cached", "completion")]),
+        ("qgen_llm_cache_lookups_total", "counter", "LLM response cache lookups by result.",
+         [({"cache": name, "result": result}, stats[key]) for name, stats in caches.items()
+          for result, key in (("hit", "hits"), ("disk_hit", "disk_hits"), ("miss", "misses"))]),
+        ("qgen_llm_cache_entries", "gauge", "Entries held in memory by the LLM response cache.",
+         [({"cache": name}, stats["entries"]) for name, stats in caches.items()]),
+        ("qgen_question_pool_requests_total", "counter", "Question pool lookups by result.",
+         [({"result": "hit"}, pool["hits"]), ({"result": "miss"}, pool["misses"])]),
+        ("qgen_question_pool_questions", "gauge", "Questions currently pooled.", [({}, pool["pooled_questions"])]),
+        ("qgen_dedup_checked_total", "counter", "Generated questions checked for near-duplicates.", [({}, dedup["checked"])]),
+        ("qgen_dedup_near_duplicates_total", "counter", "Near-duplicates found.", [({}, dedup["near_duplicates"])]),
+        ("qgen_frame_cache_lookups_total", "counter", "Curated frame cache lookups by result.",
+         [({"result": result}, frames[key]) for result, key in
+          (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"))]),
+        ("qgen_frame_cache_evictions_total", "counter", "Curated frames evicted (LRU) or replaced after a workbook changed.",
+         [({"reason": "lru"}, frames["evictions"]), ({"reason": "stale"}, frames["stale_replaced"])]),
+        ("qgen_frame_cache_bytes", "gauge", "Size of the cached curated frames.", [({}, frames["bytes"])]),
+        ("qgen_frame_cache_entries", "gauge", "Curated frames cached.", [({}, frames["entries"])]),
+    ]
+
+register_collector(_pipeline_counters)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition: stage/request latency histograms and pipeline counters."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/dedup")
+def dedup_stats():
+    """Near-duplicate index size and filter counters."""
+    return near_duplicates.stats()
+
+@app.get("/admin/watcher")
+def watcher_stats():
+    """Backend, reload count and last reload of the curated_excels watcher."""
+    return curated_watcher.stats()
+
+@app.get("/admin/frame_cache")
+def frame_cache_stats():
+    """Size, hit/eviction counters and cached frames of the curated DataFrame cache."""
+    return frame_cache.stats()
+
+
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/generate/stream")
+async def generate_questions_stream(req: QuestionRequest):
+    """
+    Streaming variant of /generate (text/event-stream): the LLM reply is streamed and
+    parsed as it arrives; the question pool, response cache and near-duplicate filter
+    apply as for /generate (chunk_size does not, one streamed reply is enough). Events:
+      meta     {"fewshots_used", "fewshots_preview"}            once, before generation
+      question {"index", "question", "answer",
+                "question_markdown", "answer_markdown"}         per item, as soon as it is formatted
+      done     {"output_file", "downloads", "count",
+                "from_pool"}                                    after the set is stored
+      error    {"detail"}                                       if generation fails midway
+    """
+    _validate_count(req)
+
+    flow, select_fewshots, out_stem, empty = _resolve_request(req)
+    fewshots = await _load_fewshots(select_fewshots)
+    print(f"[generate/stream:{flow}] subject={req.subject}, num_questions={req.num_questions}, topic='{req.topic}', fewshots={len(fewshots)}")
+    if not fewshots:
+        return {"error": empty}
+
+    async def events():
+        queue = asyncio.Queue()
+
+        async def emit(index, item, md):
+            await queue.put(("question", {
+                "index": index,
+                "question": item.get("question", ""),
+                "answer": item.get("answer", ""),
+                "question_markdown": md.get("question_markdown", item.get("question", "")),
+                "answer_markdown": md.get("answer_markdown", item.get("answer", "")),
+            }))
+
+        async def produce():
+            try:
+                _, markdown_list, from_pool = await _questions_for(req, fewshots, select_fewshots, emit)
+                export = await run_in_threadpool(export_store.save, markdown_list, f"{out_stem}_{len(markdown_list)}")
+                await queue.put(("done", {"output_file": export["output_file"], "downloads": export["downloads"],
+                                          "count": len(markdown_list), "from_pool": from_pool}))
+            except Exception as e:
+                print(f"[generate/stream] failed: {e}")
+                await queue.put(("error", {"detail": str(e)}))
+            finally:
+                await queue.put(None)
+
+        yield _sse("meta", {"fewshots_used": len(fewshots), "fewshots_preview": fewshots[:5]})
+        producer = asyncio.create_task(produce())
+        try:
+            while (msg := await queue.get()) is not None:
+                yield _sse(*msg)
+        finally:
+            # client disconnected: stop generating
+            if not producer.done():
+                producer.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
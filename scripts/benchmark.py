@@ -0,0 +1,358 @@
+# scripts/benchmark.py
+"""
+Offline benchmarks for the generation pipeline (no OpenAI calls).
+
+micro  times the pipeline stages on the real curated_excels/ files:
+       load_excel, load_science_excel (cache_cleared = frame_cache emptied first, so
+       the frame is mapped from compiled_corpus/ again; and warm),
+       _select_fewshots_from_df, _select_fewshots_science, build_generation_prompt,
+       the semantic fallback for misspelled topics (semantic_nearest, semantic_mmr;
+       target < 5 ms), save_markdown_as_excel and the export renderer
+load   starts scripts/fake_openai_server.py and the app (uvicorn) on free local
+       ports, then sends a concurrent mix of /generate requests drawn from the
+       static_data catalogs, measuring latency percentiles, RPS and the app's RSS
+
+    python scripts/benchmark.py                                  # both, writes benchmark_results.json
+    python scripts/benchmark.py --only micro
+    python scripts/benchmark.py --requests 300 --concurrency 16 --token-rate 80 --malformed-rate 0.05
+    python scripts/benchmark.py --save-baseline scripts/golden/benchmark_baseline.json
+    python scripts/benchmark.py --baseline scripts/golden/benchmark_baseline.json --tolerance 0.2
+
+With --baseline, every latency/RSS metric that got worse (or RPS that dropped) by
+more than --tolerance is reported and the exit status is 1. Baselines depend on the
+machine, so record them where the comparison runs. Run from the repository root.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "utils"))
+# the LLM modules build their OpenAI clients at import; nothing here calls the real API
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import fewshot
+from catalog import CatalogRegistry
+from exporter import render
+from frame_cache import frame_cache
+from markdown_builder import save_markdown_as_excel
+from prompt_builder import build_generation_prompt
+from question_pool import iter_combinations
+from semantic_index import SemanticIndex, build_vectors, write_index
+
+QUESTION_COUNTS = (5, 10, 20)
+QUESTION_COUNT_WEIGHTS = (0.5, 0.35, 0.15)
+
+
+def summarize(durations):
+    """Percentiles in milliseconds of a list of durations in seconds."""
+    ms = np.asarray(durations, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"runs": 0}
+    return {
+        "runs": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def _measure(fn, cases, repeat, setup=None):
+    durations = []
+    for _ in range(repeat):
+        for case in cases:
+            if setup:
+                setup()
+            start = time.perf_counter()
+            fn(*case)
+            durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def _clear_frame_cache():
+    frame_cache.clear()
+
+
+def _snapshot():
+    return CatalogRegistry(ROOT / "static_data").load()
+
+
+def run_micro(repeat: int):
+    os.chdir(ROOT)
+    snap = _snapshot()
+    gcse = [(int(ch), topic, difficulty) for ch, topics in sorted(snap.math_gcse.items())
+            for topic in topics[:3] for difficulty in ("Easy", "Hard")
+            if (ROOT / "curated_excels" / "Math" / f"Math Chapter {ch}.xlsx").exists()]
+    science = [(subject.capitalize(), chapter, qtypes[0], topics[0])
+               for (subject, curriculum), entry in sorted(snap.science.items()) if curriculum == "gcse"
+               for chapter, topics, qtypes in entry["by_chapter"].values() if topics and qtypes]
+    chapters = sorted({(ch,) for ch, _, _ in gcse})
+    science_chapters = [(s, ch) for s, ch, _, _ in science]
+
+    results = {
+        "load_excel_cache_cleared": _measure(fewshot.load_excel, chapters, repeat, setup=_clear_frame_cache),
+        "load_excel": _measure(fewshot.load_excel, chapters, repeat),
+        "load_science_excel_cache_cleared": _measure(fewshot.load_science_excel, science_chapters, repeat,
+                                                     setup=_clear_frame_cache),
+        "load_science_excel": _measure(fewshot.load_science_excel, science_chapters, repeat),
+    }
+    results["_select_fewshots_from_df"] = _measure(
+        lambda ch, topic, difficulty: fewshot._select_fewshots_from_df(fewshot.load_excel(ch), topic, difficulty),
+        gcse, repeat)
+    results["_select_fewshots_science"] = _measure(
+        lambda subject, chapter, qtype, topic: fewshot._select_fewshots_science(
+            fewshot.load_science_excel(subject, chapter), qtype, topic),
+        science, repeat)
+
+    prompts = [("Math", "GCSE", topic, None, difficulty, fewshot.get_fewshot_examples(ch, topic, difficulty), 10)
+               for ch, topic, difficulty in gcse]
+    prompts += [(subject, "GCSE", topic, qtype, "Medium",
+                 fewshot.get_fewshot_examples_science(subject, chapter, qtype, topic), 10)
+                for subject, chapter, qtype, topic in science]
+    results["build_generation_prompt"] = _measure(build_generation_prompt, prompts, repeat)
+
+    # semantic fallback: topics misspelled by a doubled last letter, index built into a temp dir
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SemanticIndex(Path(tmp))
+        write_index(*build_vectors([df for _, _, df in fewshot.iter_corpus_frames() if "Question" in df.columns]),
+                    directory=Path(tmp))
+        misspelled = [(fewshot.load_excel(ch), topic + topic[-1]) for ch, topic, _ in gcse]
+        results["semantic_nearest"] = _measure(index.nearest, misspelled, repeat)
+        results["semantic_mmr"] = _measure(lambda df, query: index.mmr(df, query, index.nearest(df, query)[0], 10),
+                                           misspelled, repeat)
+
+    items = [{"question_markdown": f"Solve $x^{{2}} + {i}x + {i * 2} = 0$ for $x$.",
+              "answer_markdown": f"$x = -{i}$"} for i in range(40)]
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp) / "bench.xlsx"
+        results["save_markdown_as_excel"] = _measure(save_markdown_as_excel, [(items, out)], repeat * 5)
+    for fmt in ("xlsx", "csv"):
+        results[f"render_export_{fmt}"] = _measure(render, [(items, fmt)], repeat * 5)
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb(pid: int, field: str = "VmRSS"):
+    """Resident memory of a process from /proc (Linux); None elsewhere."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith(field + ":"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+async def _wait_ready(client, url: str, proc, timeout: float = 60):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with status {proc.returncode}")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready in {timeout}s")
+
+
+def request_mix(n: int, seed: int, use_cache: bool):
+    """n /generate bodies sampled from the catalog combinations (same seed -> same mix)."""
+    combos = list(iter_combinations(_snapshot()))
+    rng = random.Random(seed)
+    bodies = []
+    for _ in range(n):
+        body = dict(rng.choice(combos))
+        body["num_questions"] = rng.choices(QUESTION_COUNTS, QUESTION_COUNT_WEIGHTS)[0]
+        body["regenerate"] = not use_cache
+        bodies.append(body)
+    return bodies
+
+
+async def _drive(client, base_url: str, bodies, concurrency: int, app_pid: int):
+    latencies, statuses = [], {}
+    rss_peak = 0.0
+    pending = iter(bodies)
+
+    async def worker():
+        for body in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{base_url}/generate", json=body)
+                status = str(response.status_code)
+                if response.status_code == 200 and "error" in response.json():
+                    status = "200-error"
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    async def sample_rss():
+        nonlocal rss_peak
+        while True:
+            rss_peak = max(rss_peak, _rss_mb(app_pid) or 0.0)
+            await asyncio.sleep(0.2)
+
+    sampler = asyncio.create_task(sample_rss())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+    return latencies, statuses, elapsed, rss_peak
+
+
+async def run_load(args):
+    import httpx
+
+    fake_port, app_port = _free_port(), _free_port()
+    tmp = Path(tempfile.mkdtemp(prefix="qgen-bench-"))
+    fake_cmd = [sys.executable, str(ROOT / "scripts" / "fake_openai_server.py"), "--port", str(fake_port),
+                "--latency", str(args.latency), "--token-rate", str(args.token_rate),
+                "--malformed-rate", str(args.malformed_rate)]
+    env = {**os.environ,
+           "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT / "utils"), os.environ.get("PYTHONPATH")])),
+           "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1", "OPENAI_API_KEY": "benchmark",
+           "JOBS_DB": str(tmp / "jobs.sqlite"), "EXPORT_DIR": str(tmp / "exports"),
+           "DEDUP_HISTORY": str(tmp / "dedup_history.jsonl"), "LLM_CACHE_SQLITE": ""}
+    app_cmd = [sys.executable, "-m", "uvicorn", "app:app", "--port", str(app_port), "--log-level", "warning"]
+    log = open(tmp / "app.log", "w")
+    fake = subprocess.Popen(fake_cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    app = subprocess.Popen(app_cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        async with httpx.AsyncClient(timeout=args.timeout,
+                                     limits=httpx.Limits(max_connections=args.concurrency * 2)) as client:
+            await _wait_ready(client, f"http://127.0.0.1:{fake_port}/stats", fake)
+            await _wait_ready(client, f"{base_url}/metrics", app)
+            rss_idle = _rss_mb(app.pid)
+            # warm-up: first frame loads and the dedup index build are not part of the measurement
+            await _drive(client, base_url, request_mix(args.concurrency, args.seed + 1, True), args.concurrency, app.pid)
+            latencies, statuses, elapsed, rss_peak = await _drive(
+                client, base_url, request_mix(args.requests, args.seed, args.use_cache), args.concurrency, app.pid)
+            upstream = (await client.get(f"http://127.0.0.1:{fake_port}/stats")).json()
+    finally:
+        for proc in (app, fake):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        log.close()
+    print(f"[benchmark] app log: {tmp / 'app.log'}")
+    return {
+        "config": {"requests": args.requests, "concurrency": args.concurrency, "latency": args.latency,
+                   "token_rate": args.token_rate, "malformed_rate": args.malformed_rate,
+                   "use_cache": args.use_cache, "seed": args.seed},
+        **summarize(latencies),
+        "rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "statuses": statuses,
+        "rss_idle_mb": rss_idle,
+        "rss_peak_mb": rss_peak or None,
+        "upstream": upstream,
+    }
+
+
+# metric -> True when higher is better
+COMPARED = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "rps": True, "rss_peak_mb": False}
+
+
+def compare(results, baseline, tolerance: float, min_delta_ms: float = 1.0):
+    """
+    Print metric changes against `baseline`; return the regressions beyond `tolerance`.
+    Latency changes smaller than `min_delta_ms` are timer noise and never count.
+    """
+    regressions = []
+    rows = [(f"micro.{name}", stats, baseline.get("micro", {}).get(name, {}))
+            for name, stats in results.get("micro", {}).items()]
+    if "load" in results:
+        rows.append(("load", results["load"], baseline.get("load", {})))
+    for name, current, base in rows:
+        for metric, higher_better in COMPARED.items():
+            new, old = current.get(metric), base.get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_better else change
+            noise = metric.endswith("_ms") and abs(new - old) < min_delta_ms
+            flag = "REGRESSION" if worse > tolerance and not noise else ""
+            print(f"{name:40s} {metric:12s} {old:>10.2f} -> {new:>10.2f} ({change:+.1%}) {flag}")
+            if flag:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", choices=("micro", "load"), help="run one suite only")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--save-baseline", help="also write the results to this path")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown (default 0.2)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore latency changes below this")
+    parser.add_argument("--repeat", type=int, default=5, help="micro: passes over the cases")
+    parser.add_argument("--requests", type=int, default=100, help="load: measured /generate requests")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="fake LLM: seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="fake LLM: completion tokens per second")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fake LLM: share of truncated replies")
+    parser.add_argument("--use-cache", action="store_true", help="load: allow LLM cache / question pool hits")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {"meta": {"commit": _git_commit(), "python": platform.python_version(), "machine": platform.machine(),
+                        "cpus": os.cpu_count(), "started_at": time.strftime("%Y-%m-%dT%H:%M:%S")}}
+    if args.only in (None, "micro"):
+        print("[benchmark] micro ...")
+        results["micro"] = run_micro(args.repeat)
+    if args.only in (None, "load"):
+        print(f"[benchmark] load: {args.requests} requests, concurrency {args.concurrency} ...")
+        results["load"] = asyncio.run(run_load(args))
+
+    text = json.dumps(results, indent=2)
+    Path(args.output).write_text(text, encoding="utf-8")
+    print(f"[benchmark] results -> {args.output}")
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(text, encoding="utf-8")
+        print(f"[benchmark] baseline -> {args.save_baseline}")
+    if "load" in results:
+        load = results["load"]
+        print(f"[benchmark] load: p50={load.get('p50_ms')}ms p95={load.get('p95_ms')}ms p99={load.get('p99_ms')}ms "
+              f"rps={load['rps']} rss_peak={load['rss_peak_mb']}MB statuses={load['statuses']}")
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance,
+                              args.min_delta_ms)
+        if regressions:
+            print(f"[benchmark] {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+# scripts/build_catalog.py
+"""
+Rebuild the static_data topic catalogs from curated_excels/ (all subjects).
+
+    python scripts/build_catalog.py            # re-parse only workbooks that changed
+    python scripts/build_catalog.py --force    # re-parse everything
+
+Run from the repository root. See utils/catalog_builder.py for the outputs.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "utils"))
+
+from catalog_builder import build_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and parse every workbook")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+    stats = build_catalog(workers=args.workers, force=args.force)
+    sys.exit(1 if stats["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# scripts/build_semantic_index.py
+"""
+Embed every curated question into the local semantic index (utils/semantic_index.py):
+compiled_corpus/semantic/vectors.npy + index.json. Frames are read the same way the
+server reads them (compiled corpus when fresh, else the workbook), so the row positions
+line up with the DataFrames few-shots are selected from.
+
+Run from the repository root after editing curated_excels/ (and after
+generate_fewshot_corpus.py, which makes this faster):
+    python scripts/build_semantic_index.py
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "utils"))
+
+from fewshot import iter_corpus_frames
+from semantic_index import SEMANTIC_DIR, build_vectors, write_index
+
+def main():
+    start = time.perf_counter()
+    frames = []
+    for path, sheet, df in iter_corpus_frames():
+        if "Question" not in df.columns:
+            print(f"{path} [{sheet}]: no Question column, skipped")
+            continue
+        frames.append(df)
+    matrix, idf, blocks = build_vectors(frames)
+    write_index(matrix, idf, blocks)
+    print(f"Indexed {matrix.shape[0]} questions from {len(blocks)} frame(s) into {SEMANTIC_DIR} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
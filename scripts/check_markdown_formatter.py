@@ -0,0 +1,95 @@
+# scripts/check_markdown_formatter.py
+"""
+Golden-file check for the local markdown formatter (utils/math_formatter.py).
+
+The corpus holds plain-text (not yet $-wrapped) Question and Answer cells from the
+curated Excel files, plus a few hand-written cases. Every entry was reviewed by
+hand: "markdown" is the expected output for the inputs the formatter must handle
+itself ("confident": true); entries with "confident": false must be reported as
+unsure, so MARKDOWN_MODE=local-with-llm-fallback sends them to the LLM.
+
+    python scripts/check_markdown_formatter.py               # compare against the golden file
+    python scripts/check_markdown_formatter.py --candidates  # print unreviewed curated inputs
+
+--candidates only prints the formatter's output for curated cells that are not in
+the golden file yet; review them before adding them by hand. The same check runs
+as tests/test_markdown_formatter.py.
+
+Exits with status 1 when any entry differs.
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "utils"))
+
+from corpus import CURATED_DIR
+from fewshot import _read_excel_cached
+from math_formatter import format_text
+
+GOLDEN_FILE = Path(__file__).resolve().parent / "golden" / "markdown_formatter.json"
+PER_WORKBOOK = 25
+
+
+def load_golden():
+    return json.loads(GOLDEN_FILE.read_text(encoding="utf-8"))
+
+
+def check_entry(entry):
+    """None if the formatter agrees with the reviewed entry, else (markdown, confident) it produced."""
+    markdown, confident = format_text(entry["input"])
+    if entry["confident"]:
+        ok = confident and markdown == entry["markdown"]
+    else:
+        ok = not confident
+    return None if ok else (markdown, confident)
+
+
+def collect_inputs(limit=PER_WORKBOOK):
+    inputs = []
+    seen = set()
+    for path in sorted(CURATED_DIR.glob("*/*.xlsx")):
+        if path.name.startswith("~$"):
+            continue
+        df = _read_excel_cached(path)
+        cells = []
+        for col in ("Answer", "Question"):
+            if col in df.columns:
+                cells += [str(v).strip() for v in df[col].dropna()]
+        taken = 0
+        for text in cells:
+            if not text or "$" in text or text in seen:
+                continue
+            seen.add(text)
+            inputs.append({"source": f"{path.parent.name}/{path.name}", "input": text})
+            taken += 1
+            if taken >= limit:
+                break
+    return inputs
+
+
+def main(candidates: bool = False):
+    entries = load_golden()
+    if candidates:
+        known = {entry["input"] for entry in entries}
+        for entry in collect_inputs():
+            if entry["input"] not in known:
+                markdown, confident = format_text(entry["input"])
+                print(json.dumps({**entry, "markdown": markdown if confident else None, "confident": confident},
+                                 ensure_ascii=False))
+        return 0
+
+    failures = 0
+    for entry in entries:
+        got = check_entry(entry)
+        if got is not None:
+            failures += 1
+            print(f"✗ {entry['source']}: {entry['input']!r}")
+            print(f"    expected: {entry['markdown']!r} (confident={entry['confident']})")
+            print(f"    got:      {got[0]!r} (confident={got[1]})")
+    print(f"{len(entries) - failures}/{len(entries)} golden entries match")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(candidates="--candidates" in sys.argv[1:]))
@@ -0,0 +1,108 @@
+# scripts/fake_openai_server.py
+"""
+Local stand-in for the OpenAI chat completions API, for exercising the LLM gateway
+(rate limiting, retries, circuit breaker) and the app without spending tokens.
+
+    python scripts/fake_openai_server.py --port 8998 --rate-limit-rate 0.2 --latency 0.3
+    OPENAI_BASE_URL=http://127.0.0.1:8998/v1 OPENAI_API_KEY=x uvicorn app:app
+
+Generation prompts ("generate N NEW ...") get N synthetic question/answer pairs;
+markdown prompts get their items echoed back with the answer wrapped in $...$.
+Streaming (stream=true) is supported. Each reply takes --latency seconds plus its
+completion tokens at --token-rate tokens/second (0 = instant). Failures are
+injected at random:
+    --rate-limit-rate   share of calls answered 429 with Retry-After
+    --error-rate        share of calls answered 500
+    --malformed-rate    share of replies cut off halfway (invalid JSON)
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake OpenAI")
+config = argparse.Namespace(latency=0.2, token_rate=0.0, rate_limit_rate=0.0, error_rate=0.0,
+                            malformed_rate=0.0, retry_after=1.0)
+stats = {"calls": 0, "rate_limited": 0, "errors": 0, "malformed": 0, "completion_tokens": 0}
+
+
+def _reply(prompt: str) -> str:
+    if "formatting engine" in prompt:
+        items = json.loads(prompt.split("question-answer pairs:")[1].split("Your task:")[0])
+        return json.dumps([{"question_markdown": item.get("question", ""),
+                            "answer_markdown": f"${item.get('answer', '')}$"} for item in items])
+    match = re.search(r"generate (\d+) NEW", prompt)
+    count = int(match.group(1)) if match else 3
+    return json.dumps([{"question": f"Compute {random.randint(1, 10 ** 6)} + x^2 (item {i + 1})",
+                        "answer": str(i + 1)} for i in range(count)])
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["calls"] += 1
+    roll = random.random()
+    if roll < config.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return JSONResponse(status_code=429, headers={"retry-after": str(config.retry_after)},
+                            content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+    if roll < config.rate_limit_rate + config.error_rate:
+        stats["errors"] += 1
+        return JSONResponse(status_code=500, content={"error": {"message": "Injected failure", "type": "server_error"}})
+
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    content = _reply(prompt)
+    if random.random() < config.malformed_rate:
+        stats["malformed"] += 1
+        content = content[:len(content) // 2]
+    stats["completion_tokens"] += len(content) // 4
+    duration = config.latency + (len(content) / 4 / config.token_rate if config.token_rate > 0 else 0)
+    usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+             "total_tokens": (len(prompt) + len(content)) // 4, "prompt_tokens_details": {"cached_tokens": 0}}
+
+    if body.get("stream"):
+        async def chunks():
+            step = max(1, len(content) // 20)
+            for i in range(0, len(content), step):
+                await asyncio.sleep(duration * step / max(1, len(content)))
+                chunk = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    await asyncio.sleep(duration)
+    return {"id": "fake", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage}
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8998)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per completion before any token")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="completion tokens per second (0 = instant)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    args = parser.parse_args()
+    for name in ("latency", "token_rate", "rate_limit_rate", "error_rate", "malformed_rate", "retry_after"):
+        setattr(config, name, getattr(args, name))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+# scripts/fetch_tokenizer.py
+"""
+Download the tiktoken BPE file used for prompt token counts into tokenizer/ (or
+PROMPT_TOKENIZER_DIR), where utils/prompt_builder.py loads it from. Commit the file:
+the server never downloads it at runtime.
+
+    python scripts/fetch_tokenizer.py                 # PROMPT_TOKENIZER (default o200k_base)
+    python scripts/fetch_tokenizer.py cl100k_base
+
+Run from the repository root. tiktoken checks the file against its pinned hash.
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "utils"))
+
+from prompt_builder import PROMPT_TOKENIZER, PROMPT_TOKENIZER_DIR, bpe_path
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else PROMPT_TOKENIZER
+    PROMPT_TOKENIZER_DIR.mkdir(parents=True, exist_ok=True)
+    os.environ["TIKTOKEN_CACHE_DIR"] = str(PROMPT_TOKENIZER_DIR)
+    import tiktoken
+
+    enc = tiktoken.get_encoding(name)
+    print(f"{name}: {enc.n_vocab} tokens, stored in {bpe_path(name)}")
+
+
+if __name__ == "__main__":
+    main()
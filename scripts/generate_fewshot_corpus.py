@@ -0,0 +1,36 @@
+# scripts/generate_fewshot_corpus.py
+"""
+Compile every workbook under curated_excels/ into the binary few-shot corpus
+(compiled_corpus/, Arrow IPC files) read by utils/fewshot.py.
+
+Math workbooks are compiled per sheet (plus the first sheet as the default frame used
+by load_excel); Physics/Chemistry workbooks are compiled as the combined, header-detected
+frame returned by load_science_excel. Workbooks whose compiled copy is newer than the
+source are skipped unless --force is given.
+
+Run from the repository root:
+    python scripts/generate_fewshot_corpus.py [--force]
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "utils"))
+
+from fewshot import compile_workbook, corpus_workbooks
+
+
+def main(force: bool = False):
+    total = 0
+    for path, _ in corpus_workbooks():
+        try:
+            n = compile_workbook(path, force=force)
+        except Exception as e:
+            print(f"Error compiling {path}: {e}")
+            continue
+        total += n
+        print(f"{path}: {n} frame(s) written" if n else f"{path}: up to date")
+    print(f"Compiled {total} frame(s) into the few-shot corpus")
+
+
+if __name__ == "__main__":
+    main(force="--force" in sys.argv[1:])
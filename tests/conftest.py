@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# the server imports its modules flat from utils/ (see app.py)
+sys.path.insert(0, str(ROOT / "utils"))
+sys.path.insert(0, str(ROOT))
+# some modules build their OpenAI client at import; the tests never call the API
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,79 @@
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+spec = importlib.util.spec_from_file_location("benchmark", ROOT / "scripts" / "benchmark.py")
+benchmark = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(benchmark)
+
+BASELINE = {
+    "micro": {
+        "load_excel": {"runs": 10, "p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0},
+        "build_generation_prompt": {"runs": 10, "p50_ms": 0.2, "p95_ms": 0.4, "p99_ms": 0.5},
+    },
+    "load": {"p50_ms": 400.0, "p95_ms": 900.0, "p99_ms": 1200.0, "rps": 20.0, "rss_peak_mb": 300.0},
+}
+
+
+def _results(micro=None, load=None):
+    results = json.loads(json.dumps(BASELINE))
+    for name, stats in (micro or {}).items():
+        results["micro"][name].update(stats)
+    results["load"].update(load or {})
+    return results
+
+
+def test_unchanged_results_have_no_regressions():
+    assert benchmark.compare(_results(), BASELINE, tolerance=0.2) == []
+
+
+def test_slower_latency_beyond_tolerance_is_a_regression():
+    results = _results(micro={"load_excel": {"p95_ms": 25.0, "p99_ms": 35.0}})  # +25%, +16.7%
+    assert benchmark.compare(results, BASELINE, tolerance=0.2) == [("micro.load_excel", "p95_ms", 20.0, 25.0)]
+
+
+def test_direction_depends_on_the_metric():
+    results = _results(load={"rps": 15.0, "rss_peak_mb": 250.0, "p50_ms": 200.0})
+    assert benchmark.compare(results, BASELINE, tolerance=0.2) == [("load", "rps", 20.0, 15.0)]
+    assert benchmark.compare(_results(load={"rps": 40.0}), BASELINE, tolerance=0.2) == []
+    assert benchmark.compare(_results(load={"rss_peak_mb": 400.0}), BASELINE, tolerance=0.2) == [
+        ("load", "rss_peak_mb", 300.0, 400.0)]
+
+
+def test_latency_changes_below_min_delta_are_noise():
+    results = _results(micro={"build_generation_prompt": {"p95_ms": 0.8}})  # doubled, but +0.4 ms
+    assert benchmark.compare(results, BASELINE, tolerance=0.2) == []
+    assert benchmark.compare(results, BASELINE, tolerance=0.2, min_delta_ms=0.1) == [
+        ("micro.build_generation_prompt", "p95_ms", 0.4, 0.8)]
+
+
+def test_metrics_missing_on_either_side_are_skipped():
+    results = _results()
+    results["micro"]["semantic_nearest"] = {"runs": 10, "p95_ms": 99.0}  # not in the baseline
+    results["micro"]["load_excel"] = {"runs": 0}                         # no timings this run
+    del results["load"]
+    assert benchmark.compare(results, BASELINE, tolerance=0.2) == []
+
+
+def test_main_exits_nonzero_on_regression(tmp_path, monkeypatch):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(BASELINE), encoding="utf-8")
+    output = tmp_path / "results.json"
+    argv = ["benchmark.py", "--only", "micro", "--output", str(output), "--baseline", str(baseline)]
+    monkeypatch.setattr(benchmark, "_git_commit", lambda: None)
+
+    monkeypatch.setattr(benchmark, "run_micro", lambda repeat: BASELINE["micro"])
+    monkeypatch.setattr(sys, "argv", argv)
+    benchmark.main()
+    assert json.loads(output.read_text(encoding="utf-8"))["micro"] == BASELINE["micro"]
+
+    slower = _results(micro={"load_excel": {"p50_ms": 20.0}})["micro"]
+    monkeypatch.setattr(benchmark, "run_micro", lambda repeat: slower)
+    with pytest.raises(SystemExit) as exc:
+        benchmark.main()
+    assert exc.value.code == 1
@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+from catalog import CatalogRegistry
+from catalog_builder import build_catalog
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _write(path: Path, data, mtime):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_newer_runtime_catalog_overrides_static_data(tmp_path):
+    static, runtime = tmp_path / "static", tmp_path / "runtime"
+    _write(static / "math_topics_gcse.json", {"1": ["Static topic"]}, 1000)
+    _write(static / "math_chapters_alevel.json", ["Algebra"], 1000)
+    registry = CatalogRegistry(static_dir=static, runtime_dir=runtime, check_interval=0)
+    assert registry.snapshot().math_gcse == {"1": ["Static topic"]}
+
+    _write(runtime / "math_topics_gcse.json", {"1": ["Rebuilt topic"]}, 2000)
+    snap = registry.snapshot()
+    assert snap.math_gcse == {"1": ["Rebuilt topic"]}
+    assert snap.alevel_chapters == ["Algebra"]  # only in static_data
+
+    # static_data updated later (e.g. a deploy) wins again
+    _write(static / "math_topics_gcse.json", {"1": ["Deployed topic"]}, 3000)
+    assert registry.snapshot().math_gcse == {"1": ["Deployed topic"]}
+
+
+def test_runtime_build_starts_from_the_static_manifest(tmp_path):
+    curated, static, runtime = tmp_path / "curated", tmp_path / "static", tmp_path / "runtime"
+    (curated / "Math").mkdir(parents=True)
+    for n in (1, 2):
+        shutil.copy2(ROOT / "curated_excels" / "Math" / f"Math Chapter {n}.xlsx", curated / "Math")
+    assert build_catalog(curated, static, workers=1)["parsed"] == 2
+    before = {p.name: p.read_bytes() for p in static.iterdir()}
+
+    stats = build_catalog(curated, runtime, workers=1, seed_dir=static)
+
+    assert stats["parsed"] == 0 and stats["skipped"] == 2
+    assert {p.name: p.read_bytes() for p in static.iterdir()} == before
+    topics = json.loads((runtime / "math_topics_gcse.json").read_text(encoding="utf-8"))
+    assert set(topics) == {"1", "2"}
+
+
+def test_rebuild_keeps_hand_curated_chapters_and_drops_removed_workbooks(tmp_path):
+    curated, static = tmp_path / "curated", tmp_path / "static"
+    (curated / "Chemistry").mkdir(parents=True)
+    for name in ("Chemical analysis", "Energy changes"):
+        shutil.copy2(ROOT / "curated_excels" / "Chemistry" / f"Chemistry Chapter {name}.xlsx", curated / "Chemistry")
+    hand = {"topics": ["Atom"], "question_types": ["MCQ"]}
+    _write(static / "Chemistry_topics_gcse.json", {"Atomic Structure and Periodic Table": hand}, 1000)
+
+    build_catalog(curated, static, workers=1)
+    chem = json.loads((static / "Chemistry_topics_gcse.json").read_text(encoding="utf-8"))
+    assert list(chem) == ["Atomic Structure and Periodic Table", "Chemical analysis", "Energy changes"]
+    assert chem["Atomic Structure and Periodic Table"] == hand
+    assert " Flame Emission Spectroscopy" in chem["Chemical analysis"]["topics"]  # workbook spelling kept
+
+    (curated / "Chemistry" / "Chemistry Chapter Energy changes.xlsx").unlink()
+    build_catalog(curated, static, workers=1)
+    chem = json.loads((static / "Chemistry_topics_gcse.json").read_text(encoding="utf-8"))
+    assert list(chem) == ["Atomic Structure and Periodic Table", "Chemical analysis"]
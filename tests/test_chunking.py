@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from chunking import chunk_failed, dedupe_questions, generate_in_chunks, split_counts
+
+PARSE_FAILED = [{"question": "raw reply", "answer": "Parsing failed"}]
+
+
+@pytest.mark.parametrize("num, size, expected", [
+    (25, 10, [9, 8, 8]),
+    (10, 10, [10]),
+    (11, 10, [6, 5]),
+    (3, 10, [3]),
+    (5, 0, [1, 1, 1, 1, 1]),
+])
+def test_split_counts(num, size, expected):
+    assert split_counts(num, size) == expected
+    assert sum(split_counts(num, size)) == num
+
+
+def test_chunk_failed():
+    assert chunk_failed(ValueError("boom"))
+    assert chunk_failed(PARSE_FAILED)
+    assert chunk_failed("not a list")
+    assert not chunk_failed([{"question": "q", "answer": "a"}])
+
+
+def test_dedupe_questions_keeps_first_of_near_duplicates():
+    items = [
+        {"question": "Solve the equation 2x + 3 = 7 for x."},
+        {"question": "Solve the equation 2x + 3 = 7 for x"},
+        {"question": "Find the area of a circle with radius 3 cm."},
+        {"question": "Solve the equation 2x + 3 = 7 for x, showing working."},
+    ]
+    kept = dedupe_questions(items, threshold=0.8)
+    assert kept == [items[0], items[2], items[3]]
+    assert dedupe_questions(items, threshold=0.5) == [items[0], items[2]]
+
+
+def test_generate_in_chunks_retries_only_failed_chunks():
+    calls = []
+
+    async def run_chunk(count, index):
+        calls.append(index)
+        if index == 1 and calls.count(1) == 1:
+            return PARSE_FAILED
+        return [{"question": f"chunk {index} question number {n}", "answer": "a"} for n in range(count)]
+
+    result = asyncio.run(generate_in_chunks(25, 10, run_chunk, retries=2))
+    assert len(result) == 25
+    assert sorted(calls) == [0, 1, 1, 2]
+
+
+def test_generate_in_chunks_drops_chunks_that_keep_failing():
+    async def run_chunk(count, index):
+        if index == 0:
+            raise RuntimeError("upstream down")
+        return [{"question": f"chunk {index} question number {n}", "answer": "a"} for n in range(count)]
+
+    result = asyncio.run(generate_in_chunks(20, 10, run_chunk, retries=1))
+    assert [item["question"] for item in result] == [f"chunk 1 question number {n}" for n in range(10)]
+
+
+def test_generate_in_chunks_surfaces_total_failure():
+    async def raises(count, index):
+        raise RuntimeError("upstream down")
+
+    async def unparseable(count, index):
+        return PARSE_FAILED
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(generate_in_chunks(20, 10, raises, retries=1))
+    assert asyncio.run(generate_in_chunks(20, 10, unparseable, retries=1)) == PARSE_FAILED
+
+
+def test_generate_in_chunks_tops_up_after_dedup():
+    calls = []
+
+    async def run_chunk(count, index):
+        calls.append((index, count))
+        if index == 1:  # repeats chunk 0's questions
+            return [{"question": f"chunk 0 question number {n}", "answer": "a"} for n in range(count)]
+        if index == 2:  # first top-up: one new, one still a duplicate
+            return [{"question": "a brand new top up question", "answer": "a"},
+                    {"question": "chunk 0 question number 1", "answer": "a"}]
+        return [{"question": f"chunk {index} question number {n}", "answer": "a"} for n in range(count)]
+
+    result = asyncio.run(generate_in_chunks(8, 4, run_chunk, retries=2))
+    assert len(result) == 8
+    assert calls == [(0, 4), (1, 4), (2, 4), (3, 3)]
+    assert len({item["question"] for item in result}) == 8
+
+
+def test_generate_in_chunks_top_up_is_bounded_by_retries():
+    calls = []
+
+    async def run_chunk(count, index):
+        calls.append(index)
+        if index >= 2:
+            raise RuntimeError("upstream down")
+        return [{"question": "the same question every time", "answer": "a"}] * count
+
+    result = asyncio.run(generate_in_chunks(6, 3, run_chunk, retries=2))
+    assert result == [{"question": "the same question every time", "answer": "a"}]
+    assert calls == [0, 1, 2, 3]
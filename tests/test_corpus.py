@@ -0,0 +1,89 @@
+import os
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import corpus
+import fewshot
+from frame_cache import DataFrameCache
+
+SHEETS = {
+    "Fractions": [
+        ["Topic Name", "Question", "Marks", "Difficulty", None],
+        ["Fractions", "Simplify 6/8.", 2, "Easy", None],
+        ["Fractions", "Add 1/3 and 1/4.", None, "Medium", None],
+        [None, None, None, None, None],
+        ["Fractions", 42, 3.5, None, None],  # a number in a text column
+    ],
+    "Ratio": [
+        ["Topic Name", "Question", "Answer"],
+        ["Ratio", "Share £20 in the ratio 2:3.", "£8 and £12"],
+        ["Ratio", "Simplify 12:18.", "2:3"],
+    ],
+}
+
+
+def _write_workbook(path, sheets):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+
+
+def _rows(df):
+    return [[None if pd.isna(v) else v for v in row] for row in df.astype(object).itertuples(index=False)]
+
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus, "CORPUS_DIR", tmp_path / "compiled")
+    monkeypatch.setattr(fewshot, "frame_cache", DataFrameCache())
+    path = tmp_path / "Math" / "Math Chapter 1.xlsx"
+    path.parent.mkdir()
+    _write_workbook(path, SHEETS)
+    return path
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_compiled_frames_match_the_excel_frames(workbook, monkeypatch, mmap):
+    monkeypatch.setattr(corpus, "CORPUS_MMAP", mmap)
+    assert fewshot.compile_workbook(workbook) == 3  # first-sheet frame + both sheets
+
+    for sheet in [None, "Fractions", "Ratio"]:
+        expected = fewshot._read_sheet(workbook, sheet)
+        loaded = corpus.load_compiled(workbook, sheet)
+        assert loaded is not None
+        assert list(loaded.columns) == list(expected.columns)
+        assert _rows(loaded) == _rows(expected)
+        if mmap:
+            assert all(isinstance(dtype, pd.ArrowDtype) for dtype in loaded.dtypes)
+
+    fractions = corpus.load_compiled(workbook, "Fractions")
+    assert list(fractions.columns) == ["Topic Name", "Question", "Marks", "Difficulty"]  # padding dropped
+    assert len(fractions) == 3                                                         # empty row dropped
+    assert fractions["Question"].tolist()[-1] == "42"
+
+
+def test_newer_workbook_is_recompiled(workbook):
+    assert fewshot._read_excel_cached(workbook, "Ratio")["Answer"].tolist() == ["£8 and £12", "2:3"]
+    assert corpus.is_fresh(workbook, "Ratio")
+    assert fewshot.compile_workbook(workbook) == 2  # "Ratio" was compiled by the read above
+
+    # the workbook is edited after the compile: age the compiled copies, then save it now
+    for compiled in corpus.CORPUS_DIR.rglob(f"*{corpus.CORPUS_SUFFIX}"):
+        earlier = compiled.stat().st_mtime - 60
+        os.utime(compiled, (earlier, earlier))
+    _write_workbook(workbook, dict(SHEETS, Ratio=SHEETS["Ratio"] + [["Ratio", "Simplify 10:15.", "2:3"]]))
+    assert not corpus.is_fresh(workbook, "Ratio")
+    assert corpus.load_compiled(workbook, "Ratio") is None
+
+    df = fewshot._read_excel_cached(workbook, "Ratio")
+    assert len(df) == 3 and isinstance(df["Answer"].dtype, pd.ArrowDtype)
+    assert corpus.is_fresh(workbook, "Ratio")
+    assert len(corpus.load_compiled(workbook, "Ratio")) == 3
+    assert fewshot.compile_workbook(workbook) == 2  # the other two frames were stale too
+    assert fewshot.compile_workbook(workbook) == 0
@@ -0,0 +1,95 @@
+import asyncio
+import shutil
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+import corpus
+import curated_watcher
+import fewshot
+from curated_watcher import CuratedWatcher
+from frame_cache import frame_cache
+
+ROOT = Path(__file__).resolve().parents[1]
+NEW_TOPIC = "Watcher Test Topic"
+
+
+@pytest.fixture
+def curated(tmp_path, monkeypatch):
+    src = tmp_path / "curated"
+    (src / "Math").mkdir(parents=True)
+    shutil.copy2(ROOT / "curated_excels" / "Math" / "Math Chapter 1.xlsx", src / "Math")
+    monkeypatch.setattr(fewshot, "CURATED_DIR", src)
+    monkeypatch.setattr(corpus, "CORPUS_DIR", tmp_path / "compiled")
+    # the catalog and semantic index builds have their own tests
+    monkeypatch.setattr(curated_watcher, "_build_runtime_catalog", lambda: None)
+    monkeypatch.setattr(curated_watcher, "SEMANTIC_DIR", tmp_path / "semantic")
+    frame_cache.clear()
+    yield src
+    frame_cache.clear()
+
+
+def _inline(watcher, monkeypatch):
+    # run the worker-process steps in this process, where the monkeypatched paths apply
+    monkeypatch.setattr(watcher, "_run", lambda fn, *args: fn(*args))
+
+
+def _edit(path):
+    wb = openpyxl.load_workbook(path)
+    ws = wb.worksheets[0]
+    topic_col = [c.value for c in ws[1]].index("Topic Name") + 1
+    cell = next(row[topic_col - 1] for row in ws.iter_rows(min_row=2)
+                if isinstance(row[topic_col - 1], openpyxl.cell.cell.Cell) and row[topic_col - 1].value)
+    cell.value = NEW_TOPIC
+    wb.save(path)
+
+
+def test_polling_reload_compiles_replaces_and_indexes(curated, monkeypatch):
+    path = curated / "Math" / "Math Chapter 1.xlsx"
+    old = fewshot._read_excel_cached(path)
+    assert NEW_TOPIC not in set(old["Topic Name"].dropna())
+    stale_before = frame_cache.stats()["stale_replaced"]
+
+    async def main():
+        watcher = CuratedWatcher(root=curated, backend="poll", interval=0.05, debounce=0.05)
+        _inline(watcher, monkeypatch)
+        watcher.start()
+        assert watcher.stats()["watching"]
+        await asyncio.sleep(0.1)
+        _edit(path)
+        for _ in range(200):
+            if watcher.reloads:
+                break
+            await asyncio.sleep(0.05)
+        await watcher.stop()
+        return watcher
+
+    watcher = asyncio.run(main())
+    assert watcher.reloads == 1 and watcher.errors == {}
+    assert watcher.last_reload["changed"] == [str(path)]
+    assert corpus.is_fresh(path)                                   # compiled again
+
+    new = fewshot._read_excel_cached(path)                          # served from the swapped-in entry
+    assert new is not old and NEW_TOPIC in set(new["Topic Name"].dropna())
+    assert frame_cache.stats()["stale_replaced"] > stale_before
+    assert (id(new), "Topic Name", "Difficulty Level") in fewshot._index_cache   # primed
+
+
+def test_only_one_worker_watches(curated, monkeypatch):
+    async def main():
+        first = CuratedWatcher(root=curated, backend="poll", interval=0.05)
+        second = CuratedWatcher(root=curated, backend="poll", interval=0.05)
+        first.start()
+        second.start()
+        assert first.stats()["watching"] and not second.stats()["watching"]
+        await first.stop()                                          # the watching worker exits
+        for _ in range(40):
+            if second.stats()["watching"]:
+                break
+            await asyncio.sleep(0.05)
+        taken_over = second.stats()["watching"]
+        await second.stop()
+        return taken_over
+
+    assert asyncio.run(main())
@@ -0,0 +1,64 @@
+import json
+
+import dedup
+from dedup import NearDuplicateIndex
+
+
+def _index(tmp_path, history_max=100):
+    index = NearDuplicateIndex(threshold=0.7, history_path=str(tmp_path / "history.jsonl"),
+                               history_max=history_max)
+    index.load(frames=[])
+    return index
+
+
+def _q(text):
+    return {"question": text, "answer": "42"}
+
+
+def test_fresh_verbatim_repeat_of_history_is_dropped(tmp_path):
+    index = _index(tmp_path)
+    first = _q("A car travels 120 km in 2 hours. Calculate its average speed in km/h.")
+    index.remember([first])
+
+    kept, dropped = index.filter([_q(first["question"]), _q("Factorise x^2 + 5x + 6 completely.")])
+
+    assert [item["question"] for item in dropped] == [first["question"]]
+    assert len(kept) == 1
+
+
+def test_replayed_items_pass_but_still_count_for_the_batch(tmp_path):
+    index = _index(tmp_path)
+    cached = _q("A car travels 120 km in 2 hours. Calculate its average speed in km/h.")
+    index.remember([cached])
+    repeat = _q(cached["question"])
+
+    kept, dropped = index.filter([cached, repeat], replayed=[cached])
+
+    assert kept == [cached]
+    assert dropped == [repeat]
+
+
+def test_flag_mode_keeps_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "DEDUP_MODE", "flag")
+    index = _index(tmp_path)
+    text = "Solve the simultaneous equations 2x + y = 7 and x - y = 2."
+
+    kept, dropped = index.filter([_q(text), _q(text)])
+
+    assert dropped == []
+    assert "near_duplicate" not in kept[0]
+    assert kept[1]["near_duplicate"] is True
+
+
+def test_history_is_trimmed_to_the_newest_questions(tmp_path):
+    index = _index(tmp_path, history_max=4)
+    for n in range(6):
+        index.remember([_q(f"Question number {n}: work out {n} multiplied by {n + 7} and simplify.")])
+
+    with open(index.history_path, encoding="utf-8") as f:
+        questions = [json.loads(line)["question"] for line in f]
+    assert len(questions) == 4
+    assert questions[-1].startswith("Question number 5")
+
+    reloaded = _index(tmp_path, history_max=4)
+    assert reloaded.stats()["generated_indexed"] == 4
@@ -0,0 +1,65 @@
+import csv
+import io
+import os
+import time
+
+from openpyxl import load_workbook
+
+from exporter import ExportStore, render
+
+ITEMS = [{"question_markdown": "Work out $3 + 4$", "answer_markdown": "$7$"},
+         {"question_markdown": "Simplify $\\frac{6}{8}$", "answer_markdown": "$\\frac{3}{4}$"}]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    store = ExportStore(directory=tmp_path)
+    saved = store.save(ITEMS, "GCSE Chapter/1: Fractions")
+
+    assert store.load(saved["id"]) == ITEMS
+    assert saved["output_file"] == f"/exports/{saved['id']}/GCSE Chapter_1_ Fractions.xlsx"
+    assert set(saved["downloads"]) == {"xlsx", "csv", "json", "md"}
+    # the same content is stored once
+    assert store.save(ITEMS, "other")["id"] == saved["id"]
+    assert len(list(tmp_path.iterdir())) == 1
+    assert store.load("../" + saved["id"]) is None
+    assert store.load("0" * 64) is None
+
+
+def test_render_formats():
+    wb = load_workbook(render(ITEMS, "xlsx"))
+    assert [c.value for c in next(wb.active.iter_rows())] == ["question_markdown", "answer_markdown"]
+    rows = list(csv.reader(io.StringIO(render(ITEMS, "csv").read().decode("utf-8"))))
+    assert rows[1] == ["Work out $3 + 4$", "$7$"]
+    assert "**Q2.** Simplify" in render(ITEMS, "md").read().decode("utf-8")
+
+
+def test_cleanup_only_deletes_exports(tmp_path):
+    store = ExportStore(directory=tmp_path, retention_hours=1)
+    old = tmp_path / (store.save(ITEMS, "a")["id"] + ".json")
+    fresh = tmp_path / (store.save(ITEMS[:1], "b")["id"] + ".json")
+    leftover = tmp_path / (("ab" * 32) + ".123.tmp")
+    leftover.write_text("{}")
+    legacy = tmp_path / "GCSE_Chapter1_Fractions_Easy_5.xlsx"
+    legacy.write_bytes(b"x")
+    notes = tmp_path / "notes.json"
+    notes.write_text("{}")
+    (tmp_path / "subdir").mkdir()
+    stale = time.time() - 2 * 3600
+    for path in (old, leftover, legacy, notes):
+        os.utime(path, (stale, stale))
+
+    assert store.cleanup() == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([fresh.name, legacy.name, notes.name, "subdir"])
+
+
+def test_cleanup_size_cap_removes_the_oldest_exports(tmp_path):
+    store = ExportStore(directory=tmp_path, max_mb=0)
+    first = tmp_path / (store.save(ITEMS, "a")["id"] + ".json")
+    os.utime(first, (time.time() - 60, time.time() - 60))
+    store.save(ITEMS[:1], "b")
+    (tmp_path / "keep.txt").write_text("x" * 1000)
+
+    store.max_bytes = (tmp_path / (store.save(ITEMS[:1], "b")["id"] + ".json")).stat().st_size
+    assert store.cleanup() == 1
+    assert not first.exists()
+    assert (tmp_path / "keep.txt").exists()
@@ -0,0 +1,44 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+import corpus
+import fewshot
+from frame_cache import DataFrameCache
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_science_workbook_is_read_with_header_detection_by_default(tmp_path, monkeypatch):
+    # whichever caller reads a science workbook first decides the cached and compiled frame
+    monkeypatch.setattr(corpus, "CORPUS_DIR", tmp_path / "compiled")
+    monkeypatch.setattr(fewshot, "frame_cache", DataFrameCache())
+    src = next((ROOT / "curated_excels" / "Physics").glob("*.xlsx"))
+    path = tmp_path / "Physics" / src.name
+    path.parent.mkdir()
+    shutil.copy2(src, path)
+
+    first = fewshot._read_excel_cached(path)
+    expected = fewshot.read_science_workbook(path)
+    assert "Question type" in first.columns
+    assert list(first.columns) == list(expected.columns)
+    assert len(first) == len(expected)
+
+    compiled = corpus.load_compiled(path)
+    assert compiled is not None and list(compiled.columns) == list(expected.columns)
+
+
+def test_random_sampling_is_the_default():
+    assert fewshot.FEWSHOT_SAMPLING == "random"
+
+
+def test_sample_rows(monkeypatch):
+    rows = np.arange(100)
+    picks = {tuple(fewshot._sample_rows(rows, 3)) for _ in range(20)}
+    assert len(picks) > 1
+    assert all(len(set(p)) == 3 for p in picks)
+
+    monkeypatch.setattr(fewshot, "FEWSHOT_SAMPLING", "stable")
+    assert list(fewshot._sample_rows(rows[::-1], 3)) == [0, 1, 2]
+    assert len(fewshot._sample_rows(rows[:2], 3)) == 2
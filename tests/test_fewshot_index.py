@@ -0,0 +1,114 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from fewshot_index import CodedColumn, FewshotIndex
+
+TOPICS = ["Fractions", "Adding fractions", "Ratio", "ratio and proportion", np.nan, "Surds (simplifying)",
+          "x^2 graphs", "Fractions", "Standard form", "FRACTIONS", "Ratio", None, "Mean, median & mode", "ra"]
+LEVELS = ["Easy", "Medium", "Easy", "Hard", "Easy", "Medium", np.nan, "Hard", "Easy", "easy", "Medium", "Easy",
+          "Hard", "Easy"]
+
+
+def _frame(arrow=False):
+    df = pd.DataFrame({"Topic Name": TOPICS, "Difficulty Level": LEVELS, "Question": [f"q{i}" for i in range(len(TOPICS))]})
+    if arrow:
+        # compiled corpus frames are Arrow-backed
+        df = df.astype({"Topic Name": pd.ArrowDtype(pa.string()), "Difficulty Level": pd.ArrowDtype(pa.string())})
+    return df
+
+
+def _as_text(series):
+    """The column as strings with blanks kept blank (NaN/None cells never match)."""
+    return series.map(lambda v: None if pd.isna(v) else str(v)).astype(object)
+
+
+def _reference_exact(series, value):
+    return np.flatnonzero((_as_text(series).str.lower() == str(value).lower()).to_numpy(dtype=bool))
+
+
+def _reference_contains(series, pattern):
+    return np.flatnonzero(_as_text(series).str.contains(pattern, case=False, na=False).to_numpy(dtype=bool))
+
+
+def _rows(column, codes):
+    if not codes:
+        return np.empty(0, dtype=np.int64)
+    return np.sort(np.concatenate([column.rows[c] for c in codes]))
+
+
+PATTERNS = [
+    "fraction",          # trigram path, several categories and cases
+    "RATIO",             # case-insensitive
+    "ra",                # shorter than a trigram: regex path
+    "a",
+    "x^2",               # "^" is an anchor under str.contains semantics, matches nothing
+    "Mean, median",
+    "median & mode",
+    "nan",               # blanks are not the string "nan"
+    "surds \\(simplifying\\)",
+    "rat.o",
+    "zzz",
+]
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_contains_matches_pandas(pattern, arrow):
+    df = _frame(arrow)
+    column = CodedColumn(df["Topic Name"])
+    assert _rows(column, column.contains(pattern)).tolist() == _reference_contains(df["Topic Name"], pattern).tolist()
+
+
+def test_invalid_regex_raises_like_pandas():
+    # an unbalanced "(" is an error for str.contains too
+    df = _frame()
+    column = CodedColumn(df["Topic Name"])
+    with pytest.raises(re.error):
+        _reference_contains(df["Topic Name"], "s (simp")
+    with pytest.raises(re.error):
+        column.contains("s (simp")
+
+
+@pytest.mark.parametrize("value", ["Fractions", "fractions", "RATIO", "ra", "nan", "None", "Surds (simplifying)", "zzz"])
+def test_exact_matches_pandas(value):
+    df = _frame()
+    column = CodedColumn(df["Topic Name"])
+    assert _rows(column, column.exact(value)).tolist() == _reference_exact(df["Topic Name"], value).tolist()
+
+
+def test_blank_cells_have_no_category():
+    column = CodedColumn(_frame()["Topic Name"])
+    assert column.codes[4] == -1 and column.codes[11] == -1
+    assert "nan" not in column.categories and "none" not in column.categories
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+@pytest.mark.parametrize("topic, level", [
+    ("Fractions", "easy"), ("fraction", "Hard"), ("Ratio", "MEDIUM"), ("ra", "easy"), ("x^2 graphs", "Easy"),
+])
+def test_pair_rows_match_pandas(topic, level, arrow):
+    df = _frame(arrow)
+    index = FewshotIndex(df, "Topic Name", "Difficulty Level")
+    topic_codes = index.match_group(topic)
+    rows = index.pair_rows(topic_codes, index.sub.exact(level))
+
+    # the old selection: exact topic, else contains; then exact difficulty within it
+    topics = _reference_exact(df["Topic Name"], topic)
+    if len(topics) == 0:
+        topics = _reference_contains(df["Topic Name"], topic)
+    levels = _reference_exact(df["Difficulty Level"], level)
+    assert rows.tolist() == np.intersect1d(topics, levels).tolist()
+    assert index.group_rows(topic_codes).tolist() == topics.tolist()
+
+
+def test_missing_sub_column_and_unknown_values():
+    df = _frame()
+    index = FewshotIndex(df, "Topic Name", "Subtopic")
+    assert index.sub is None
+    assert index.match_group("Vectors") == []
+    assert index.group_rows([]).tolist() == []
+    assert index.pair_rows([], [0]).tolist() == []
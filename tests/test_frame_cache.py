@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from frame_cache import DataFrameCache, frame_bytes
+
+
+def _frame(rows=3):
+    return pd.DataFrame({"Question": [f"q{i}" for i in range(rows)]})
+
+
+def test_hit_and_stale_mtime_reload():
+    cache = DataFrameCache(max_entries=4, max_mb=10)
+    first, second = _frame(), _frame(4)
+    assert cache.get("a.xlsx", None, 1.0, lambda: first) is first
+    assert cache.get("a.xlsx", None, 1.0, lambda: pytest.fail("cached")) is first
+    assert cache.get("a.xlsx", None, 2.0, lambda: second) is second
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stale_replaced"], stats["entries"]) == (1, 2, 1, 1)
+
+
+def test_concurrent_misses_load_once():
+    cache = DataFrameCache()
+    loads, started = [], threading.Event()
+    df = _frame()
+
+    def load():
+        loads.append(1)
+        started.set()
+        time.sleep(0.1)
+        return df
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("a.xlsx", "S1", 1.0, load)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(loads) == 1
+    assert all(r is df for r in results) and len(results) == 8
+    assert cache.stats()["coalesced"] == 7 and cache.stats()["loading"] == 0
+
+
+def test_failed_load_is_not_cached_and_waiters_retry():
+    cache = DataFrameCache()
+    attempts = []
+    df = _frame()
+
+    def load():
+        attempts.append(1)
+        time.sleep(0.05)
+        if len(attempts) == 1:
+            raise OSError("half-written workbook")
+        return df
+
+    errors, results = [], []
+
+    def worker():
+        try:
+            results.append(cache.get("a.xlsx", None, 1.0, load))
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(errors) == 1 and len(results) == 2 and all(r is df for r in results)
+    assert cache.stats()["load_errors"] == 1
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = DataFrameCache(max_entries=2, max_mb=10)
+    for name in ("a", "b"):
+        cache.get(name, None, 1.0, _frame)
+    cache.get("a", None, 1.0, _frame)  # a is now most recent
+    cache.get("c", None, 1.0, _frame)
+    assert [f["path"] for f in cache.stats()["frames"]] == ["a", "c"]
+
+    big = _frame(1000)
+    cache = DataFrameCache(max_entries=10, max_mb=frame_bytes(big) * 1.5 / (1024 * 1024))
+    cache.get("a", None, 1.0, lambda: big)
+    cache.get("b", None, 1.0, lambda: big.copy())
+    stats = cache.stats()
+    assert [f["path"] for f in stats["frames"]] == ["b"] and stats["evictions"] == 1
+    assert stats["bytes"] == frame_bytes(big)
+
+
+def test_discard_drops_every_sheet_of_a_workbook():
+    cache = DataFrameCache()
+    for sheet in (None, "S1", "S2"):
+        cache.get("a.xlsx", sheet, 1.0, _frame)
+    cache.get("b.xlsx", None, 1.0, _frame)
+    cache.discard("a.xlsx")
+    stats = cache.stats()
+    assert [f["path"] for f in stats["frames"]] == ["b.xlsx"]
+    assert stats["bytes"] == frame_bytes(_frame())
@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+from jobs import JobQueue, JobStore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_each_job_runs_once_across_processes(tmp_path):
+    db = str(tmp_path / "jobs.sqlite")
+    store = JobStore(db)
+    ids = [store.create({"n": n}, "normal") for n in range(20)]
+    runs = []
+
+    async def job(request, set_stage):
+        set_stage("working")
+        runs.append(request["n"])
+        await asyncio.sleep(0.01)
+        return {"n": request["n"]}
+
+    async def main():
+        # two "processes" sharing the database, both picking up the same queued rows
+        a, b = JobQueue(workers=3, lease=0.3), JobQueue(workers=3, lease=0.3)
+        a.start(job, db)
+        b.start(job, db)
+        await wait_for(lambda: all(store.get(i)["status"] == "done" for i in ids))
+        await a.stop()
+        await b.stop()
+
+    run(main())
+    assert sorted(runs) == list(range(20))
+    assert store.get(ids[0])["result"] == {"n": 0}
+
+
+def test_cancel_from_another_process_wins(tmp_path):
+    db = str(tmp_path / "jobs.sqlite")
+    release = None
+
+    async def job(request, set_stage):
+        await release.wait()
+        return {"ok": True}
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        a, b = JobQueue(workers=1, lease=0.3), JobQueue(workers=1, lease=0.3)
+        a.start(job, db)
+        b.start(job, db)
+        job_id = a.store.create({}, "normal")
+        a._enqueue(job_id, "normal")
+        await wait_for(lambda: job_id in a._running)
+        # cancelled through b (different process); a's task keeps going until its next renewal
+        assert (await asyncio.to_thread(b.cancel, job_id))["status"] == "cancelled"
+        release.set()
+        await wait_for(lambda: job_id not in a._running)
+        status = a.store.get(job_id)["status"]
+        await a.stop()
+        await b.stop()
+        return status
+
+    assert run(main()) == "cancelled"
+
+
+def test_only_orphaned_running_jobs_are_requeued(tmp_path):
+    db = str(tmp_path / "jobs.sqlite")
+    store = JobStore(db)
+    far = time.time() + 3600
+    dead = store.create({"which": "dead"}, "normal")
+    alive = store.create({"which": "alive"}, "normal")
+    expired = store.create({"which": "expired"}, "normal")
+    store._write("UPDATE jobs SET status = 'running', owner = ?, lease_until = ? WHERE id = ?",
+                 ("otherhost:1:x", far, alive))
+    store._write("UPDATE jobs SET status = 'running', owner = ?, lease_until = ? WHERE id = ?",
+                 ("otherhost:1:y", time.time() - 1, expired))
+    # same host, a pid that does not exist
+    import jobs
+    store._write("UPDATE jobs SET status = 'running', owner = ?, lease_until = ? WHERE id = ?",
+                 (f"{jobs.HOSTNAME}:999999999:z", far, dead))
+    ran = []
+
+    async def job(request, set_stage):
+        ran.append(request["which"])
+        return {}
+
+    async def main():
+        q = JobQueue(workers=2, lease=0.3)
+        q.start(job, db)
+        await wait_for(lambda: store.get(dead)["status"] == "done" and store.get(expired)["status"] == "done")
+        await q.stop()
+
+    run(main())
+    assert sorted(ran) == ["dead", "expired"]
+    assert store.get(alive)["status"] == "running"
+
+
+def test_stop_releases_running_jobs(tmp_path):
+    db = str(tmp_path / "jobs.sqlite")
+
+    async def job(request, set_stage):
+        await asyncio.sleep(60)
+
+    async def main():
+        q = JobQueue(workers=1, lease=0.3)
+        q.start(job, db)
+        job_id = q.submit({}, "high")
+        await wait_for(lambda: job_id in q._running)
+        await q.stop()
+        return JobStore(db).get(job_id)
+
+    job = run(main())
+    assert job["status"] == "queued" and job["owner"] is None
+
+
+def test_owner_stops_a_job_cancelled_elsewhere(tmp_path):
+    db = str(tmp_path / "jobs.sqlite")
+    stopped = []
+
+    async def job(request, set_stage):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            stopped.append(True)
+            raise
+
+    async def main():
+        a, b = JobQueue(workers=1, lease=0.3), JobQueue(workers=1, lease=0.3)
+        a.start(job, db)
+        b.start(job, db)
+        job_id = a.store.create({}, "normal")
+        a._enqueue(job_id, "normal")
+        await wait_for(lambda: job_id in a._running)
+        await asyncio.to_thread(b.cancel, job_id)
+        await wait_for(lambda: stopped, timeout=2)
+        status = a.store.get(job_id)["status"]
+        await a.stop()
+        await b.stop()
+        return status
+
+    assert run(main()) == "cancelled"
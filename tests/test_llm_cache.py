@@ -0,0 +1,92 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import llm_cache
+from llm_cache import LLMCache, make_key
+
+
+def test_make_key_is_stable_and_parameter_sensitive():
+    assert make_key("m", "prompt", variant=1) == make_key("m", "prompt", variant=1)
+    assert make_key("m", "prompt", variant=1) != make_key("m", "prompt", variant=2)
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMCache("t", ttl=10)
+    cache.set("k", [1])
+    now[0] += 9
+    assert cache.get("k") == [1]
+    now[0] += 2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_bounds_entries_and_bytes():
+    cache = LLMCache("t", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # b is now the least recently used
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+    cache = LLMCache("t", max_bytes=15)
+    cache.set("a", "x" * 8)
+    cache.set("b", "y" * 8)
+    assert cache.get("a") is None and cache.get("b") == "y" * 8
+    assert cache.stats()["evictions"] == 1
+
+
+def test_hits_return_copies():
+    cache = LLMCache("t")
+    cache.set("k", [{"question": "q"}])
+    cache.get("k")[0]["question"] = "changed"
+    assert cache.get("k") == [{"question": "q"}]
+
+
+def test_sqlite_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = LLMCache("t", sqlite_path=path)
+    first.set("k", {"v": 1})
+    first.flush()
+    other = LLMCache("t", sqlite_path=path)
+    assert asyncio.run(other.aget("k")) == {"v": 1}
+    assert other.stats()["disk_hits"] == 1
+    assert asyncio.run(other.aget("missing")) is None
+
+
+def test_a_locked_database_does_not_block_the_event_loop(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = LLMCache("t", sqlite_path=path)
+
+    # another worker holds the write lock for a while
+    locker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    locker.execute("BEGIN EXCLUSIVE")
+    threading.Timer(0.5, locker.rollback).start()
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.02)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        cache.set("k", [1])  # queued behind the lock
+        queued = time.perf_counter() - start
+        hit = await cache.aget("k")  # memory tier
+        miss = await cache.aget("other")  # waits for the disk thread
+        task.cancel()
+        return queued, hit, miss, ticks, time.perf_counter() - start
+
+    queued, hit, miss, ticks, elapsed = asyncio.run(main())
+    assert queued < 0.1 and hit == [1] and miss is None
+    assert elapsed >= 0.4
+    assert ticks >= 10
+    cache.flush()
+    assert LLMCache("t", sqlite_path=path).get("k") == [1]
@@ -0,0 +1,125 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+import llm_gateway
+from llm_gateway import CircuitBreaker, LLMUnavailableError, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_gateway.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "breaker", CircuitBreaker(threshold=3, cooldown=30))
+    monkeypatch.setattr(llm_gateway, "request_bucket", TokenBucket(0))
+    monkeypatch.setattr(llm_gateway, "token_bucket", TokenBucket(0))
+    monkeypatch.setattr(llm_gateway, "LLM_BACKOFF_BASE", 0)
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(llm_gateway, "record_usage", lambda model, usage: None)
+    return llm_gateway
+
+
+def status_error(code):
+    request = httpx.Request("POST", "https://api.example/v1/chat/completions")
+    response = httpx.Response(code, request=request)
+    cls = {400: openai.BadRequestError, 429: openai.RateLimitError}.get(code, openai.APIStatusError)
+    if code >= 500:
+        cls = openai.InternalServerError
+    return cls(f"status {code}", response=response, body=None)
+
+
+class FakeClient:
+    """client.chat.completions.create raising the queued errors first."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.chat = self.completions = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+class AsyncFakeClient(FakeClient):
+    async def create(self, **kwargs):
+        return FakeClient.create(self, **kwargs)
+
+
+def test_token_bucket_reserves_ahead_and_refills(clock):
+    bucket = TokenBucket(60)  # one unit per second
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(2) == pytest.approx(2)
+    clock.now += 2
+    assert bucket.reserve(1) == pytest.approx(1)
+    clock.now += 120
+    assert bucket.reserve(60) == 0  # refills up to one minute's worth only
+    assert TokenBucket(0).reserve(10**6) == 0
+
+
+def test_circuit_breaker_opens_and_allows_one_trial(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+    breaker.record(False)
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == "open"
+    with pytest.raises(LLMUnavailableError) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after == pytest.approx(30)
+
+    clock.now += 30
+    assert breaker.state == "half-open"
+    breaker.before_call()  # the trial call
+    with pytest.raises(LLMUnavailableError):
+        breaker.before_call()
+    breaker.record(True)
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+@pytest.mark.parametrize("code", [408, 429, 500, 503])
+def test_retryable_statuses_are_retried(gateway, code):
+    client = FakeClient(status_error(code))
+    assert gateway.create(client, model="m", messages=[]) == "ok"
+    assert client.calls == 2
+
+    client = AsyncFakeClient(status_error(code))
+    assert asyncio.run(gateway.acreate(client, model="m", messages=[])) == "ok"
+    assert client.calls == 2
+
+
+def test_client_errors_are_not_retried_and_keep_the_breaker_closed(gateway):
+    client = FakeClient(*[status_error(400)] * 5)
+    for _ in range(5):
+        with pytest.raises(openai.BadRequestError):
+            gateway.create(client, model="m", messages=[])
+    assert client.calls == 5
+    assert gateway.breaker.state == "closed"
+
+
+def test_retries_run_out_then_the_breaker_fails_fast(gateway):
+    client = FakeClient(*[status_error(408)] * 3)
+    with pytest.raises(LLMUnavailableError):
+        gateway.create(client, model="m", messages=[])
+    assert client.calls == 3
+    assert gateway.breaker.state == "open"
+    with pytest.raises(LLMUnavailableError):
+        gateway.create(client, model="m", messages=[])
+    assert client.calls == 3
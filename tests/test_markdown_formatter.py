@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import markdown_builder
+from math_formatter import format_text
+
+GOLDEN_FILE = Path(__file__).resolve().parents[1] / "scripts" / "golden" / "markdown_formatter.json"
+GOLDEN = json.loads(GOLDEN_FILE.read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("entry", GOLDEN, ids=[f"{n}" for n in range(len(GOLDEN))])
+def test_golden(entry):
+    markdown, confident = format_text(entry["input"])
+    if entry["confident"]:
+        assert (markdown, confident) == (entry["markdown"], True)
+    else:
+        # left to the LLM formatter
+        assert confident is False
+
+
+def _unparseable_reply(json_data):
+    return markdown_builder._parse_markdown("Sorry, I can't help with that.", json_data)
+
+
+def test_failed_llm_fallback_keeps_the_local_formatting(monkeypatch):
+    items = [{"question": "Work out 3 + 4", "answer": "7"},
+             {"question": "Balance H2 + O2 → H2O", "answer": "2H2 + O2 → 2H2O"}]
+    monkeypatch.setattr(markdown_builder, "_call_llm_markdown", _unparseable_reply)
+    monkeypatch.setattr(markdown_builder.markdown_cache, "get", lambda key: None)
+
+    md = markdown_builder.generate_markdown(items, mode="local-with-llm-fallback")
+
+    assert md[0] == {"question_markdown": "Work out $3 + 4$", "answer_markdown": "$7$"}
+    assert md[1] == {"question_markdown": items[1]["question"], "answer_markdown": items[1]["answer"]}
+    assert len(md) == 2
+
+
+def test_failed_llm_fallback_keeps_local_math_of_unsure_items(monkeypatch):
+    item = {"question": "F = ma, so with m = 2 kg and a = 3 m/s² find F", "answer": "6 N"}
+    local, confident = markdown_builder.format_item(item)
+    assert not confident
+    monkeypatch.setattr(markdown_builder, "_call_llm_markdown", _unparseable_reply)
+    monkeypatch.setattr(markdown_builder.markdown_cache, "get", lambda key: None)
+
+    assert markdown_builder.generate_markdown([item], mode="local-with-llm-fallback") == [local]
@@ -0,0 +1,96 @@
+import asyncio
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app
+import metrics
+from metrics import Histogram, end_request, render_metrics, span, start_request
+
+
+def test_label_values_are_escaped():
+    h = Histogram("t_seconds", "Test.", ("stage",), buckets=(1,))
+    h.observe(0.5, 'say "hi"\\now\nnext')
+    lines = h.render()
+    assert 't_seconds_bucket{stage="say \\"hi\\"\\\\now\\nnext",le="1"} 1' in lines
+    assert all("\n" not in line for line in lines)
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    h = Histogram("t_seconds", "Test.", ("route", "status"), buckets=(0.1, 1, 5))
+    for value in (0.05, 0.5, 0.7, 3, 10):
+        h.observe(value, "/generate", 200)
+    assert h.render() == [
+        "# HELP t_seconds Test.",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{route="/generate",status="200",le="0.1"} 1',
+        't_seconds_bucket{route="/generate",status="200",le="1"} 3',
+        't_seconds_bucket{route="/generate",status="200",le="5"} 4',
+        't_seconds_bucket{route="/generate",status="200",le="+Inf"} 5',
+        't_seconds_sum{route="/generate",status="200"} 14.250000',
+        't_seconds_count{route="/generate",status="200"} 5',
+    ]
+
+
+def test_unlabelled_histogram_has_only_le_labels():
+    h = Histogram("t_seconds", "Test.", buckets=(1,))
+    h.observe(2)
+    assert h.render()[2:] == ['t_seconds_bucket{le="1"} 0', 't_seconds_bucket{le="+Inf"} 1',
+                              "t_seconds_sum{} 2.000000", "t_seconds_count{} 1"]
+
+
+def test_render_metrics_includes_collectors_and_skips_failing_ones(monkeypatch):
+    def good():
+        return [("qgen_test_total", "counter", "Test counter.", [({"kind": 'a"b'}, 3), ({}, 4)])]
+
+    def bad():
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(metrics, "_collectors", [bad, good])
+    text = render_metrics()
+    assert text.endswith("\n")
+    assert "# TYPE qgen_test_total counter\n" in text
+    assert 'qgen_test_total{kind="a\\"b"} 3\n' in text
+    assert "qgen_test_total 4\n" in text
+
+
+def test_end_request_sums_repeated_stages():
+    token = start_request()
+    metrics.record_stage("llm", 0.25)
+    metrics.record_stage("llm", 0.5)
+    metrics.record_stage("markdown", 0.0125)
+    assert end_request(token) == 'llm;dur=750.0;desc="x2", markdown;dur=12.5'
+
+
+def test_server_timing_header_lists_the_request_stages():
+    test_app = FastAPI()
+    test_app.middleware("http")(app.server_timing)
+
+    @test_app.get("/work")
+    async def work():
+        with span("prompt"):
+            pass
+        with span("llm"):
+            await asyncio.sleep(0.01)
+        with span("llm"):
+            pass
+        return {"ok": True}
+
+    @test_app.get("/idle")
+    def idle():
+        return {}
+
+    client = TestClient(test_app)
+    header = client.get("/work").headers["Server-Timing"]
+    assert re.fullmatch(r'prompt;dur=\d+\.\d, llm;dur=\d+\.\d;desc="x2", total;dur=\d+\.\d', header), header
+    assert float(re.search(r"llm;dur=([\d.]+)", header).group(1)) >= 10
+    assert re.fullmatch(r"total;dur=\d+\.\d", client.get("/idle").headers["Server-Timing"])
+    assert re.fullmatch(r"total;dur=\d+\.\d", client.get("/missing").headers["Server-Timing"])
+
+
+def test_request_durations_reach_the_metrics_endpoint():
+    client = TestClient(app.app)
+    client.get("/metrics")
+    text = client.get("/metrics").text
+    assert re.search(r'qgen_http_request_seconds_count\{route="/metrics",status="200"\} [1-9]', text)
@@ -0,0 +1,144 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import fewshot
+import prompt_builder
+from prompt_builder import build_budgeted_prompt
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _shots(n, prefix="Q"):
+    return [{"question": f"{prefix}{i}: solve {i}x + {i + 1} = {i * 3}", "hint": "collect like terms",
+             "answer": f"x = {i}", "difficulty": "Medium", "question_type": "Calculation"} for i in range(n)]
+
+
+def _prefix(prompt):
+    return prompt.split("Request:")[0]
+
+
+def test_classic_layout_and_random_sampling_are_the_defaults():
+    assert prompt_builder.PROMPT_LAYOUT == "classic"
+    assert fewshot.FEWSHOT_SAMPLING == "random"
+
+
+def test_cache_layout_implies_stable_sampling():
+    env = {**os.environ, "PROMPT_LAYOUT": "cache", "PYTHONPATH": str(ROOT / "utils")}
+    env.pop("FEWSHOT_SAMPLING", None)
+    out = subprocess.run([sys.executable, "-c", "import fewshot; print(fewshot.FEWSHOT_SAMPLING)"],
+                         env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == "stable"
+
+
+@pytest.mark.parametrize("subject, qtype", [("Math", None), ("Physics", "Calculation")])
+def test_cache_layout_prefix_is_byte_identical_across_requests(monkeypatch, subject, qtype):
+    monkeypatch.setattr(prompt_builder, "PROMPT_LAYOUT", "cache")
+    shots = _shots(8)
+    a, _ = build_budgeted_prompt(subject, "GCSE", "Linear equations", qtype, "Easy", shots, 5, budget=0)
+    b, _ = build_budgeted_prompt(subject, "GCSE", "Linear equations", qtype, "Hard", shots, 20, budget=0)
+    assert a != b
+    assert _prefix(a) == _prefix(b)
+    assert _prefix(a).startswith(f"You are a {'math' if subject == 'Math' else subject} question generator")
+    assert "Easy" not in _prefix(a) and "Hard" not in _prefix(b)
+
+
+def test_stable_sampling_gives_the_same_fewshots_and_prefix(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "PROMPT_LAYOUT", "cache")
+    monkeypatch.setattr(fewshot, "FEWSHOT_SAMPLING", "stable")
+    prefixes = set()
+    for num_questions in (10, 10, 25):
+        shots = fewshot.get_fewshot_examples(3, "y=mx+c", "Medium", k=10)
+        prompt, _ = build_budgeted_prompt("Math", "GCSE", "y=mx+c", None, "Medium", shots, num_questions, budget=0)
+        prefixes.add(_prefix(prompt).encode("utf-8"))
+    assert shots and len(prefixes) == 1
+
+
+@pytest.fixture
+def estimate(monkeypatch):
+    """Count tokens with the deterministic local estimate."""
+    monkeypatch.setattr(prompt_builder, "_encoding", False)
+    monkeypatch.setattr(prompt_builder, "PROMPT_LAYOUT", "classic")
+
+
+def _long_shots():
+    shots = []
+    for i, level in enumerate(["Hard", "Medium", "Hard", "Medium"]):
+        shots.append({"question": f"Q{i} " + "differentiate the function carefully " * (i + 1),
+                      "hint": "use the chain rule " * 10,
+                      "answer": f"A{i} " + "apply the product rule then simplify the result " * 15,
+                      "difficulty": level})
+    return shots
+
+
+def _build(shots, budget, difficulty="Medium"):
+    return build_budgeted_prompt("Math", "ALEVEL", "Differentiation", None, difficulty, shots, 5, budget=budget)
+
+
+def test_within_budget_or_unlimited_is_untouched(estimate):
+    shots = _long_shots()
+    full, stats = _build(shots, budget=0)
+    assert stats["prompt_tokens"] == stats["untrimmed_tokens"] and stats["fewshots_kept"] == 4
+    same, stats = _build(shots, budget=stats["untrimmed_tokens"])
+    assert same == full and not stats["hints_dropped"] and stats["answer_cap"] is None
+    assert stats["tokenizer"] == "estimate"
+
+
+def test_hints_are_dropped_first(estimate):
+    shots = _long_shots()
+    _, full = _build(shots, budget=0)
+    no_hints = prompt_builder.count_tokens(prompt_builder._render_prompt(
+        "Math", "ALEVEL", "Differentiation", None, "Medium", shots, 5, include_hints=False))
+    prompt, stats = _build(shots, budget=no_hints)
+    assert stats["hints_dropped"] and stats["answer_cap"] is None and stats["fewshots_kept"] == 4
+    assert "Hint:" not in prompt and stats["prompt_tokens"] <= no_hints < full["untrimmed_tokens"]
+
+
+def test_answers_are_truncated_before_examples_are_dropped(estimate):
+    shots = _long_shots()
+    capped = [{**fs, "answer": prompt_builder._truncate_tokens(fs["answer"], 80)} for fs in shots]
+    budget = prompt_builder.count_tokens(prompt_builder._render_prompt(
+        "Math", "ALEVEL", "Differentiation", None, "Medium", capped, 5, include_hints=False))
+    prompt, stats = _build(shots, budget=budget)
+    assert stats["answer_cap"] == 80 and stats["fewshots_kept"] == 4
+    assert stats["prompt_tokens"] <= budget
+    assert " …" in prompt
+
+
+def test_examples_are_dropped_lowest_ranked_first(estimate):
+    shots = _long_shots()
+    prompt, stats = _build(shots, budget=400)
+    assert stats["answer_cap"] == prompt_builder.ANSWER_TOKEN_CAPS[-1]
+    assert 1 <= stats["fewshots_kept"] < 4 and stats["prompt_tokens"] <= 400
+    # requested difficulty (Medium: Q1, Q3) ranks ahead of the others, shorter first
+    assert "Q1 " in prompt and "Q0 " not in prompt and "Q2 " not in prompt
+
+
+def test_one_example_is_always_kept(estimate):
+    prompt, stats = _build(_long_shots(), budget=1)
+    assert stats["fewshots_kept"] == 1 and stats["prompt_tokens"] > 1
+    assert "Q1 " in prompt
+
+
+def test_no_fewshots_is_returned_as_built(estimate):
+    prompt, stats = _build([], budget=1)
+    assert stats["fewshots"] == 0 and stats["fewshots_kept"] == 0 and "Q:" not in prompt
+
+
+def test_missing_vendored_tokenizer_never_downloads(tmp_path, monkeypatch):
+    import tiktoken
+
+    monkeypatch.setattr(prompt_builder, "_encoding", None)
+    monkeypatch.setattr(prompt_builder, "PROMPT_TOKENIZER_DIR", tmp_path)
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: pytest.fail("tried to load/download"))
+    assert prompt_builder.tokenizer_name() == "estimate"
+    assert prompt_builder.count_tokens("Solve 12x = 36") > 0
+
+
+def test_vendored_tokenizer_is_used_when_present():
+    if not prompt_builder.bpe_path().exists():
+        pytest.skip("BPE file not vendored (python scripts/fetch_tokenizer.py)")
+    assert prompt_builder.tokenizer_name() == prompt_builder.PROMPT_TOKENIZER
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import os
+
+from catalog import CatalogRegistry
+from question_pool import QuestionPool, pool_key
+
+FIELDS = {"subject": "Math", "curriculum": "GCSE", "chapter_num": 1, "difficulty": "Easy"}
+
+
+def _write_topics(static, topics, mtime):
+    path = static / "math_topics_gcse.json"
+    path.write_text(json.dumps({"1": topics}), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_take_serves_pooled_items_and_schedules_refill():
+    async def main():
+        pool = QuestionPool(size=4, low_water=2, batch=4, workers=1)
+        snap = type("Snap", (), {"math_gcse": {"1": ["Fractions"]}, "math_alevel": None, "science": {}})()
+
+        async def fill(fields, count):
+            return [(f"{fields['topic']} {i}", f"md {i}") for i in range(count)]
+
+        pool.start(fill, lambda: snap)
+        key = pool_key({**FIELDS, "topic": "Fractions"})
+        assert pool.take(key, 1) is None  # empty: miss, refill queued
+        await asyncio.sleep(0.05)
+        assert pool.take(key, 3) == [("Fractions 0", "md 0"), ("Fractions 1", "md 1"), ("Fractions 2", "md 2")]
+        await pool.stop()
+        assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 1
+
+    asyncio.run(main())
+
+
+def test_combinations_follow_catalog_reloads(tmp_path):
+    async def main():
+        static = tmp_path / "static"
+        static.mkdir()
+        _write_topics(static, ["Fractions", "Ratio"], 1000)
+        registry = CatalogRegistry(static_dir=static, runtime_dir=tmp_path / "runtime", check_interval=0)
+        pool = QuestionPool(size=2, low_water=1, batch=2, workers=1)
+
+        async def fill(fields, count):
+            return [(fields["topic"], "md")] * count
+
+        pool.start(fill, registry.snapshot)
+        ratio, vectors = (pool_key({**FIELDS, "topic": t}) for t in ("Ratio", "Vectors"))
+        pool.take(ratio, 1)
+        await asyncio.sleep(0.05)
+        assert pool.take(vectors, 1) is None and vectors not in pool.combinations
+
+        _write_topics(static, ["Fractions", "Vectors"], 2000)
+        assert pool.take(vectors, 1) is None  # now known: miss, refill queued
+        await asyncio.sleep(0.05)
+        assert pool.take(vectors, 1) == [("Vectors", "md")]
+        assert ratio not in pool.combinations and ratio not in pool._pools
+        assert pool.take(ratio, 1) is None
+        await pool.stop()
+
+    asyncio.run(main())
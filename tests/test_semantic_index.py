@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from semantic_index import SemanticIndex, build_vectors, write_index
+
+
+def _frame():
+    rows = [
+        ("Intersection of Sets", "Find A ∩ B when A = {1, 2, 3} and B = {2, 3, 4}."),
+        ("Intersection of Sets", "Shade the region P on the Venn diagram."),
+        ("Intersection of Sets", "Find A ∩ B when A = {1, 2, 3} and B = {2, 3, 5}."),
+        ("Prime Factors", "Write 360 as a product of its prime factors."),
+        ("Prime Factors", "Use prime factor decomposition to find the HCF of 84 and 120."),
+        ("Standard Form", "Write 0.00052 in standard form."),
+        ("Standard Form", "Calculate (3 × 10^4) × (2 × 10^5) in standard form."),
+    ]
+    return pd.DataFrame(rows, columns=["Topic Name", "Question"])
+
+
+def _index(tmp_path, frames):
+    write_index(*build_vectors(frames), directory=tmp_path)
+    return SemanticIndex(tmp_path)
+
+
+def test_misspelled_topic_ranks_its_rows_first(tmp_path):
+    df = _frame()
+    index = _index(tmp_path, [df])
+
+    rows, scores = index.nearest(df, "Intersectionn of Sets")
+    assert set(rows[:3].tolist()) == {0, 1, 2}
+    assert list(scores) == sorted(scores, reverse=True)
+
+    rows, _ = index.nearest(df, "prime factorisation")
+    assert rows[0] in (3, 4)
+
+
+def test_nearest_respects_rows_top_n_and_min_score(tmp_path):
+    df = _frame()
+    index = _index(tmp_path, [df])
+
+    rows, _ = index.nearest(df, "Intersection of Sets", rows=[3, 4, 5, 6, 1])
+    assert set(rows.tolist()) <= {3, 4, 5, 6, 1} and rows[0] == 1
+    assert len(index.nearest(df, "Intersection of Sets", top_n=2)[0]) == 2
+    assert len(index.nearest(df, "zebra giraffe")[0]) == 0
+    assert len(index.nearest(df, "   ")[0]) == 0
+
+
+def test_mmr_prefers_diverse_rows(tmp_path):
+    df = _frame()
+    index = _index(tmp_path, [df])
+    query = "Intersection of Sets"
+    candidates = np.array([0, 2, 1])   # 0 and 2 are near-copies
+
+    picked = index.mmr(df, query, candidates, 2, lam=0.5)
+    assert len(picked) == 2 and 1 in picked.tolist()
+    # pure relevance (lam=1) would keep both near-copies
+    assert set(index.mmr(df, query, candidates, 2, lam=1.0).tolist()) != set(picked.tolist())
+    assert len(index.mmr(df, query, candidates, 10)) == 3
+
+
+def test_missing_index_gives_no_results(tmp_path):
+    df = _frame()
+    index = SemanticIndex(tmp_path / "absent")
+    assert len(index.nearest(df, "Intersection of Sets")[0]) == 0
+    assert index.mmr(df, "Intersection of Sets", [4, 5, 6], 2).tolist() == [4, 5]
+
+
+def test_stale_frame_and_rebuilt_index(tmp_path):
+    df = _frame()
+    index = _index(tmp_path, [df])
+    assert len(index.nearest(df, "Standard Form")[0]) > 0
+
+    edited = df.copy()
+    edited.loc[len(edited)] = ["Standard Form", "Write 4.5 × 10^-3 as an ordinary number."]
+    assert len(index.nearest(edited, "Standard Form")[0]) == 0   # built before the edit
+
+    write_index(*build_vectors([edited]), directory=tmp_path)
+    stamp = os.stat(tmp_path / "index.json").st_mtime + 5
+    os.utime(tmp_path / "index.json", (stamp, stamp))           # a later build
+    rows, _ = index.nearest(edited, "Standard Form")
+    assert 7 in rows.tolist()
+    assert len(index.nearest(df, "Standard Form")[0]) == 0       # the old frame is no longer indexed
+
+
+def test_update_index_embeds_only_changed_frames(tmp_path):
+    from semantic_index import update_index
+
+    df = _frame()
+    other = pd.DataFrame({"Subtopic": ["Waves", "Waves"],
+                          "Question": ["State the speed of a wave.", "Define the amplitude of a wave."]})
+    assert update_index([df, other], directory=tmp_path) == 2      # no index yet: full build
+    assert update_index([df, other], directory=tmp_path) == 0      # nothing changed
+    before = np.load(tmp_path / "vectors.npy")
+
+    edited = df.copy()
+    edited.loc[len(edited)] = ["Standard Form", "Write 4.5 × 10^-3 as an ordinary number."]
+    assert update_index([edited, other], directory=tmp_path) == 1
+
+    index = SemanticIndex(tmp_path)
+    assert np.array_equal(np.asarray(index.block(other)), before[len(df):])   # copied, not re-embedded
+    assert index.block(df) is None                                           # the replaced frame is dropped
+    assert 7 in index.nearest(edited, "Standard Form")[0].tolist()
+    assert index.matrix.shape[0] == len(edited) + len(other)
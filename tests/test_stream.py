@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+import app
+from dedup import NearDuplicateIndex
+
+REQ = app.QuestionRequest(subject="Math", curriculum="GCSE", chapter_num=1, topic="Fractions",
+                          difficulty="Easy", num_questions=3)
+FEWSHOTS = [{"question": "Simplify 6/8.", "answer": "3/4", "hint": "Divide by 2.", "difficulty": "Easy"}]
+
+
+QUESTIONS = {
+    1: "Simplify the fraction 18/24 fully.",
+    2: "A train leaves at 09:40 and arrives at 11:15. How long is the journey?",
+    3: "Expand and simplify (x + 3)(x - 5).",
+    4: "Write 0.000452 in standard form.",
+}
+
+
+def _q(n):
+    return {"question": QUESTIONS[n], "answer": str(n)}
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """Fake LLM stream and markdown pass; records when items were yielded and emitted."""
+    log = []
+    replies = []
+
+    async def fake_stream(prompt, use_cache=True, cache_variant=None, with_source=False):
+        for item in replies.pop(0):
+            await asyncio.sleep(0.01)
+            log.append(("yield", item["question"]))
+            yield (item, False)
+
+    async def fake_markdown(items):
+        return [{"question_markdown": f"**{item['question']}**", "answer_markdown": item["answer"]}
+                for item in items]
+
+    index = NearDuplicateIndex(history_path=str(tmp_path / "history.jsonl"))
+    index.load(frames=[])
+    monkeypatch.setattr(app, "llm_stream", fake_stream)
+    monkeypatch.setattr(app, "agenerate_markdown", fake_markdown)
+    monkeypatch.setattr(app, "near_duplicates", index)
+    monkeypatch.setattr(app, "DEDUP_MODE", "drop")
+    monkeypatch.setattr(app, "FEWSHOT_SAMPLING", "stable")
+    return replies, log
+
+
+def _run(emit_log):
+    async def emit(index, item, md):
+        emit_log.append(("emit", item["question"]))
+    return asyncio.run(app._stream_items(REQ, FEWSHOTS, lambda: FEWSHOTS, emit))
+
+
+def test_items_are_emitted_while_the_reply_streams(pipeline):
+    replies, log = pipeline
+    replies.append([_q(1), _q(2), _q(3)])
+
+    generated, markdown = _run(log)
+
+    assert generated == [_q(1), _q(2), _q(3)]
+    assert markdown[0] == {"question_markdown": f"**{_q(1)['question']}**", "answer_markdown": "1"}
+    # the first question is emitted before the model has finished the reply
+    assert log.index(("emit", _q(1)["question"])) < log.index(("yield", _q(3)["question"]))
+
+
+def test_near_duplicates_are_dropped_and_replaced(pipeline):
+    replies, log = pipeline
+    replies.append([_q(1), _q(1), _q(2)])   # second item repeats the first
+    replies.append([_q(4)])                 # replacement for the dropped slot
+
+    generated, markdown = _run(log)
+
+    assert generated == [_q(1), _q(2), _q(4)]
+    assert len(markdown) == 3
+    assert [q for kind, q in log if kind == "emit"] == [_q(1)["question"], _q(2)["question"], _q(4)["question"]]
+    assert replies == []
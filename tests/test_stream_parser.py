@@ -0,0 +1,50 @@
+import json
+
+from stream_parser import JsonArrayStreamParser
+
+ITEMS = [
+    {"question": "What is {x} in \"2x = 4\"?", "answer": "x = 2 [since 4/2]"},
+    {"question": "Escaped \\\" quote and } brace", "answer": "none", "options": [1, {"a": 2}]},
+]
+
+
+def _feed_all(parser, text, step):
+    items = []
+    for i in range(0, len(text), step):
+        items.extend(parser.feed(text[i:i + step]))
+    return items
+
+
+def test_objects_arrive_one_character_at_a_time():
+    text = json.dumps(ITEMS)
+    parser = JsonArrayStreamParser()
+    assert _feed_all(parser, text, 1) == ITEMS
+    assert parser.text == text
+
+
+def test_object_is_returned_as_soon_as_it_closes():
+    text = json.dumps(ITEMS)
+    first_end = text.index("}, {") + 1
+    parser = JsonArrayStreamParser()
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [ITEMS[0]]
+    assert parser.feed(text[first_end:]) == [ITEMS[1]]
+
+
+def test_fences_and_prose_around_the_list_are_ignored():
+    text = "Here you go {not json}:\n```json\n" + json.dumps(ITEMS, indent=2) + "\n```\nDone."
+    for step in (1, 7, len(text)):
+        assert _feed_all(JsonArrayStreamParser(), text, step) == ITEMS
+
+
+def test_malformed_object_is_skipped():
+    text = '[{"question": "ok", "answer": "1"}, {"question": oops}, {"question": "next", "answer": "2"}]'
+    assert _feed_all(JsonArrayStreamParser(), text, 5) == [
+        {"question": "ok", "answer": "1"}, {"question": "next", "answer": "2"},
+    ]
+
+
+def test_none_chunk_is_ignored():
+    parser = JsonArrayStreamParser()
+    assert parser.feed(None) == []
+    assert parser.feed('[{"a": 1}]') == [{"a": 1}]
@@ -0,0 +1,66 @@
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import corpus
+import fewshot
+from frame_cache import frame_cache
+from warmup import Warmup
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def curated(tmp_path, monkeypatch):
+    """A one-workbook curated_excels/ and an empty compiled corpus under tmp_path."""
+    src = tmp_path / "curated"
+    (src / "Math").mkdir(parents=True)
+    shutil.copy2(ROOT / "curated_excels" / "Math" / "Math Chapter 1.xlsx", src / "Math")
+    monkeypatch.setattr(fewshot, "CURATED_DIR", src)
+    monkeypatch.setattr(corpus, "CORPUS_DIR", tmp_path / "compiled")
+    frame_cache.clear()
+    yield src / "Math" / "Math Chapter 1.xlsx"
+    frame_cache.clear()
+
+
+def _indexed(df):
+    return (id(df), "Topic Name", "Difficulty Level") in fewshot._index_cache
+
+
+def test_warmup_loads_and_indexes_every_frame(curated):
+    misses = frame_cache.stats()["misses"]
+    Warmup(workers=1).run()
+
+    sheets = corpus.read_sheet_names(curated)
+    assert sheets == pd.ExcelFile(curated, engine="openpyxl").sheet_names
+    frames = [fewshot._read_excel_cached(curated, sheet_name=sheet) for sheet in [None] + sheets]
+    topic_frames = [df for df in frames if "Topic Name" in df.columns]
+    assert topic_frames and all(_indexed(df) for df in topic_frames)
+    assert frame_cache.stats()["misses"] - misses == len(sheets) + 1
+
+
+def test_warm_start_does_not_open_the_workbook(curated, monkeypatch):
+    fewshot.compile_workbook(curated)
+
+    def no_openpyxl(*args, **kwargs):
+        raise AssertionError("workbook opened although the compiled corpus is fresh")
+
+    monkeypatch.setattr(pd, "ExcelFile", no_openpyxl)
+    monkeypatch.setattr(pd, "read_excel", no_openpyxl)
+    warm = Warmup(workers=1)
+    warm.run()
+    assert warm.errors == {}
+    assert warm.files[str(curated)]["frames"] == len(corpus.read_sheet_names(curated)) + 1
+
+
+def test_sheet_manifest_is_ignored_once_the_workbook_changes(curated):
+    fewshot.compile_workbook(curated)
+    manifest = corpus.manifest_path(curated)
+    stamp = curated.stat().st_mtime
+    os.utime(manifest, (stamp - 10, stamp - 10))  # workbook saved after it was compiled
+    assert corpus.read_sheet_names(curated) is None
+    assert fewshot.sheet_names(curated) == pd.ExcelFile(curated, engine="openpyxl").sheet_names
+    assert corpus.read_sheet_names(curated) is not None
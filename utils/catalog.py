@@ -0,0 +1,144 @@
+# catalog.py
+"""
+In-memory registry of the static_data topic/chapter JSONs behind the dropdown
+endpoints (/math_topics, /math_chapters_alevel, /science_chapters, /science_topics).
+
+All files are parsed once into case-folded lookup dicts; `snapshot()` re-stats the
+directory at most every CATALOG_CHECK_INTERVAL seconds and rebuilds only when a
+file was added, removed or its mtime changed. Snapshots are immutable and swapped
+as a whole, so readers never see a half-reloaded catalog.
+
+Catalogs rebuilt while the server runs (curated_watcher) are written to
+CATALOG_RUNTIME_DIR (default compiled_corpus/catalog, not tracked by git) rather
+than static_data; a file there is used instead of its static_data namesake when it
+is newer.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+STATIC_DIR = Path("static_data")
+RUNTIME_DIR = Path(os.getenv("CATALOG_RUNTIME_DIR", "compiled_corpus/catalog"))
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "2"))
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "300"))  # Cache-Control max-age for the endpoints
+
+MATH_GCSE_FILE = "math_topics_gcse.json"
+MATH_ALEVEL_FILE = "math_topics_alevel.json"
+MATH_ALEVEL_CHAPTERS_FILE = "math_chapters_alevel.json"
+
+
+def fold(value) -> str:
+    return str(value or "").strip().casefold()
+
+
+def etag_for(payload) -> str:
+    """Weak ETag of a JSON-serializable response body."""
+    body = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return 'W/"' + hashlib.sha1(body.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+class CatalogSnapshot:
+    """Parsed catalog files. Missing files are simply absent; unreadable ones are listed in `errors`."""
+
+    def __init__(self, files: dict, mtimes: dict):
+        self.mtimes = mtimes
+        self.errors = {}
+        self.math_gcse = None        # "chapter number" -> [topics]
+        self.math_alevel = None      # folded chapter -> (chapter, [topics])
+        self.alevel_topic_chapters = None
+        self.alevel_chapters = None  # contents of math_chapters_alevel.json
+        self.science = {}            # (folded subject, folded curriculum) -> {"chapters", "by_chapter"}
+
+        for name, path in files.items():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except Exception as e:
+                self.errors[name] = str(e)
+                continue
+            if name == MATH_GCSE_FILE:
+                self.math_gcse = {str(k).strip(): list(v) for k, v in data.items()}
+            elif name == MATH_ALEVEL_FILE:
+                self.alevel_topic_chapters = list(data.keys())
+                self.math_alevel = {fold(k): (k, list(v)) for k, v in data.items()}
+            elif name == MATH_ALEVEL_CHAPTERS_FILE:
+                self.alevel_chapters = data
+            elif "_topics_" in name:
+                subject, _, curriculum = name[:-len(".json")].partition("_topics_")
+                by_chapter = {}
+                for chapter, entry in data.items():
+                    entry = entry or {}
+                    by_chapter.setdefault(fold(chapter), (
+                        chapter,
+                        list(entry.get("topics", []) or []),
+                        list(entry.get("question_types", []) or []),
+                    ))
+                self.science[(fold(subject), fold(curriculum))] = {
+                    "file": name,
+                    "chapters": list(data.keys()),
+                    "by_chapter": by_chapter,
+                }
+
+    def alevel_topics(self, chapter_name):
+        """(chapter, topics) for an A-level chapter, matched case-insensitively."""
+        return self.math_alevel.get(fold(chapter_name), (chapter_name, []))
+
+    def science_entry(self, subject, curriculum):
+        return self.science.get((fold(subject), fold(curriculum)))
+
+
+class CatalogRegistry:
+    def __init__(self, static_dir: Path = STATIC_DIR, runtime_dir: Path = RUNTIME_DIR,
+                 check_interval: float = CATALOG_CHECK_INTERVAL):
+        self.static_dir = static_dir
+        self.runtime_dir = runtime_dir
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _files(self):
+        """{file name: (path, mtime)}, taking the newer of the static_data and runtime copies."""
+        files = {}
+        for directory in (self.static_dir, self.runtime_dir):
+            for path in sorted(directory.glob("*.json")):
+                try:
+                    mtime = path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if path.name not in files or mtime > files[path.name][1]:
+                    files[path.name] = (path, mtime)
+        return files
+
+    def _mtimes(self):
+        return {name: (str(path), mtime) for name, (path, mtime) in self._files().items()}
+
+    def load(self):
+        """(Re)build the snapshot from disk unconditionally."""
+        with self._lock:
+            files = self._files()
+            self._snapshot = CatalogSnapshot({name: path for name, (path, _) in files.items()},
+                                             {name: (str(path), mtime) for name, (path, mtime) in files.items()})
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+            for name, err in self._snapshot.errors.items():
+                print(f"[catalog] failed to read {name}: {err}")
+            return self._snapshot
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Current snapshot, reloaded first if any catalog JSON changed on disk."""
+        snap = self._snapshot
+        if snap is None:
+            return self.load()
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return snap
+        with self._lock:
+            self._checked_at = time.monotonic()
+            changed = self._mtimes() != snap.mtimes
+        return self.load() if changed else snap
+
+
+catalog = CatalogRegistry()
@@ -0,0 +1,210 @@
+# catalog_builder.py
+"""
+Builds the static_data topic catalogs from curated_excels (run scripts/build_catalog.py).
+
+    math_topics_gcse.json        {"<chapter number>": [topics]}          Math/Math Chapter <n>.xlsx
+    math_topics_alevel.json      {"<sheet>": [topics]}                   Math/A Level Math.xlsx
+    physics_topics_gcse.json     {"<chapter>": {"topics", "question_types"}}  Physics/*.xlsx
+    Chemistry_topics_gcse.json   {"<chapter>": {"topics", "question_types"}}  Chemistry/*.xlsx
+
+Each workbook is parsed in a worker process (spawned: the server calls this from
+threaded processes, where fork is not safe). static_data/catalog_manifest.json keeps
+the sha256 and the extracted entry of every workbook, so a rebuild only parses the
+workbooks whose content changed. Outputs are written atomically and only when their
+content changes, so the server's catalog does not reload for nothing.
+math_chapters_alevel.json is maintained by hand and left alone. Chapters of an output
+that no workbook has ever produced (hand-curated ones) are carried over from the existing
+file; a chapter whose workbook was removed is dropped. Chemistry keeps topic and question
+type names exactly as the workbooks spell them, as its catalog always has.
+
+The running server rebuilds into catalog.RUNTIME_DIR instead of the git-tracked
+static_data (see curated_watcher); its first build there starts from static_data's
+manifest (`seed_dir`), so only the workbooks changed since then are parsed.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+CURATED_DIR = Path("curated_excels")
+STATIC_DIR = Path("static_data")
+MANIFEST_FILE = "catalog_manifest.json"
+MANIFEST_VERSION = 2
+
+# output file -> (kind, glob under CURATED_DIR)
+OUTPUTS = {
+    "math_topics_gcse.json": ("math_gcse", "Math/Math Chapter *.xls*"),
+    "math_topics_alevel.json": ("math_alevel", "Math/A Level Math.xls*"),
+    "physics_topics_gcse.json": ("science", "Physics/*.xls*"),
+    "Chemistry_topics_gcse.json": ("science_verbatim", "Chemistry/*.xls*"),
+}
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _unique_strings(values, sort=False, strip=True):
+    """Stripped (unless strip=False), non-empty, de-duplicated strings in first-seen order (or sorted)."""
+    seen = {}
+    for v in values:
+        if pd.isna(v):
+            continue
+        s = str(v).strip() if strip else str(v)
+        if s.strip() and s.strip().lower() != "nan":
+            seen.setdefault(s, None)
+    return sorted(seen) if sort else list(seen)
+
+
+def _topic_column(df):
+    df.columns = [str(c).strip() for c in df.columns]
+    return df["Topic Name"] if "Topic Name" in df.columns else None
+
+
+def extract(kind: str, path: str):
+    """
+    Parse one workbook into the entries it contributes to its output file, as a
+    {key: value} dict. Runs in a worker process.
+    """
+    path = Path(path)
+    if kind == "math_gcse":
+        chapter = re.search(r"(\d+)", path.stem).group(1)
+        topics = _topic_column(pd.read_excel(path, engine="openpyxl"))
+        if topics is None:
+            print(f"Warning: 'Topic Name' not found in {path}")
+        return {chapter: _unique_strings(topics if topics is not None else [])}
+    if kind == "math_alevel":
+        out = {}
+        for sheet, df in pd.read_excel(path, sheet_name=None, engine="openpyxl").items():
+            topics = _topic_column(df)
+            if topics is None:
+                print(f"Warning: sheet '{sheet}' of {path} has no 'Topic Name' column")
+            out[sheet] = _unique_strings(topics if topics is not None else [])
+        return out
+    if kind in ("science", "science_verbatim"):
+        from fewshot import read_science_workbook
+        df = read_science_workbook(path)
+        chapter = re.sub(r"^\w+ Chapter ", "", path.stem).strip()
+        strip = kind == "science"
+        topics = _unique_strings(df["Subtopic"] if "Subtopic" in df.columns else [], sort=True, strip=strip)
+        qtypes = _unique_strings(df["Question type"] if "Question type" in df.columns else [], sort=True,
+                                 strip=strip)
+        if not topics or not qtypes:
+            print(f"Warning: {path} has no Subtopic/Question type values")
+            return {}
+        return {chapter: {"topics": topics, "question_types": qtypes}}
+    raise ValueError(f"unknown catalog kind {kind!r}")
+
+
+def _sort_key(kind: str, key: str):
+    return (int(key), "") if kind == "math_gcse" else (0, key)
+
+
+def write_json_atomic(path: Path, data) -> bool:
+    """Write `data` to `path` via a temp file + rename; False if the content was already the same."""
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    try:
+        if path.read_text(encoding="utf-8") == text:
+            return False
+    except FileNotFoundError:
+        pass
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+    return True
+
+
+def _read_json(path: Path):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _read_manifest(path: Path):
+    manifest = _read_json(path)
+    return manifest if manifest and manifest.get("version") == MANIFEST_VERSION else None
+
+
+def build_catalog(curated_dir: Path = CURATED_DIR, static_dir: Path = STATIC_DIR,
+                  workers: int = None, force: bool = False, seed_dir: Path = None, mp_context=None):
+    """
+    Rebuild the catalog JSONs into static_dir; returns {"parsed", "skipped", "failed",
+    "written"} counts. Without a manifest in static_dir, the one in seed_dir is used.
+    """
+    start = time.perf_counter()
+    static_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = static_dir / MANIFEST_FILE
+    manifest = _read_manifest(manifest_path)
+    if manifest is None and seed_dir is not None:
+        manifest = _read_manifest(seed_dir / MANIFEST_FILE)
+    previous = (manifest or {}).get("sources", {})
+
+    sources, todo = {}, []
+    for output, (kind, pattern) in OUTPUTS.items():
+        for path in sorted(curated_dir.glob(pattern)):
+            if path.name.startswith("~$"):
+                continue
+            rel = path.relative_to(curated_dir).as_posix()
+            digest = file_hash(path)
+            old = previous.get(rel)
+            if not force and old and old["sha256"] == digest and old["output"] == output:
+                sources[rel] = old
+            else:
+                sources[rel] = {"sha256": digest, "output": output, "entries": None}
+                todo.append((rel, kind, path))
+
+    failed = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers or min(len(todo), os.cpu_count() or 1),
+                                 mp_context=mp_context or multiprocessing.get_context("spawn")) as pool:
+            futures = {rel: pool.submit(extract, kind, str(path)) for rel, kind, path in todo}
+            for rel, future in futures.items():
+                try:
+                    sources[rel]["entries"] = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Error processing {rel}: {e}")
+                    old = previous.get(rel)
+                    if old and old.get("entries") is not None:
+                        sources[rel] = old  # keep the last good entries rather than dropping the chapter
+                    else:
+                        del sources[rel]
+
+    # keys some workbook produced at some point; anything else in an output was curated by hand
+    generated = {(source["output"], key) for source in [*previous.values(), *sources.values()]
+                 for key in source.get("entries") or {}}
+
+    written = 0
+    for output, (kind, _) in OUTPUTS.items():
+        data = {}
+        for rel, source in sources.items():
+            if source["output"] == output:
+                data.update(source["entries"] or {})
+        existing = _read_json(static_dir / output)
+        if existing is None and seed_dir is not None:
+            existing = _read_json(seed_dir / output)
+        for key, value in (existing or {}).items():
+            if (output, key) not in generated:
+                data.setdefault(key, value)
+        if kind != "math_alevel":  # A-level keeps the workbook's sheet order
+            data = {k: data[k] for k in sorted(data, key=lambda k: _sort_key(kind, k))}
+        if write_json_atomic(static_dir / output, data):
+            written += 1
+            print(f"Wrote {len(data)} entries -> {static_dir / output}")
+
+    write_json_atomic(manifest_path, {"version": MANIFEST_VERSION, "sources": sources})
+    stats = {"parsed": len(todo) - failed, "skipped": len(sources) - len(todo) + failed, "failed": failed,
+             "written": written}
+    print(f"Catalog build: {stats} in {time.perf_counter() - start:.1f}s")
+    return stats
@@ -0,0 +1,113 @@
+# chunking.py
+"""
+Chunked generation: split a large num_questions into concurrent sub-requests,
+retry only the chunks whose reply could not be parsed, then merge and drop
+near-duplicate questions, topping up with extra chunks when too few are left.
+"""
+import asyncio
+import os
+import re
+
+GENERATION_CHUNK_SIZE = int(os.getenv("GENERATION_CHUNK_SIZE", "10"))
+CHUNK_RETRIES = int(os.getenv("GENERATION_CHUNK_RETRIES", "2"))
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+
+
+def split_counts(num_questions: int, chunk_size: int):
+    """
+    Split num_questions into near-equal chunk sizes no larger than chunk_size.
+    split_counts(25, 10) -> [9, 8, 8]
+    """
+    n_chunks = max(1, -(-num_questions // max(1, chunk_size)))
+    base, extra = divmod(num_questions, n_chunks)
+    return [base + (1 if i < extra else 0) for i in range(n_chunks)]
+
+
+def chunk_failed(result) -> bool:
+    """True for an exception or the llm_engine "Parsing failed" fallback reply."""
+    if isinstance(result, BaseException) or not isinstance(result, list):
+        return True
+    return any(not isinstance(item, dict) or item.get("answer") == "Parsing failed" for item in result)
+
+
+def _shingles(text: str):
+    text = re.sub(r"[^a-z0-9]+", " ", str(text).lower()).split()
+    if len(text) < 3:
+        return set(text)
+    return {" ".join(text[i:i + 3]) for i in range(len(text) - 2)}
+
+
+def dedupe_questions(items, threshold: float = DUPLICATE_THRESHOLD):
+    """
+    Drop items whose question is a near-duplicate (word 3-gram Jaccard >= threshold)
+    of an earlier item. Order of the kept items is preserved.
+    """
+    kept, kept_shingles = [], []
+    for item in items:
+        sh = _shingles(item.get("question", ""))
+        duplicate = False
+        for other in kept_shingles:
+            union = len(sh | other)
+            if union and len(sh & other) / union >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(item)
+            kept_shingles.append(sh)
+    return kept
+
+
+async def generate_in_chunks(num_questions: int, chunk_size: int, run_chunk, retries: int = CHUNK_RETRIES):
+    """
+    Run `await run_chunk(count, chunk_index)` for every chunk concurrently and merge the
+    results. Failed chunks (exception or unparseable reply) are retried up to `retries`
+    times; chunks that still fail are left out. If every chunk fails, the last failure
+    is re-raised (exception) or returned (parse-failure fallback) unchanged. Questions
+    lost to deduplication are requested again in up to `retries` extra chunks (indexes
+    after the last regular chunk).
+    """
+    counts = split_counts(num_questions, chunk_size)
+    results = list(await asyncio.gather(
+        *(run_chunk(c, i) for i, c in enumerate(counts)), return_exceptions=True
+    ))
+
+    for _ in range(retries):
+        failed = [i for i, r in enumerate(results) if chunk_failed(r)]
+        if not failed:
+            break
+        print(f"[generate:chunked] retrying {len(failed)}/{len(counts)} chunks")
+        retried = await asyncio.gather(
+            *(run_chunk(counts[i], i) for i in failed), return_exceptions=True
+        )
+        for i, r in zip(failed, retried):
+            results[i] = r
+
+    merged = []
+    for r in results:
+        if not chunk_failed(r):
+            merged.extend(r)
+    if not merged:
+        last = results[-1]
+        if isinstance(last, BaseException):
+            raise last
+        return last
+
+    unique = dedupe_questions(merged)
+    if len(unique) < len(merged):
+        print(f"[generate:chunked] dropped {len(merged) - len(unique)} near-duplicate questions")
+
+    # top up what dedup dropped; chunks that kept failing have had their retries
+    target = min(num_questions, len(merged))
+    for attempt in range(retries):
+        missing = target - len(unique)
+        if missing <= 0:
+            break
+        print(f"[generate:chunked] topping up {missing} questions")
+        try:
+            extra = await run_chunk(missing, len(counts) + attempt)
+        except Exception as e:
+            print(f"[generate:chunked] top-up chunk failed: {e}")
+            continue
+        if not chunk_failed(extra):
+            unique = dedupe_questions(unique + extra)
+    return unique[:num_questions]
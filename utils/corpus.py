@@ -0,0 +1,180 @@
+# corpus.py
+"""
+Compiled few-shot corpus.
+
+`scripts/generate_fewshot_corpus.py` converts every workbook under curated_excels/
+into Arrow IPC (Feather v2) files under compiled_corpus/, one file per loadable
+frame. The loaders in fewshot.py read those files first and only fall back to
+openpyxl when the compiled copy is missing or older than its source workbook.
+
+The files are uncompressed, so with CORPUS_MMAP=1 (default) they are memory-mapped
+and wrapped zero-copy as Arrow-backed (pd.ArrowDtype) frames: every worker process
+mapping a file shares the same page-cache pages instead of holding a private copy.
+A rebuilt file replaces the old one by rename, so frames already mapped keep
+reading the old version until they are dropped.
+
+Next to the frames of a Math workbook, a small JSON manifest records its sheet
+names, so listing the sheets does not open the workbook with openpyxl again.
+"""
+import json
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+CURATED_DIR = Path("curated_excels")
+CORPUS_DIR = Path("compiled_corpus")
+CORPUS_SUFFIX = ".arrow"
+MANIFEST_SUFFIX = ".manifest.json"
+CORPUS_MMAP = os.getenv("CORPUS_MMAP", "1") == "1"
+
+
+@contextmanager
+def build_lock():
+    """
+    Exclusive lock shared by every process that compiles into CORPUS_DIR or rebuilds
+    the indexes derived from it (no-op without fcntl).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+    with open(CORPUS_DIR / ".build.lock", "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def try_role_lock(role: str):
+    """
+    Claim a role only one process should fill (e.g. the curated_excels watcher): a
+    non-blocking exclusive lock on CORPUS_DIR/.<role>.lock. Returns the open lock file,
+    held until it is closed or the process exits, or None while another process holds
+    it. Without fcntl every process gets the role.
+    """
+    CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+    fh = open(CORPUS_DIR / f".{role}.lock", "a")
+    try:
+        import fcntl
+    except ImportError:
+        return fh
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    return fh
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalize a freshly parsed sheet so the Excel and compiled paths yield the same frame:
+    - strip column names
+    - drop empty padding columns ("Unnamed: N" with no values) and fully empty rows
+    - store mixed-type object columns as strings (Arrow needs one type per column)
+    """
+    df.columns = [str(c).strip() for c in df.columns]
+    padding = [c for c in df.columns if c.startswith("Unnamed:") and df[c].isna().all()]
+    if padding:
+        df = df.drop(columns=padding)
+    df = df.dropna(how="all").reset_index(drop=True)
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(lambda v: None if pd.isna(v) else str(v))
+    return df
+
+
+def _safe_key(s: str) -> str:
+    return re.sub(r"[\/\\\:\*\?\"\<\>\|]", "_", str(s)).strip()
+
+
+def compiled_path(source: Path, sheet_name=None) -> Path:
+    """
+    Location of the compiled frame for `source` (and optionally one sheet of it).
+    curated_excels/Math/A Level Math.xlsx, sheet "Circles"
+        -> compiled_corpus/Math/A Level Math__Circles.arrow
+    """
+    name = source.stem if sheet_name is None else f"{source.stem}__{_safe_key(sheet_name)}"
+    return CORPUS_DIR / source.parent.name / f"{name}{CORPUS_SUFFIX}"
+
+
+def is_fresh(source: Path, sheet_name=None) -> bool:
+    target = compiled_path(source, sheet_name)
+    try:
+        return target.stat().st_mtime >= source.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def manifest_path(source: Path) -> Path:
+    """compiled_corpus/Math/Math Chapter 1.manifest.json for curated_excels/Math/Math Chapter 1.xlsx"""
+    return CORPUS_DIR / source.parent.name / f"{source.stem}{MANIFEST_SUFFIX}"
+
+
+def read_sheet_names(source: Path):
+    """Sheet names recorded for `source`, or None when its manifest is missing or stale."""
+    path = manifest_path(source)
+    try:
+        if path.stat().st_mtime < source.stat().st_mtime:
+            return None
+        return list(json.loads(path.read_text(encoding="utf-8"))["sheets"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_sheet_names(source: Path, sheets) -> Path:
+    """Record the sheet names of `source` (temp file + rename, like write_compiled)."""
+    target = manifest_path(source)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(f"{target.suffix}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps({"sheets": list(sheets)}, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(target)
+    return target
+
+
+def read_mapped(path: Path) -> pd.DataFrame:
+    """Arrow-backed frame over a memory-mapped Arrow IPC file (no copy into process memory)."""
+    import pyarrow as pa
+
+    with pa.memory_map(str(path), "r") as source:
+        # the table's buffers keep the mapping alive after the file object is closed
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def load_compiled(source: Path, sheet_name=None):
+    """
+    Return the compiled frame for `source`, or None when there is no usable copy
+    (missing, stale, or pyarrow not installed).
+    """
+    if not is_fresh(source, sheet_name):
+        return None
+    try:
+        if CORPUS_MMAP:
+            return read_mapped(compiled_path(source, sheet_name))
+        return pd.read_feather(compiled_path(source, sheet_name))
+    except ImportError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable compiled corpus file for {source.name}: {e}")
+        return None
+
+
+def write_compiled(df: pd.DataFrame, source: Path, sheet_name=None) -> Path:
+    """
+    Write `df` as the compiled copy of `source`. Written to a temp file and renamed
+    so a concurrent reader never sees a half-written file.
+    """
+    target = compiled_path(source, sheet_name)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # per-process temp name: several server workers may compile the same workbook at once
+    tmp = target.with_suffix(f"{target.suffix}.{os.getpid()}.tmp")
+    df.reset_index(drop=True).to_feather(tmp, compression="uncompressed")
+    tmp.replace(target)
+    return target
@@ -0,0 +1,335 @@
+# curated_watcher.py
+"""
+Hot reload of curated_excels/ while the server runs.
+
+A background task waits for changes under curated_excels/ (inotify on Linux through
+ctypes, otherwise polling every WATCH_INTERVAL seconds), lets a burst of writes settle
+for WATCH_DEBOUNCE seconds and then compares every workbook's (mtime, size) with what
+it saw last. For the workbooks that changed:
+- their compiled corpus copies are rebuilt in a worker process (openpyxl parsing is
+  CPU-bound and would otherwise hold the GIL against request threads), followed by
+  the incremental catalog build (only changed workbooks are re-parsed; written to
+  catalog.RUNTIME_DIR, never to the git-tracked static_data) and, if one was built,
+  an incremental semantic index update (only the changed frames are embedded)
+- their frames are loaded into frame_cache, replacing the stale entries, and their
+  FewshotIndexes are built; new curated questions go into the near-duplicate index
+- the topic catalog snapshot is reloaded
+
+Each piece is swapped in as a whole, so a request sees either the old or the new
+version. Requests never wait for a reload; one that arrives first still finds the
+new mtime and loads the frame itself, as before.
+
+With several uvicorn workers only one watches: the watcher role is a non-blocking
+lock (corpus.try_role_lock), so a single worker compiles and rebuilds while the
+others keep picking up the new files lazily through the mtime checks. A worker that
+did not get the role retries every WATCH_INTERVAL seconds and takes over when the
+watching worker exits.
+
+Configured through environment variables:
+    WATCH_ENABLED    "0" to disable the watcher (default "1")
+    WATCH_BACKEND    "auto" (inotify if available), "inotify" or "poll" (default "auto")
+    WATCH_INTERVAL   seconds between polls; with inotify, between safety-net rescans (default 5)
+    WATCH_DEBOUNCE   quiet seconds to wait after a change before reloading (default 1)
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from catalog import RUNTIME_DIR, STATIC_DIR, catalog
+from catalog_builder import build_catalog
+from corpus import CURATED_DIR, build_lock, try_role_lock
+from dedup import DEDUP_MODE, near_duplicates
+from fewshot import (
+    SCIENCE_SUBJECTS,
+    _read_excel_cached,
+    compile_workbook,
+    corpus_workbooks,
+    prime_fewshot_indexes,
+    read_science_workbook,
+    sheet_names,
+)
+from frame_cache import frame_cache
+from semantic_index import SEMANTIC_DIR
+
+WATCH_ENABLED = os.getenv("WATCH_ENABLED", "1") == "1"
+WATCH_BACKEND = os.getenv("WATCH_BACKEND", "auto")
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "5"))
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "1"))
+
+# inotify(7) event bits
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class Inotify:
+    """Minimal inotify binding: watch directories, tell whether anything happened."""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is Linux only")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def watch(self, directory):
+        # watching a directory again is a no-op returning the same descriptor
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), WATCH_MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def drain(self) -> bool:
+        """Consume pending events; True if there were any."""
+        seen = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return seen
+            if not data:
+                return seen
+            seen = True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _compile(path):
+    """Compile one workbook (runs in the worker process); returns its sheet names, None for science."""
+    compile_workbook(path)
+    if Path(path).parent.name in SCIENCE_SUBJECTS:
+        return None
+    return sheet_names(path)
+
+
+def _build_runtime_catalog():
+    """Incremental catalog build into RUNTIME_DIR (runs in the worker process)."""
+    return build_catalog(static_dir=RUNTIME_DIR, seed_dir=STATIC_DIR,
+                         mp_context=multiprocessing.get_context("spawn"))
+
+
+def _update_semantic_index():
+    """Embed the new or changed corpus frames into SEMANTIC_DIR (runs in the worker process)."""
+    from fewshot import iter_corpus_frames
+    from semantic_index import update_index
+
+    return update_index([df for _, _, df in iter_corpus_frames() if "Question" in df.columns])
+
+
+def _fingerprint(path):
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+class CuratedWatcher:
+    def __init__(self, root=CURATED_DIR, backend: str = WATCH_BACKEND, interval: float = WATCH_INTERVAL,
+                 debounce: float = WATCH_DEBOUNCE):
+        self.root = root
+        self.backend = backend
+        self.interval = interval
+        self.debounce = debounce
+        self._seen = {}
+        self._inotify = None
+        self._wake = None
+        self._task = None
+        self._pool = None
+        self._role = None        # lock file while this worker holds the watcher role
+        self.reloads = 0
+        self.last_reload = None
+        self.errors = {}
+
+    def _scan(self):
+        """Current (mtime, size) of every curated workbook."""
+        seen = {}
+        for path, _ in corpus_workbooks():
+            try:
+                seen[path] = _fingerprint(path)
+            except FileNotFoundError:
+                pass
+        return seen
+
+    def changes(self):
+        """(changed or new, removed) workbooks since the last call."""
+        current = self._scan()
+        changed = [path for path, fp in current.items() if self._seen.get(path) != fp]
+        removed = [path for path in self._seen if path not in current]
+        self._seen = current
+        return changed, removed
+
+    def _watch_dirs(self):
+        self._inotify.watch(self.root)
+        for directory in self.root.iterdir():
+            if directory.is_dir():
+                self._inotify.watch(directory)
+
+    def start(self):
+        self._role = try_role_lock("watcher")
+        if self._role is None:
+            print(f"[watcher] another worker watches {self.root}; retrying every {self.interval}s")
+            self._task = asyncio.create_task(self._await_role())
+            return
+        self._start_watching()
+
+    async def _await_role(self):
+        while self._role is None:
+            await asyncio.sleep(self.interval)
+            self._role = await asyncio.to_thread(try_role_lock, "watcher")
+        self._start_watching()
+
+    def _start_watching(self):
+        self._seen = self._scan()
+        if self.backend in ("auto", "inotify"):
+            try:
+                self._inotify = Inotify()
+                self._watch_dirs()
+                self._wake = asyncio.Event()
+                asyncio.get_running_loop().add_reader(self._inotify.fd, self._on_event)
+            except (OSError, AttributeError, NotImplementedError) as e:
+                if self._inotify is not None:
+                    self._inotify.close()
+                self._inotify = None
+                print(f"[watcher] inotify unavailable ({e}), polling every {self.interval}s")
+        print(f"[watcher] watching {self.root} ({'inotify' if self._inotify else 'poll'})")
+        self._task = asyncio.create_task(self._watch_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._role is not None:
+            self._role.close()
+            self._role = None
+
+    def _on_event(self):
+        if self._inotify.drain():
+            self._wake.set()
+
+    async def _wait_for_change(self):
+        if self._inotify is None:
+            await asyncio.sleep(self.interval)
+            return
+        try:
+            await asyncio.wait_for(self._wake.wait(), self.interval)
+        except asyncio.TimeoutError:
+            return
+        # debounce: Excel saves through temp files and renames, wait until it is quiet
+        while True:
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.debounce)
+            except asyncio.TimeoutError:
+                return
+
+    async def _watch_loop(self):
+        while True:
+            await self._wait_for_change()
+            try:
+                if self._inotify is not None:
+                    self._watch_dirs()  # pick up new subject folders
+                changed, removed = await asyncio.to_thread(self.changes)
+                if not changed and not removed:
+                    continue
+                if self._inotify is None:
+                    # polling saw the change mid-save at worst: give the writer time to finish
+                    await asyncio.sleep(self.debounce)
+                    more, gone = await asyncio.to_thread(self.changes)
+                    changed = sorted(set(changed + more) - set(gone))
+                    removed = sorted(set(removed + gone))
+                await asyncio.to_thread(self.reload, changed, removed)
+            except Exception as e:
+                self.errors["watch"] = str(e)
+                print(f"[watcher] reload failed: {e}")
+
+    def _run(self, fn, *args):
+        """Run fn in the worker process (spawn: forking the threaded server is not safe)."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool.submit(fn, *args).result()
+
+    def reload(self, changed, removed=()):
+        """Rebuild the derived data of `changed` workbooks and swap it in (blocking)."""
+        start = time.perf_counter()
+        sheets = {}  # compiled workbook -> its sheet names (None for science)
+        with build_lock():
+            for path in changed:
+                try:
+                    sheets[path] = self._run(_compile, str(path))
+                    self.errors.pop(str(path), None)
+                except Exception as e:
+                    self.errors[str(path)] = f"compile failed: {e}"
+                    print(f"[watcher] compiling {path} failed: {e}")
+            try:
+                self._run(_build_runtime_catalog)
+            except Exception as e:
+                self.errors["catalog"] = str(e)
+                print(f"[watcher] catalog build failed: {e}")
+            index_meta = SEMANTIC_DIR / "index.json"
+            if index_meta.exists() and any(path.stat().st_mtime > index_meta.stat().st_mtime for path in sheets):
+                try:
+                    self._run(_update_semantic_index)
+                except Exception as e:
+                    self.errors["semantic_index"] = str(e)
+                    print(f"[watcher] semantic index update failed: {e}")
+
+        frames = []
+        for path, names in sheets.items():
+            try:
+                if names is None:
+                    frames.append(_read_excel_cached(path, reader=read_science_workbook))
+                else:
+                    for sheet in [None] + names:
+                        frames.append(_read_excel_cached(path, sheet_name=sheet))
+            except Exception as e:
+                self.errors[str(path)] = f"load failed: {e}"
+                print(f"[watcher] loading {path} failed: {e}")
+        for df in frames:
+            prime_fewshot_indexes(df)
+        for path in removed:
+            frame_cache.discard(str(path.resolve()))
+        catalog.load()
+        if DEDUP_MODE != "off":
+            near_duplicates.add_curated(frames)
+
+        self.reloads += 1
+        self.last_reload = {
+            "at": time.time(),
+            "seconds": round(time.perf_counter() - start, 3),
+            "changed": [str(p) for p in changed],
+            "removed": [str(p) for p in removed],
+            "frames": len(frames),
+        }
+        print(f"[watcher] reloaded {len(sheets)} workbook(s), {len(removed)} removed, "
+              f"{len(frames)} frame(s) in {self.last_reload['seconds']}s")
+
+    def stats(self):
+        return {
+            "enabled": self._task is not None,
+            "watching": self._role is not None,
+            "backend": "inotify" if self._inotify else "poll",
+            "root": str(self.root),
+            "workbooks": len(self._seen),
+            "reloads": self.reloads,
+            "last_reload": self.last_reload,
+            "errors": self.errors,
+        }
+
+
+curated_watcher = CuratedWatcher()
@@ -0,0 +1,258 @@
+# dedup.py
+"""
+Near-duplicate filter for generated questions.
+
+Every curated `Question` cell (all curated_excels workbooks) and every question
+generated before (DEDUP_HISTORY, one JSON line per question) gets a MinHash
+signature over the character 5-grams of its normalised text. The signatures are
+banded into an LSH table, so a lookup only compares against the few entries that
+share a band, which keeps it well under a millisecond per question.
+
+A generated question whose estimated Jaccard similarity to an indexed one (or to
+an earlier question of the same reply) is >= DEDUP_THRESHOLD is dropped, or only
+flagged with DEDUP_MODE=flag. Replies served again from the generation cache were
+checked when first generated and are passed through (`replayed`); a fresh reply
+that repeats an earlier question word for word is a duplicate like any other.
+
+The history file keeps the newest DEDUP_HISTORY_MAX questions: once it has grown a
+quarter past that, it is rewritten with only the newest ones (under an exclusive
+lock, so worker processes appending to it at the same time lose nothing).
+
+Configured through environment variables:
+    DEDUP_MODE         "drop" (default), "flag" or "off"
+    DEDUP_THRESHOLD    estimated Jaccard similarity that counts as a duplicate (default 0.7)
+    DEDUP_RETRIES      follow-up requests for the dropped slots (default 2)
+    DEDUP_HISTORY      JSONL file of generated questions (default dedup_history.jsonl)
+    DEDUP_HISTORY_MAX  questions kept in the history file (default 20000)
+"""
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+from metrics import timed
+
+DEDUP_MODE = os.getenv("DEDUP_MODE", "drop")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+DEDUP_RETRIES = int(os.getenv("DEDUP_RETRIES", "2"))
+DEDUP_HISTORY = os.getenv("DEDUP_HISTORY", "dedup_history.jsonl")
+DEDUP_HISTORY_MAX = int(os.getenv("DEDUP_HISTORY_MAX", "20000"))
+
+NUM_PERM = 64
+BANDS = 16              # 16 bands x 4 rows: pairs above ~0.5 Jaccard almost always collide
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+_PRIME = np.uint64((1 << 61) - 1)
+_MASK = np.uint64(0xFFFFFFFF)
+
+_rng = np.random.default_rng(20240517)  # fixed, so signatures are comparable across runs
+_A = _rng.integers(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize(text) -> str:
+    """Lowercase letters and digits only, so "$x^2$" and "x^2" (markdown or not) compare equal."""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(text).lower()).split())
+
+
+def signature(text: str):
+    """MinHash signature (uint64[NUM_PERM]) of the character shingles of normalised `text`."""
+    if len(text) <= SHINGLE:
+        shingles = [text]
+    else:
+        shingles = {text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # h(x) = (a*x + b) mod p, kept within 32 bits so the products cannot overflow
+    return (((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME) & _MASK).min(axis=1)
+
+
+def similarity(sig_a, sig_b) -> float:
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+@contextmanager
+def _locked(path: str):
+    """Exclusive lock on `path` + ".lock" shared by all processes (no-op without fcntl)."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(f"{path}.lock", "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, history_path: str = DEDUP_HISTORY,
+                 history_max: int = DEDUP_HISTORY_MAX):
+        self.threshold = threshold
+        self.history_path = history_path
+        self.history_max = history_max
+        self._history_lines = 0
+        self._texts = []         # normalised text per entry
+        self._generated = []     # True for entries from the generation history
+        self._signatures = []
+        self._seen = set()
+        self._buckets = [dict() for _ in range(BANDS)]
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.checked = 0
+        self.flagged = 0
+
+    def _add(self, text: str, sig, generated: bool):
+        entry = len(self._texts)
+        self._seen.add(text)
+        self._texts.append(text)
+        self._generated.append(generated)
+        self._signatures.append(sig)
+        for band in range(BANDS):
+            self._buckets[band].setdefault(sig[band * ROWS:(band + 1) * ROWS].tobytes(), []).append(entry)
+
+    def _add_frames(self, frames):
+        added = 0
+        for df in frames:
+            if "Question" not in df.columns:
+                continue
+            for question in df["Question"].dropna():
+                text = normalize(question)
+                if text and text not in self._seen:
+                    self._add(text, signature(text), generated=False)
+                    added += 1
+        return added
+
+    def add_curated(self, frames):
+        """
+        Index questions of re-read curated frames that are not indexed yet (after a workbook
+        was edited). Entries of removed questions stay; before load() this is a no-op.
+        """
+        with self._lock:
+            if not self._loaded:
+                return 0
+            return self._add_frames(frames)
+
+    def load(self, frames=None):
+        """
+        Index the curated questions and the generation history once. `frames` is an
+        iterable of corpus DataFrames (default: fewshot.iter_corpus_frames()).
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            start = time.perf_counter()
+            if frames is None:
+                from fewshot import iter_corpus_frames
+                frames = (df for _, _, df in iter_corpus_frames())
+            curated = self._add_frames(frames)
+            try:
+                with open(self.history_path, encoding="utf-8") as f:
+                    for line in f:
+                        self._history_lines += 1
+                        text = normalize(json.loads(line).get("question", ""))
+                        if text and text not in self._seen:
+                            self._add(text, signature(text), generated=True)
+            except FileNotFoundError:
+                pass
+            self._loaded = True
+            print(f"[dedup] indexed {curated} curated and {len(self._texts) - curated} generated questions "
+                  f"in {time.perf_counter() - start:.2f}s")
+
+    def match(self, text: str, sig):
+        """(similarity, entry) of the most similar indexed question sharing an LSH band, or (0.0, None)."""
+        candidates = set()
+        for band in range(BANDS):
+            candidates.update(self._buckets[band].get(sig[band * ROWS:(band + 1) * ROWS].tobytes(), ()))
+        best, best_entry = 0.0, None
+        for entry in candidates:
+            score = similarity(sig, self._signatures[entry])
+            if score > best:
+                best, best_entry = score, entry
+        return best, best_entry
+
+    @timed("dedup_filter")
+    def filter(self, items, accepted=(), replayed=()):
+        """
+        Split generated items into (kept, dropped) near-duplicates of the corpus, the
+        history, `accepted` (items kept earlier for the same request) or each other.
+        Items in `replayed` (the same objects, served from the generation cache) are
+        kept unchecked, but later items are still compared with them.
+        With DEDUP_MODE=flag nothing is dropped; duplicates get "near_duplicate": true.
+        """
+        self.load()
+        kept, dropped = [], []
+        replayed_ids = {id(item) for item in replayed}
+        batch = [signature(normalize(item.get("question", ""))) for item in accepted if isinstance(item, dict)]
+        with self._lock:
+            for item in items:
+                text = normalize(item.get("question", "")) if isinstance(item, dict) else ""
+                if not text:
+                    kept.append(item)
+                    continue
+                sig = signature(text)
+                if id(item) in replayed_ids:
+                    kept.append(item)
+                    batch.append(sig)
+                    continue
+                score, _ = self.match(text, sig)
+                score = max([score] + [similarity(sig, other) for other in batch])
+                self.checked += 1
+                batch.append(sig)
+                if score < self.threshold:
+                    kept.append(item)
+                    continue
+                self.flagged += 1
+                if DEDUP_MODE == "flag":
+                    kept.append({**item, "near_duplicate": True, "similarity": round(score, 2)})
+                else:
+                    dropped.append(item)
+        return kept, dropped
+
+    def remember(self, items):
+        """Add the questions that were returned to the index and append them to the history file."""
+        lines = []
+        with self._lock:
+            for item in items:
+                text = normalize(item.get("question", "")) if isinstance(item, dict) else ""
+                if not text or text in self._seen:
+                    continue
+                self._add(text, signature(text), generated=True)
+                lines.append(json.dumps({"question": item["question"], "at": time.time()}, ensure_ascii=False))
+            if lines:
+                with _locked(self.history_path):
+                    with open(self.history_path, "a", encoding="utf-8") as f:
+                        f.write("\n".join(lines) + "\n")
+                    self._history_lines += len(lines)
+                    if self._history_lines > self.history_max * 1.25:
+                        self._compact_history()
+
+    def _compact_history(self):
+        """Keep only the newest history_max lines of the history file (caller holds the file lock)."""
+        with open(self.history_path, encoding="utf-8") as f:
+            lines = f.readlines()[-self.history_max:]
+        tmp = f"{self.history_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(tmp, self.history_path)
+        self._history_lines = len(lines)
+        print(f"[dedup] history trimmed to the newest {len(lines)} questions")
+
+    def stats(self):
+        return {
+            "mode": DEDUP_MODE,
+            "threshold": self.threshold,
+            "indexed": len(self._texts),
+            "generated_indexed": sum(self._generated),
+            "checked": self.checked,
+            "near_duplicates": self.flagged,
+        }
+
+
+near_duplicates = NearDuplicateIndex()
@@ -0,0 +1,225 @@
+# exporter.py
+"""
+Export layer for generated question sets.
+
+A finished question set is stored once under the sha256 of its content
+(EXPORT_DIR/<id>.json), so concurrent users never overwrite each other and the
+same set is stored once. Downloads render it on request into an in-memory buffer
+(xlsx through openpyxl's write-only mode, or CSV, JSON, Markdown) and stream it:
+
+    GET /exports/<id>/<name>.xlsx | .csv | .json | .md
+
+A background task deletes exports older than EXPORT_RETENTION_HOURS and then the
+oldest ones while they take more than EXPORT_MAX_MB. Only export files (<id>.json and
+their leftover temp files) are ever deleted; anything else in EXPORT_DIR is left alone.
+
+Configured through environment variables:
+    EXPORT_DIR               where exports are kept (default outputs)
+    EXPORT_RETENTION_HOURS   age after which an export is deleted (default 24)
+    EXPORT_MAX_MB            size cap of the exports in EXPORT_DIR (default 200)
+    EXPORT_CLEANUP_INTERVAL  seconds between cleanup runs (default 600)
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from openpyxl import Workbook
+
+from metrics import timed
+
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", "outputs"))
+EXPORT_RETENTION_HOURS = float(os.getenv("EXPORT_RETENTION_HOURS", "24"))
+EXPORT_MAX_MB = float(os.getenv("EXPORT_MAX_MB", "200"))
+EXPORT_CLEANUP_INTERVAL = float(os.getenv("EXPORT_CLEANUP_INTERVAL", "600"))
+
+MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "json": "application/json",
+    "md": "text/markdown; charset=utf-8",
+}
+DEFAULT_SHEET = "Sheet1"
+_ID_RE = re.compile(r"[0-9a-f]{64}")
+# files the store owns: <id>.json and the <id>.<pid>.tmp files save() writes first
+_EXPORT_FILE_RE = re.compile(r"[0-9a-f]{64}(?:\.json|\.\d+\.tmp)")
+
+
+def _sheets(data):
+    """A markdown list or a {sheet name: markdown list} dict, as the dict."""
+    return data if isinstance(data, dict) else {DEFAULT_SHEET: data}
+
+
+def _columns(items):
+    """Column names in first-seen order across all items."""
+    columns = {}
+    for item in items:
+        columns.update(dict.fromkeys(item))
+    return list(columns)
+
+
+def _cell(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def write_xlsx(data, out):
+    """Write one sheet per entry in write-only mode (rows are streamed, not kept as cells)."""
+    wb = Workbook(write_only=True)
+    for sheet_name, items in _sheets(data).items():
+        ws = wb.create_sheet(title=sheet_name)
+        columns = _columns(items)
+        ws.append(columns)
+        for item in items:
+            ws.append([_cell(item.get(c)) for c in columns])
+    wb.save(out)
+    return out
+
+
+def write_csv(data, out):
+    sheets = _sheets(data)
+    multi = len(sheets) > 1
+    columns = _columns(item for items in sheets.values() for item in items)
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")  # BOM so Excel reads UTF-8
+    writer = csv.writer(text)
+    writer.writerow((["sheet"] if multi else []) + columns)
+    for sheet_name, items in sheets.items():
+        for item in items:
+            writer.writerow(([sheet_name] if multi else []) + [_cell(item.get(c)) for c in columns])
+    text.detach()
+    return out
+
+
+def write_json(data, out):
+    out.write(json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
+    return out
+
+
+def write_markdown(data, out):
+    sheets = _sheets(data)
+    lines = []
+    for sheet_name, items in sheets.items():
+        if len(sheets) > 1:
+            lines += [f"## {sheet_name}", ""]
+        for n, item in enumerate(items, 1):
+            question = item.get("question_markdown", item.get("question", ""))
+            answer = item.get("answer_markdown", item.get("answer", ""))
+            lines += [f"**Q{n}.** {question}", "", f"**Answer:** {answer}", ""]
+    out.write("\n".join(lines).encode("utf-8"))
+    return out
+
+
+WRITERS = {"xlsx": write_xlsx, "csv": write_csv, "json": write_json, "md": write_markdown}
+
+
+@timed("render_export")
+def render(data, fmt: str) -> io.BytesIO:
+    """Render a question set into a rewound in-memory buffer."""
+    buf = WRITERS[fmt](data, io.BytesIO())
+    buf.seek(0)
+    return buf
+
+
+def export_id(data) -> str:
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def download_name(stem: str) -> str:
+    return re.sub(r"[^\w\-. ]+", "_", stem).strip() or "questions"
+
+
+class ExportStore:
+    def __init__(self, directory: Path = EXPORT_DIR, retention_hours: float = EXPORT_RETENTION_HOURS,
+                 max_mb: float = EXPORT_MAX_MB, interval: float = EXPORT_CLEANUP_INTERVAL):
+        self.directory = Path(directory)
+        self.retention = retention_hours * 3600
+        self.max_bytes = max_mb * 1024 * 1024
+        self.interval = interval
+        self._task = None
+        self.removed = 0
+
+    @timed("save_export")
+    def save(self, data, stem: str):
+        """
+        Store a question set and return {"id", "output_file", "downloads"}; output_file
+        is the xlsx download URL, downloads maps every format to its URL.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        eid = export_id(data)
+        path = self.directory / f"{eid}.json"
+        if path.exists():
+            os.utime(path)  # same content again: keep it for another retention period
+        else:
+            tmp = path.with_name(f"{eid}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+        name = download_name(stem)
+        downloads = {fmt: f"/exports/{eid}/{name}.{fmt}" for fmt in WRITERS}
+        return {"id": eid, "output_file": downloads["xlsx"], "downloads": downloads}
+
+    def load(self, eid: str):
+        """The stored question set, or None if the id is unknown or expired."""
+        if not _ID_RE.fullmatch(eid):
+            return None
+        try:
+            return json.loads((self.directory / f"{eid}.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def cleanup(self):
+        """Delete expired exports, then the oldest ones until the exports fit EXPORT_MAX_MB."""
+        if not self.directory.exists():
+            return 0
+        now = time.time()
+        files, removed = [], 0
+        for path in self.directory.iterdir():
+            if not _EXPORT_FILE_RE.fullmatch(path.name):
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if not path.is_file():
+                continue
+            if now - st.st_mtime > self.retention:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        if removed:
+            print(f"[exporter] removed {removed} export(s) from {self.directory}")
+        self.removed += removed
+        return removed
+
+    def start(self):
+        self._task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.cleanup)
+            except Exception as e:
+                print(f"[exporter] cleanup failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+export_store = ExportStore()
@@ -7,20 +7,97 @@ from pathlib import Path
 import time
 from pathlib import Path
 
-_df_cache = {}  # { (path_str, mtime) : df }
+import os
+import weakref
+
+import numpy as np
+
+from corpus import (
+    CURATED_DIR,
+    is_fresh,
+    load_compiled,
+    normalize_frame,
+    read_sheet_names,
+    write_compiled,
+    write_sheet_names,
+)
+from fewshot_index import FewshotIndex
+from frame_cache import frame_cache
+from metrics import timed
+from prompt_builder import PROMPT_LAYOUT
+from semantic_index import semantic_index
+
+_index_cache = {}  # { (id(df), group_col, sub_col) : FewshotIndex }
+_rng = np.random.default_rng()
+# "random" (default): a fresh sample per request and per chunk; "stable": the first k
+# matching rows in sheet order, so prompts for a topic share a longer prefix for the
+# provider's prompt cache. Defaults to "stable" with PROMPT_LAYOUT=cache, whose prefix
+# holds the few-shots. Stable sampling makes identical requests build identical
+# prompts, so they are answered from the generation cache with the same questions
+# unless regenerate is set.
+FEWSHOT_SAMPLING = os.getenv("FEWSHOT_SAMPLING", "stable" if PROMPT_LAYOUT == "cache" else "random")
+
+def get_fewshot_index(df: pd.DataFrame, group_col: str, sub_col: str = None) -> FewshotIndex:
+    """
+    FewshotIndex for `df`, built on first use and dropped when the frame is garbage
+    collected (e.g. after a stale cache entry is replaced).
+    """
+    key = (id(df), group_col, sub_col)
+    index = _index_cache.get(key)
+    if index is None:
+        index = FewshotIndex(df, group_col, sub_col)
+        _index_cache[key] = index
+        weakref.finalize(df, _index_cache.pop, key, None)
+    return index
+
+def prime_fewshot_indexes(df: pd.DataFrame):
+    """Build the FewshotIndexes the selectors will ask for on `df` ahead of the first request."""
+    if "Topic Name" in df.columns:
+        get_fewshot_index(df, "Topic Name", "Difficulty Level")
+    if "Question type" in df.columns:
+        get_fewshot_index(df, "Question type", "Subtopic" if "Subtopic" in df.columns else None)
 
-def _read_excel_cached(path: Path, sheet_name=None):
-    key = (str(path.resolve()), None if sheet_name is None else sheet_name, path.stat().st_mtime)
-    if key in _df_cache:
-        return _df_cache[key]
-    # read
+def _sample_rows(rows: np.ndarray, k: int):
+    """Up to k distinct row positions from `rows`: the first k, or a random sample (FEWSHOT_SAMPLING)."""
+    k = min(k, len(rows))
+    if FEWSHOT_SAMPLING == "stable":
+        return np.sort(rows)[:k]
+    return _rng.choice(rows, size=k, replace=False)
+
+def _read_sheet(path: Path, sheet_name=None):
+    """Parse one sheet (first sheet when sheet_name is None) straight from Excel."""
     if sheet_name is None:
         df = pd.read_excel(path, engine="openpyxl")
     else:
         df = pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl")
-    df.columns = [str(c).strip() for c in df.columns]
-    _df_cache[key] = df
-    return df
+    return normalize_frame(df)
+
+def _read_excel_cached(path: Path, sheet_name=None, reader=None):
+    """
+    Frame for a workbook (sheet) through frame_cache, reloaded when the file's mtime changes.
+    `reader(path, sheet_name)` parses the workbook when no fresh compiled copy exists
+    (defaults to read_science_workbook for Physics/Chemistry, else a plain single-sheet
+    read: the cache and compiled copy are keyed by path and sheet only, so every caller
+    must read a workbook the same way). A parsed frame is compiled right away and
+    mapped back, so this and every other worker process share one copy of it.
+    """
+    if reader is None and sheet_name is None and path.parent.name in SCIENCE_SUBJECTS:
+        reader = read_science_workbook
+    def load():
+        # prefer the compiled corpus; parse the workbook only if it is missing or stale
+        df = load_compiled(path, sheet_name)
+        if df is None:
+            df = (reader or _read_sheet)(path, sheet_name)
+            try:
+                write_compiled(df, path, sheet_name)
+                mapped = load_compiled(path, sheet_name)
+                if mapped is not None:
+                    df = mapped
+            except Exception as e:
+                print(f"⚠️ Could not compile {path.name} [{sheet_name}]: {e}")
+        return df
+
+    return frame_cache.get(str(path.resolve()), sheet_name, path.stat().st_mtime, load)
 
 def detect_header_row(raw_df, expected_keywords=None, max_search_rows=8):
     """
@@ -48,12 +125,14 @@ def detect_header_row(raw_df, expected_keywords=None, max_search_rows=8):
     return None
 
 # use _read_excel_cached inside load_excel / load_alevel_sheet:
+@timed("load_excel")
 def load_excel(chapter_num:int):
     file_path = Path("curated_excels") / "Math" / f"Math Chapter {chapter_num}.xlsx"
     if not file_path.exists():
         raise FileNotFoundError(f"Excel file not found: {file_path}")
     return _read_excel_cached(file_path)
 
+@timed("load_alevel_sheet")
 def load_alevel_sheet(sheet_name: str):
     file_path = Path("curated_excels") / "Math" / f"A Level Math.xlsx"
     if not file_path.exists():
@@ -65,6 +144,7 @@ def _safe_str(x):
         return ""
     return str(x).strip()
 
+@timed("_select_fewshots_from_df")
 def _select_fewshots_from_df(df: pd.DataFrame, topic: str, difficulty: str, k: int = 10):
     """
     Core selection routine - filters by 'Topic Name' and 'Difficulty Level' columns.
@@ -73,28 +153,34 @@ def _select_fewshots_from_df(df: pd.DataFrame, topic: str, difficulty: str, k: i
     if "Topic Name" not in df.columns:
         raise KeyError(f"Expected column 'Topic Name'. Found: {df.columns.tolist()}")
 
-    subset = df[df["Topic Name"].astype(str).str.lower() == topic.lower()]
-    if subset.empty:
-        subset = df[df["Topic Name"].astype(str).str.contains(topic, case=False, na=False)]
+    index = get_fewshot_index(df, "Topic Name", "Difficulty Level")
+    # topic match: exact first, then contains
+    topic_codes = index.match_group(topic)
+    subset = index.group_rows(topic_codes)
+    semantic = False
 
-    if subset.empty:
-        return []
+    if len(subset) == 0:
+        # no topic name matches (e.g. misspelled): nearest questions from the semantic index
+        subset, _ = semantic_index.nearest(df, topic)
+        semantic = True
+        if len(subset) == 0:
+            return []
 
-    if "Difficulty Level" not in subset.columns:
+    if index.sub is None:
         raise KeyError("Expected column 'Difficulty Level' in curated Excel")
 
-    # try exact difficulty
-    subset_exact = subset[subset["Difficulty Level"].astype(str).str.lower() == difficulty.lower()]
-
-    if not subset_exact.empty:
-        subset = subset_exact
+    # try exact difficulty; fallback: use other difficulties from the subset
+    if semantic:
+        diff_rows = [index.sub.rows[c] for c in index.sub.exact(difficulty)]
+        subset_exact = subset[np.isin(subset, diff_rows[0])] if diff_rows else subset[:0]
     else:
-        # fallback: use other difficulties from the subset
-        subset = subset[subset["Difficulty Level"].astype(str).str.lower() != difficulty.lower()]
+        subset_exact = index.pair_rows(topic_codes, index.sub.exact(difficulty))
+    if len(subset_exact) > 0:
+        subset = subset_exact
 
-    # sample up to k
-    k = min(k, len(subset))
-    sampled = subset.sample(k).to_dict(orient="records")
+    # sample up to k (semantic matches: relevant but mutually diverse rows)
+    rows = semantic_index.mmr(df, topic, subset, k) if semantic else _sample_rows(subset, k)
+    sampled = df.iloc[rows].to_dict(orient="records")
 
     fewshots = []
     for row in sampled:
@@ -106,7 +192,6 @@ def _select_fewshots_from_df(df: pd.DataFrame, topic: str, difficulty: str, k: i
         })
     return fewshots
 
-
 def get_fewshot_examples(chapter_num: int, topic: str, difficulty: str, k: int = 10):
     """
     GCSE few-shot selection from per-chapter Excel file.
@@ -122,6 +207,7 @@ def get_fewshot_examples_alevel(sheet_name: str, topic: str, difficulty: str, k:
     df = load_alevel_sheet(sheet_name)
     return _select_fewshots_from_df(df, topic, difficulty, k=k)
 
+@timed("_select_fewshots_science")
 def _select_fewshots_science(df: pd.DataFrame, qtype: str, topic: str = None, k: int = 10):
     # determine question-type column name
     if "Question type" in df.columns:
@@ -129,26 +215,34 @@ def _select_fewshots_science(df: pd.DataFrame, qtype: str, topic: str = None, k:
     else:
         raise KeyError(f"Expected column 'Question type'. Found: {df.columns.tolist()}")
 
+    has_subtopic = "Subtopic" in df.columns
+    index = get_fewshot_index(df, qcol, "Subtopic" if has_subtopic else None)
+
     # filter by question type (exact then contains)
-    subset = df[df[qcol].astype(str).str.lower() == (qtype or "").lower()]
-    if subset.empty:
-        subset = df[df[qcol].astype(str).str.contains(str(qtype), case=False, na=False)]
+    qtype_codes = index.group.exact(qtype or "") or index.group.contains(str(qtype))
+    subset = index.group_rows(qtype_codes)
 
-    if subset.empty:
+    if len(subset) == 0:
         return []
 
     # If Subtopic column exists, filter by Subtopic (exact then contains)
-    if "Subtopic" in subset.columns:
-        sub_exact = subset[subset["Subtopic"].astype(str).str.lower() == topic.lower()]
-        if not sub_exact.empty:
+    semantic = False
+    if has_subtopic:
+        sub_exact = index.pair_rows(qtype_codes, index.sub.exact(topic or ""))
+        if len(sub_exact) > 0:
             subset = sub_exact
         else:
-            sub_contains = subset[subset["Subtopic"].astype(str).str.contains(str(topic), case=False, na=False)]
-            if not sub_contains.empty:
+            sub_contains = index.pair_rows(qtype_codes, index.sub.contains(str(topic)))
+            if len(sub_contains) > 0:
                 subset = sub_contains
+            elif topic:
+                # no subtopic name matches: rank this question type's rows by meaning instead
+                nearest, _ = semantic_index.nearest(df, topic, rows=subset)
+                if len(nearest) > 0:
+                    subset, semantic = nearest, True
 
-    k = min(k, len(subset))
-    sampled = subset.sample(k).to_dict(orient="records")
+    rows = semantic_index.mmr(df, topic, subset, k) if semantic else _sample_rows(subset, k)
+    sampled = df.iloc[rows].to_dict(orient="records")
 
     def _safe_str(x):
         if pd.isna(x):
@@ -165,13 +259,10 @@ def _select_fewshots_science(df: pd.DataFrame, qtype: str, topic: str = None, k:
         })
     return fewshots
 
-def load_science_excel(subject: str, chapter_name: str):
+def find_science_excel(subject: str, chapter_name: str) -> Path:
     """
-    Robust loader for science (Physics/Chemistry) chapter files.
-    - Finds the appropriate file in curated_excels/<Subject>/
-    - Iterates sheets, detects header row per sheet, reads sheet with that header,
-      then concatenates sheets that contain expected columns.
-    Returns a single pandas.DataFrame containing concatenated rows from readable sheets.
+    Finds the chapter workbook in curated_excels/<Subject>/ (exact filename patterns first,
+    then any file whose stem contains chapter_name).
     """
     folder = Path("curated_excels") / subject
     if not folder.exists():
@@ -200,18 +291,42 @@ def load_science_excel(subject: str, chapter_name: str):
 
     if not found:
         raise FileNotFoundError(f"Excel not found for chapter '{chapter_name}' in {folder}")
+    return found
 
-    # Use ExcelFile to iterate sheets
-    xls = pd.ExcelFile(found, engine="openpyxl")
-    sheet_names = xls.sheet_names
+def _promote_header(raw: pd.DataFrame, header_row: int):
+    """
+    Turn row `header_row` of a header=None frame into the column names, the same way
+    pd.read_excel(header=header_row) would: blank cells become "Unnamed: i" and repeated
+    names get a ".1", ".2" suffix.
+    """
+    names = []
+    seen = {}
+    for i, v in enumerate(raw.iloc[header_row].tolist()):
+        name = f"Unnamed: {i}" if pd.isna(v) else str(v).strip()
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    df = raw.iloc[header_row + 1:].reset_index(drop=True)
+    df.columns = names
+    # cells above the header made every column object-typed; re-infer from the data rows
+    return df.infer_objects()
+
+def read_science_workbook(found: Path, sheet_name=None):
+    """
+    Parses every sheet of a science workbook in a single pass (header=None), detects the
+    header row per sheet on the in-memory frame, then concatenates sheets that contain
+    expected columns. `sheet_name` is accepted for _read_excel_cached and ignored.
+    """
+    sheets = pd.read_excel(found, sheet_name=None, header=None, engine="openpyxl")
 
     dfs = []
     expected_keywords = {"subtopic", "question", "question type", "answer"}
 
-    for sheet in sheet_names:
+    for sheet, raw in sheets.items():
         try:
-            # read sheet *without* headers (header=None) so we can inspect top rows
-            raw = pd.read_excel(found, sheet_name=sheet, header=None, engine="openpyxl")
             if raw.empty:
                 continue
 
@@ -221,10 +336,7 @@ def load_science_excel(subject: str, chapter_name: str):
                 print(f"⚠️ Could not find proper header in sheet '{sheet}' of {found.name}")
                 continue
 
-            # Now read sheet again using detected header_row
-            df_sheet = pd.read_excel(found, sheet_name=sheet, header=header_row, engine="openpyxl")
-            # Normalize columns
-            df_sheet.columns = [str(c).strip() for c in df_sheet.columns]
+            df_sheet = _promote_header(raw, header_row)
 
             # Check sheet has at least one of required columns (Subtopic or Question type or Question)
             cols_lower = [c.lower() for c in df_sheet.columns]
@@ -240,16 +352,86 @@ def load_science_excel(subject: str, chapter_name: str):
             continue
 
     if not dfs:
-        raise ValueError(f"No usable sheets found in {found} for chapter_name='{chapter_name}'")
+        raise ValueError(f"No usable sheets found in {found}")
 
     # Concatenate all found usable sheets
     combined = pd.concat(dfs, ignore_index=True, sort=False)
-    # final normalization of column names
-    combined.columns = [str(c).strip() for c in combined.columns]
-    return combined
+    # final normalization of column names, padding columns and value types
+    return normalize_frame(combined)
+
+@timed("load_science_excel")
+def load_science_excel(subject: str, chapter_name: str):
+    """
+    Robust loader for science (Physics/Chemistry) chapter files.
+    Uses the compiled corpus copy of the chapter workbook when it is up to date,
+    otherwise parses the workbook once (see read_science_workbook). The combined frame
+    is kept in the same mtime-keyed cache as the math loaders.
+    Returns a single pandas.DataFrame containing concatenated rows from readable sheets.
+    """
+    found = find_science_excel(subject, chapter_name)
+    try:
+        return _read_excel_cached(found, reader=read_science_workbook)
+    except ValueError:
+        raise ValueError(f"No usable sheets found in {found} for chapter_name='{chapter_name}'")
 
 def get_fewshot_examples_science(subject: str, chapter_name: str, qtype: str, topic: str, k: int = 10):
     df = load_science_excel(subject, chapter_name)
     return _select_fewshots_science(df, qtype, topic=topic, k=k)
 
+SCIENCE_SUBJECTS = ("Physics", "Chemistry")
+
+def corpus_workbooks():
+    """Yield (path, is_science) for every curated workbook, skipping Excel lock files."""
+    for path in sorted(CURATED_DIR.glob("*/*.xls*")):
+        if not path.name.startswith("~$"):
+            yield path, path.parent.name in SCIENCE_SUBJECTS
+
+def sheet_names(path: Path):
+    """
+    Sheet names of a Math workbook: from its compiled corpus manifest when that is up
+    to date, else read with openpyxl (and recorded in the manifest).
+    """
+    path = Path(path)
+    names = read_sheet_names(path)
+    if names is None:
+        names = pd.ExcelFile(path, engine="openpyxl").sheet_names
+        try:
+            write_sheet_names(path, names)
+        except OSError as e:
+            print(f"⚠️ Could not record the sheets of {path.name}: {e}")
+    return names
+
+def compile_workbook(path: Path, force: bool = False):
+    """
+    Write the compiled corpus copies of one workbook: the combined frame for a science
+    workbook, every sheet plus the default first-sheet frame for Math. Copies newer
+    than the workbook are kept unless `force`. A Math workbook's sheet names are
+    recorded in its manifest too. Returns the number of frames written.
+    """
+    path = Path(path)
+    written = 0
+    if path.parent.name in SCIENCE_SUBJECTS:
+        if force or not is_fresh(path):
+            write_compiled(read_science_workbook(path), path)
+            written += 1
+        return written
+
+    for sheet in [None] + sheet_names(path):
+        if not force and is_fresh(path, sheet):
+            continue
+        write_compiled(_read_sheet(path, sheet), path, sheet)
+        written += 1
+    return written
 
+def iter_corpus_frames():
+    """
+    Yield (path, sheet_name, df) for every curated frame, read the way the server reads
+    them: each Math sheet (plus the default first-sheet frame as sheet None) and each
+    Physics/Chemistry workbook as its combined header-detected frame.
+    """
+    for path, science in corpus_workbooks():
+        if science:
+            yield path, None, _read_excel_cached(path, reader=read_science_workbook)
+            continue
+        for sheet in [None] + sheet_names(path):
+            yield path, sheet, _read_excel_cached(path, sheet_name=sheet)
@@ -0,0 +1,110 @@
+# fewshot_index.py
+"""
+In-memory index over a loaded few-shot DataFrame.
+
+Built once per frame (see fewshot.get_fewshot_index), it replaces the per-request
+`astype(str).str.lower()` scans with dictionary/array lookups:
+- each filter column is lowercased once and factorized into integer codes
+- row positions are precomputed per group value and per (group, sub) value pair
+- a character-trigram inverted index over the distinct group values narrows the
+  case-insensitive "contains" fallback to a handful of candidates
+
+Row positions are positional (iloc) indices into the frame the index was built from.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+_REGEX_META = set(".^$*+?{}[]\\|()")
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def _trigrams(s: str):
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def _group_rows(codes: np.ndarray, n_groups: int):
+    """Split row positions by code: returns a list where item c holds the rows with code c."""
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(-1, n_groups + 1))
+    # bounds[0]..bounds[1] are NaN rows (code -1); skip them
+    return [order[bounds[c + 1]:bounds[c + 2]] for c in range(n_groups)]
+
+
+class CodedColumn:
+    """
+    One lowercased, factorized column: `codes[i]` is the category of row i (-1 for blanks)
+    and `categories[c]` the lowercased value of category c.
+    """
+
+    def __init__(self, series: pd.Series):
+        lowered = series.map(lambda v: None if pd.isna(v) else str(v).lower())
+        codes, uniques = pd.factorize(lowered)
+        self.codes = codes.astype(np.int64)
+        self.categories = [str(u) for u in uniques]
+        self.lookup = {c: i for i, c in enumerate(self.categories)}
+        self.rows = _group_rows(self.codes, len(self.categories))
+        self.trigrams = {}
+        for code, cat in enumerate(self.categories):
+            for tri in _trigrams(cat):
+                self.trigrams.setdefault(tri, set()).add(code)
+
+    def exact(self, value):
+        """Codes whose lowercased value equals `value` (0 or 1 codes)."""
+        code = self.lookup.get(str(value).lower())
+        return [] if code is None else [code]
+
+    def contains(self, pattern):
+        """
+        Codes whose value matches `pattern` case-insensitively, with the same regex
+        semantics as Series.str.contains(pattern, case=False).
+        """
+        pattern = str(pattern)
+        low = pattern.lower()
+        if len(low) >= 3 and not (_REGEX_META & set(low)):
+            candidates = None
+            for tri in _trigrams(low):
+                posting = self.trigrams.get(tri, set())
+                candidates = posting if candidates is None else candidates & posting
+                if not candidates:
+                    return []
+            return sorted(c for c in candidates if low in self.categories[c])
+        rx = re.compile(pattern, re.IGNORECASE)
+        return [c for c, cat in enumerate(self.categories) if rx.search(cat)]
+
+
+class FewshotIndex:
+    """
+    Index over `group_col` (Topic Name / Question type) and an optional `sub_col`
+    (Difficulty Level / Subtopic) of one DataFrame.
+    """
+
+    def __init__(self, df: pd.DataFrame, group_col: str, sub_col: str = None):
+        self.group = CodedColumn(df[group_col])
+        self.sub = CodedColumn(df[sub_col]) if sub_col and sub_col in df.columns else None
+        self.pairs = {}
+        if self.sub is not None:
+            n_sub = len(self.sub.categories)
+            valid = (self.group.codes >= 0) & (self.sub.codes >= 0)
+            pair_codes = np.where(valid, self.group.codes * n_sub + self.sub.codes, -1)
+            uniques = np.unique(pair_codes[valid])
+            remap = np.full(pair_codes.shape, -1, dtype=np.int64)
+            remap[valid] = np.searchsorted(uniques, pair_codes[valid])
+            for pc, rows in zip(uniques, _group_rows(remap, len(uniques))):
+                self.pairs[(int(pc) // n_sub, int(pc) % n_sub)] = rows
+
+    def match_group(self, value):
+        """Group codes for `value`: exact (case-insensitive) match first, then contains."""
+        return self.group.exact(value) or self.group.contains(value)
+
+    def group_rows(self, group_codes):
+        if not group_codes:
+            return _EMPTY
+        return np.sort(np.concatenate([self.group.rows[c] for c in group_codes]))
+
+    def pair_rows(self, group_codes, sub_codes):
+        parts = [self.pairs[(g, s)] for g in group_codes for s in sub_codes if (g, s) in self.pairs]
+        if not parts:
+            return _EMPTY
+        return np.sort(np.concatenate(parts))
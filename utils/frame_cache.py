@@ -0,0 +1,150 @@
+# frame_cache.py
+"""
+In-process cache of curated DataFrames (one per workbook sheet / science workbook).
+
+Entries are keyed by (resolved path, sheet) and remember the workbook mtime they
+were loaded for: a lookup with a newer mtime reloads and replaces the entry, so a
+curator saving a workbook never leaves the old frame behind. The cache is an LRU
+bounded by entry count and by the frames' memory_usage(deep=True) (for mapped
+Arrow frames that is the size of the mapped buffers). Concurrent misses for the
+same key are single-flight: one thread loads, the others wait for its result.
+
+Configured through environment variables:
+    FRAME_CACHE_MAX_ENTRIES   frames kept (default 256)
+    FRAME_CACHE_MAX_MB        total frame size kept (default 512)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+FRAME_CACHE_MAX_ENTRIES = int(os.getenv("FRAME_CACHE_MAX_ENTRIES", "256"))
+FRAME_CACHE_MAX_MB = float(os.getenv("FRAME_CACHE_MAX_MB", "512"))
+
+
+def frame_bytes(df) -> int:
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        return 0
+
+
+class DataFrameCache:
+    def __init__(self, max_entries: int = FRAME_CACHE_MAX_ENTRIES, max_mb: float = FRAME_CACHE_MAX_MB):
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()  # (path, sheet) -> (mtime, df, bytes)
+        self._loading = {}             # (path, sheet) -> lock held by the thread loading it
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_replaced = 0
+        self.evictions = 0
+        self.load_errors = 0
+        self.load_seconds = 0.0
+
+    def _lookup(self, key, mtime):
+        """Fresh cached frame or None; caller holds self._lock."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == mtime:
+            self._entries.move_to_end(key)
+            return entry[1]
+        return None
+
+    def _store(self, key, mtime, df):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+            if old[0] != mtime:
+                self.stale_replaced += 1
+        size = frame_bytes(df)
+        self._entries[key] = (mtime, df, size)
+        self._bytes += size
+        # the frame just stored always stays, even if it alone exceeds the limit
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, dropped) = self._entries.popitem(last=False)
+            self._bytes -= dropped
+            self.evictions += 1
+
+    def get(self, path: str, sheet, mtime: float, load):
+        """Cached frame for (path, sheet) at `mtime`, calling `load()` at most once per miss."""
+        key = (path, sheet)
+        with self._lock:
+            df = self._lookup(key, mtime)
+            if df is not None:
+                self.hits += 1
+                return df
+            flight = self._loading.get(key)
+            if flight is None:
+                flight = self._loading[key] = threading.Lock()
+                flight.acquire()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            # another thread is loading this key: wait for it, then use its result
+            with flight:
+                pass
+            with self._lock:
+                df = self._lookup(key, mtime)
+                if df is not None:
+                    self.coalesced += 1
+                    return df
+            # its load failed (or was for another mtime): load independently
+            return self.get(path, sheet, mtime, load)
+
+        try:
+            start = time.perf_counter()
+            try:
+                df = load()
+            except Exception:
+                with self._lock:
+                    self.load_errors += 1
+                raise
+            with self._lock:
+                self.misses += 1
+                self.load_seconds += time.perf_counter() - start
+                self._store(key, mtime, df)
+            return df
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            flight.release()
+
+    def discard(self, path: str):
+        """Drop every cached frame of `path` (e.g. the workbook was deleted)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._bytes -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "stale_replaced": self.stale_replaced,
+                "evictions": self.evictions,
+                "load_errors": self.load_errors,
+                "load_seconds": round(self.load_seconds, 3),
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                "loading": len(self._loading),
+                "frames": [{"path": path, "sheet": sheet, "mtime": mtime, "bytes": size}
+                           for (path, sheet), (mtime, _, size) in self._entries.items()],
+            }
+
+
+frame_cache = DataFrameCache()
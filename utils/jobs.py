@@ -0,0 +1,312 @@
+# jobs.py
+"""
+Background generation jobs.
+
+POST /jobs stores the request in a local SQLite database and returns a job id at
+once; a pool of asyncio workers takes jobs in priority order (high, normal, low,
+then oldest first) and runs the generation pipeline. Status, current stage and
+the final result are written back to SQLite, so they survive a restart.
+
+Several uvicorn worker processes share the database. Each process has an owner id
+(host:pid:nonce); a job is claimed with a conditional UPDATE (queued -> running),
+so only one process runs it, and every later write of that run is conditional on
+the job still being `running` for that owner, so a cancel from another process is
+never overwritten by "done". Running jobs carry a lease that their owner renews
+every JOB_LEASE_SECONDS / 3; the same loop cancels local tasks whose job was
+cancelled elsewhere, and puts back in the queue the jobs of owners that died (same
+host, process gone) or let their lease expire. SQLite is only touched from one
+helper thread per process, never from the event loop.
+
+Configured through environment variables:
+    JOBS_DB               SQLite file (default jobs.sqlite)
+    JOB_WORKERS           concurrent jobs per process (default 2)
+    JOB_LLM_CONCURRENCY   concurrent LLM calls per job worker (default 4)
+    JOB_LEASE_SECONDS     lease of a running job before another process may take it over (default 60)
+"""
+import asyncio
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from llm_client import limit_llm_concurrency
+
+JOBS_DB = os.getenv("JOBS_DB", "jobs.sqlite")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LLM_CONCURRENCY = int(os.getenv("JOB_LLM_CONCURRENCY", "4"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+FINISHED = ("done", "failed", "cancelled")
+HOSTNAME = socket.gethostname()
+
+
+def make_owner() -> str:
+    # the nonce tells a restarted process apart from its predecessor with the same pid
+    return f"{HOSTNAME}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def owner_alive(owner: str) -> bool:
+    """False only if `owner` certainly is gone: a process of this host that no longer exists."""
+    host, _, rest = (owner or "").partition(":")
+    pid, _, _ = rest.partition(":")
+    if host != HOSTNAME or not pid.isdigit():
+        return True  # another machine: only its lease tells
+    if int(pid) == os.getpid():
+        return False  # an earlier incarnation of this process (pid reused, e.g. pid 1 in a container)
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    """Job rows in SQLite; request/result are stored as JSON text."""
+
+    def __init__(self, path: str = JOBS_DB):
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT, priority TEXT NOT NULL,"
+                " request TEXT NOT NULL, result TEXT, error TEXT,"
+                " created_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+                " owner TEXT, lease_until REAL)"
+            )
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:  # databases created before leases
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._db.commit()
+
+    def _write(self, sql, params=()) -> int:
+        with self._lock:
+            rowcount = self._db.execute(sql, params).rowcount
+            self._db.commit()
+        return rowcount
+
+    def create(self, request: dict, priority: str) -> str:
+        job_id = uuid.uuid4().hex
+        self._write(
+            "INSERT INTO jobs (id, status, priority, request, created_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, priority, json.dumps(request, ensure_ascii=False), time.time())
+        )
+        return job_id
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["request"] = json.loads(job["request"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def claim(self, job_id: str, owner: str, lease: float):
+        """Move a queued job to running for `owner`; the job, or None if it was not queued any more."""
+        now = time.time()
+        claimed = self._write(
+            "UPDATE jobs SET status = 'running', stage = NULL, owner = ?, started_at = ?, lease_until = ?"
+            " WHERE id = ? AND status = 'queued'", (owner, now, now + lease, job_id)
+        )
+        return self.get(job_id) if claimed == 1 else None
+
+    def set_stage(self, job_id: str, owner: str, stage):
+        self._write("UPDATE jobs SET stage = ? WHERE id = ? AND status = 'running' AND owner = ?",
+                    (stage, job_id, owner))
+
+    def finish(self, job_id: str, owner: str, status: str, result=None, error=None) -> bool:
+        """Record the outcome of a run; False if the job was cancelled (or taken over) meanwhile."""
+        return self._write(
+            "UPDATE jobs SET status = ?, stage = NULL, result = ?, error = ?, finished_at = ?, lease_until = NULL"
+            " WHERE id = ? AND status = 'running' AND owner = ?",
+            (status, None if result is None else json.dumps(result, ensure_ascii=False), error, time.time(),
+             job_id, owner)
+        ) == 1
+
+    def cancel(self, job_id: str) -> bool:
+        return self._write(
+            "UPDATE jobs SET status = 'cancelled', stage = NULL, finished_at = ?, lease_until = NULL"
+            " WHERE id = ? AND status IN ('queued', 'running')", (time.time(), job_id)
+        ) == 1
+
+    def renew(self, owner: str, lease: float):
+        self._write("UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'running'",
+                    (time.time() + lease, owner))
+
+    def release(self, owner: str):
+        """Put the running jobs of `owner` back in the queue (the process is shutting down)."""
+        self._write("UPDATE jobs SET status = 'queued', stage = NULL, owner = NULL, started_at = NULL,"
+                    " lease_until = NULL WHERE owner = ? AND status = 'running'", (owner,))
+
+    def statuses(self, job_ids):
+        if not job_ids:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, status FROM jobs WHERE id IN ({', '.join('?' * len(job_ids))})", list(job_ids)
+            ).fetchall()
+        return {row["id"]: row["status"] for row in rows}
+
+    def recover(self, owner: str):
+        """
+        Requeue running jobs whose owner died or whose lease expired, then return
+        (id, priority) of every queued job, oldest first.
+        """
+        now = time.time()
+        with self._lock:
+            running = self._db.execute(
+                "SELECT id, owner, lease_until FROM jobs WHERE status = 'running' AND owner IS NOT ?", (owner,)
+            ).fetchall()
+        for row in running:
+            expired = row["lease_until"] is None or row["lease_until"] < now
+            if expired or not owner_alive(row["owner"]):
+                # compare-and-set: only if nobody claimed or renewed it since we looked
+                if self._write(
+                    "UPDATE jobs SET status = 'queued', stage = NULL, owner = NULL, started_at = NULL,"
+                    " lease_until = NULL WHERE id = ? AND status = 'running' AND owner IS ? AND lease_until IS ?",
+                    (row["id"], row["owner"], row["lease_until"])
+                ):
+                    print(f"[jobs] {row['id']} requeued (owner {row['owner']} gone or lease expired)")
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, priority FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, llm_concurrency: int = JOB_LLM_CONCURRENCY,
+                 lease: float = JOB_LEASE_SECONDS, owner: str = None):
+        self.workers = workers
+        self.llm_concurrency = llm_concurrency
+        self.lease = lease
+        self.owner = owner or make_owner()
+        self.store = None
+        self._queue = None
+        self._queued = set()  # job ids in self._queue
+        self._seq = itertools.count()
+        self._running = {}    # job id -> asyncio.Task running it
+        self._cancelled = set()
+        self._tasks = []
+        self._run = None
+        self._loop = None
+        self._db_thread = None
+
+    def start(self, run, db_path: str = JOBS_DB):
+        """
+        Start the workers. `run(request, set_stage)` is a coroutine executing one job
+        and returning its JSON-serializable result; it raises to fail the job.
+        """
+        self._run = run
+        self._loop = asyncio.get_running_loop()
+        # one thread: SQLite stays off the event loop and writes keep their order
+        self._db_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-db")
+        self.store = JobStore(db_path)
+        self._queue = asyncio.PriorityQueue()
+        self._queued = set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.store is not None:
+            await self._db(self.store.release, self.owner)  # let another process resume them
+        if self._db_thread is not None:
+            self._db_thread.shutdown(wait=True)
+            self._db_thread = None
+
+    def _db(self, fn, *args, **kwargs):
+        return self._loop.run_in_executor(self._db_thread, partial(fn, *args, **kwargs))
+
+    def _enqueue(self, job_id: str, priority: str):
+        if job_id in self._queued:
+            return
+        self._queued.add(job_id)
+        self._queue.put_nowait((PRIORITIES.get(priority, PRIORITIES["normal"]), next(self._seq), job_id))
+
+    def submit(self, request: dict, priority: str = "normal") -> str:
+        """Store and queue a job (called from request threads)."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {list(PRIORITIES)}")
+        job_id = self.store.create(request, priority)
+        self._loop.call_soon_threadsafe(self._enqueue, job_id, priority)
+        return job_id
+
+    def cancel(self, job_id: str):
+        """
+        Cancel a queued or running job (called from request threads). Returns the job
+        after the change (None if unknown). A job running in another process is stopped
+        there at its next lease renewal; its result is discarded either way.
+        """
+        if self.store.cancel(job_id):
+            self._loop.call_soon_threadsafe(self._cancel_local, job_id)
+        return self.store.get(job_id)
+
+    def _cancel_local(self, job_id: str):
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+
+    def _set_stage(self, job_id: str, stage):
+        self._db(self.store.set_stage, job_id, self.owner, stage)  # fire and forget; ordered by the db thread
+
+    async def _maintain(self):
+        """Renew leases, stop jobs cancelled by other processes, pick up orphaned and queued jobs."""
+        while True:
+            try:
+                await self._db(self.store.renew, self.owner, self.lease)
+                statuses = await self._db(self.store.statuses, list(self._running))
+                for job_id, status in statuses.items():
+                    if status != "running":
+                        self._cancel_local(job_id)
+                for job_id, priority in await self._db(self.store.recover, self.owner):
+                    self._enqueue(job_id, priority)
+            except Exception as e:
+                print(f"[jobs] maintenance failed: {e}")
+            await asyncio.sleep(self.lease / 3)
+
+    async def _worker(self):
+        limit_llm_concurrency(self.llm_concurrency)
+        while True:
+            _, _, job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            job = await self._db(self.store.claim, job_id, self.owner, self.lease)
+            if job is None:
+                continue  # cancelled while waiting, or claimed by another process
+            task = asyncio.create_task(self._run(job["request"], partial(self._set_stage, job_id)))
+            self._running[job_id] = task
+            try:
+                result = await task
+                if not await self._db(self.store.finish, job_id, self.owner, "done", result=result):
+                    print(f"[jobs] {job_id} finished after it was cancelled; result discarded")
+            except asyncio.CancelledError:
+                if job_id not in self._cancelled:
+                    raise  # the worker itself is shutting down; stop() puts the job back in the queue
+                print(f"[jobs] {job_id} cancelled")
+            except Exception as e:
+                print(f"[jobs] {job_id} failed: {e}")
+                await self._db(self.store.finish, job_id, self.owner, "failed", error=str(e))
+            finally:
+                self._running.pop(job_id, None)
+                self._cancelled.discard(job_id)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,217 @@
+# llm_cache.py
+"""
+Content-addressed cache for LLM responses.
+
+Entries are keyed by a SHA-256 of (model, prompt/input, parameters) and stored as
+JSON text, so every hit returns a fresh copy. Two tiers:
+- in-process LRU bounded by entry count and total bytes, with a per-cache TTL
+- optional SQLite file shared by all workers (LLM_CACHE_SQLITE), bounded by entry count
+
+The SQLite tier is only touched from one thread per cache: writes are queued to it
+and return at once, and lookups that miss memory wait for it (aget() awaits it, so
+the event loop is never blocked on the file or its lock).
+
+Configured through environment variables:
+    LLM_CACHE_MAX_ENTRIES      in-memory entries per cache (default 1024)
+    LLM_CACHE_MAX_BYTES        in-memory JSON bytes per cache (default 64 MB)
+    LLM_CACHE_TTL_GENERATION   seconds a generation result stays valid (default 86400)
+    LLM_CACHE_TTL_MARKDOWN     seconds for markdown conversions (default 0 = never expires)
+    LLM_CACHE_SQLITE           path of the on-disk tier (default: disabled)
+    LLM_CACHE_SQLITE_MAX_ENTRIES  on-disk entries per cache (default 100000)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL_GENERATION = float(os.getenv("LLM_CACHE_TTL_GENERATION", "86400"))
+LLM_CACHE_TTL_MARKDOWN = float(os.getenv("LLM_CACHE_TTL_MARKDOWN", "0"))
+LLM_CACHE_SQLITE = os.getenv("LLM_CACHE_SQLITE", "")
+LLM_CACHE_SQLITE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_SQLITE_MAX_ENTRIES", "100000"))
+
+_MISSING = object()
+
+
+def make_key(model: str, content, **params) -> str:
+    """Stable hash of the model, the prompt (or input data) and call parameters."""
+    payload = json.dumps({"model": model, "content": content, "params": params},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, name: str, ttl: float = 0, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES, sqlite_path: str = LLM_CACHE_SQLITE,
+                 sqlite_max_entries: int = LLM_CACHE_SQLITE_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sqlite_max_entries = sqlite_max_entries
+        self._entries = OrderedDict()  # key -> (expires_at or None, json text)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_errors = 0
+        self._db = None
+        self._writes = 0
+        # the connection lives on this thread; every SQLite call is submitted to it
+        self._disk = None
+        if sqlite_path:
+            self._disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"llm-cache-{name}")
+            self._disk.submit(self._open_db, sqlite_path).result()
+
+    def _open_db(self, sqlite_path):
+        self._db = sqlite3.connect(sqlite_path, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " cache TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " expires_at REAL, created_at REAL NOT NULL, PRIMARY KEY (cache, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (cache, created_at)")
+        self._db.commit()
+
+    def _expires_at(self):
+        return time.time() + self.ttl if self.ttl else None
+
+    def _remember(self, key, expires_at, text):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        self._entries[key] = (expires_at, text)
+        self._bytes += len(text)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, dropped) = self._entries.popitem(last=False)
+            self._bytes -= len(dropped)
+            self.evictions += 1
+
+    def _memory_get(self, key, now):
+        """Fresh in-memory value for key, or _MISSING (counts the miss when there is no disk tier)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, text = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(text)
+                self._entries.pop(key)
+                self._bytes -= len(text)
+            if self._disk is None:
+                self.misses += 1
+            return _MISSING
+
+    def _disk_get(self, key, now):
+        """(value text, expires_at) from SQLite, or None (runs on the disk thread)."""
+        try:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE cache = ? AND key = ?", (self.name, key)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"[llm_cache] {self.name}: read failed: {e}")
+            return None
+        if row is not None and (row[1] is None or row[1] > now):
+            return row
+        return None
+
+    def _disk_result(self, key, row):
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self._remember(key, row[1], row[0])
+            self.disk_hits += 1
+        return json.loads(row[0])
+
+    def get(self, key):
+        """Cached value for key, or None (blocks on the disk tier after a memory miss)."""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not _MISSING:
+            return value
+        if self._disk is None:
+            return None
+        return self._disk_result(key, self._disk.submit(self._disk_get, key, now).result())
+
+    async def aget(self, key):
+        """get() for the event loop: a memory miss awaits the disk thread instead of blocking."""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not _MISSING:
+            return value
+        if self._disk is None:
+            return None
+        row = await asyncio.get_running_loop().run_in_executor(self._disk, self._disk_get, key, now)
+        return self._disk_result(key, row)
+
+    def set(self, key, value):
+        """Store value in memory; the SQLite write is queued to the disk thread."""
+        text = json.dumps(value, ensure_ascii=False)
+        expires_at = self._expires_at()
+        with self._lock:
+            self._remember(key, expires_at, text)
+        if self._disk is not None:
+            self._disk.submit(self._disk_set, key, text, expires_at)
+
+    def _disk_set(self, key, text, expires_at):
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (cache, key, value, expires_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?)", (self.name, key, text, expires_at, time.time())
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune_disk()
+            self._db.commit()
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"[llm_cache] {self.name}: write failed: {e}")
+
+    def flush(self):
+        """Wait until the queued SQLite writes are done."""
+        if self._disk is not None:
+            self._disk.submit(lambda: None).result()
+
+    def _prune_disk(self):
+        self._db.execute("DELETE FROM llm_cache WHERE cache = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                         (self.name, time.time()))
+        self._db.execute(
+            "DELETE FROM llm_cache WHERE cache = ? AND key IN ("
+            " SELECT key FROM llm_cache WHERE cache = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.name, self.name, self.sqlite_max_entries)
+        )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "sqlite": self._disk is not None,
+                "disk_errors": self.disk_errors,
+            }
+
+
+generation_cache = LLMCache("generation", ttl=LLM_CACHE_TTL_GENERATION)
+markdown_cache = LLMCache("markdown", ttl=LLM_CACHE_TTL_MARKDOWN)
+
+
+def cache_stats():
+    return {"generation": generation_cache.stats(), "markdown": markdown_cache.stats()}
@@ -0,0 +1,87 @@
+# llm_client.py
+"""
+Shared async OpenAI client for the request path.
+
+One AsyncOpenAI instance per worker process, backed by a single connection-pooled
+httpx.AsyncClient, plus a per-worker semaphore capping in-flight completions.
+Configured through environment variables:
+    LLM_MAX_CONCURRENCY   max concurrent completions per worker (default 200)
+    LLM_MAX_CONNECTIONS   HTTP connection pool size (default 100)
+    LLM_TIMEOUT           per-request timeout in seconds (default 120)
+    LLM_CONNECT_TIMEOUT   connect timeout in seconds (default 10)
+"""
+import asyncio
+import contextvars
+import os
+from contextlib import asynccontextmanager
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "200"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+
+_async_client = None
+_semaphore = None
+# optional extra cap for one task tree (e.g. a background job worker), see limit_llm_concurrency
+_scoped_semaphore = contextvars.ContextVar("llm_scoped_semaphore", default=None)
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Create (once) and return the shared AsyncOpenAI client."""
+    global _async_client
+    if _async_client is None:
+        timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            ),
+        )
+        # retries, backoff and rate limits live in llm_gateway
+        _async_client = AsyncOpenAI(http_client=http_client, timeout=timeout, max_retries=0)
+    return _async_client
+
+
+def _worker_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+@asynccontextmanager
+async def _scoped_slot(scoped: asyncio.Semaphore):
+    async with scoped:
+        async with _worker_semaphore():
+            yield
+
+
+def llm_slot():
+    """
+    Concurrency slot for one completion: `async with llm_slot(): ...`
+    Bounded per worker process, and additionally by limit_llm_concurrency() when set.
+    """
+    scoped = _scoped_semaphore.get()
+    if scoped is None:
+        return _worker_semaphore()
+    return _scoped_slot(scoped)
+
+
+def limit_llm_concurrency(limit: int):
+    """Cap concurrent completions of the current task and the tasks it spawns."""
+    _scoped_semaphore.set(asyncio.Semaphore(limit))
+
+
+async def close_async_client():
+    """Close the pooled HTTP connections (call on app shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
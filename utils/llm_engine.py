@@ -4,23 +4,120 @@ from dotenv import load_dotenv
 import os
 load_dotenv()
 
-client = OpenAI()
+from llm_cache import generation_cache, make_key
+from llm_client import get_async_client, llm_slot
+from llm_gateway import acreate, create, record_usage
+from metrics import timed
+from stream_parser import JsonArrayStreamParser
 
-def generate_questions(prompt):
+# retries are handled by llm_gateway
+client = OpenAI(max_retries=0)
+
+GENERATION_MODEL = "gpt-5-mini"
+
+def _parse_questions(raw):
+    try:
+        return json.loads(raw)
+    except:
+        # fallback: return as raw text
+        return [{"question": raw, "answer": "Parsing failed"}]
+
+def _parsed_ok(questions):
+    return not any(isinstance(q, dict) and q.get("answer") == "Parsing failed" for q in questions)
+
+def _cache_key(prompt, cache_variant):
+    return make_key(GENERATION_MODEL, prompt, variant=cache_variant)
+
+@timed("llm_generate")
+def generate_questions(prompt, use_cache=True, cache_variant=None, with_source=False):
     """
     Calls GPT-5-mini and returns parsed JSON list.
+    Identical prompts are answered from the response cache unless use_cache is False;
+    cache_variant separates calls that share a prompt but must not share a result.
+    With with_source, returns (questions, from_cache) instead of just the questions.
     """
+    key = _cache_key(prompt, cache_variant)
+    if use_cache:
+        cached = generation_cache.get(key)
+        if cached is not None:
+            return (cached, True) if with_source else cached
 
-    response = client.chat.completions.create(
-        model="gpt-5-mini",
+    response = create(
+        client,
+        model=GENERATION_MODEL,
         messages=[{"role": "user", "content": prompt}]
     )
 
     raw = response.choices[0].message.content
+    questions = _parse_questions(raw)
+    if _parsed_ok(questions):
+        generation_cache.set(key, questions)
+    return (questions, False) if with_source else questions
 
-    try:
-        return json.loads(raw)
-    except:
-        # fallback: return as raw text
-        return [{"question": raw, "answer": "Parsing failed"}]
+@timed("llm_generate")
+async def agenerate_questions(prompt, use_cache=True, cache_variant=None, with_source=False):
+    """
+    Async variant of generate_questions for the request path: uses the shared pooled
+    AsyncOpenAI client and waits for a per-worker concurrency slot.
+    With with_source, returns (questions, from_cache) instead of just the questions.
+    """
+    key = _cache_key(prompt, cache_variant)
+    if use_cache:
+        cached = await generation_cache.aget(key)
+        if cached is not None:
+            return (cached, True) if with_source else cached
+
+    async with llm_slot():
+        response = await acreate(
+            get_async_client(),
+            model=GENERATION_MODEL,
+            messages=[{"role": "user", "content": prompt}]
+        )
+
+    raw = response.choices[0].message.content
+    questions = _parse_questions(raw)
+    if _parsed_ok(questions):
+        generation_cache.set(key, questions)
+    return (questions, False) if with_source else questions
+
+async def astream_questions(prompt, use_cache=True, cache_variant=None, with_source=False):
+    """
+    Streams the GPT-5-mini completion and yields each {"question", "answer"} object as
+    soon as it is complete. If nothing parseable arrives, yields the same
+    "Parsing failed" fallback item as generate_questions.
+    Shares the response cache with generate_questions: a cached reply is yielded at
+    once, a streamed one is stored when it is complete. With with_source, yields
+    (item, from_cache) pairs instead of just the items.
+    """
+    key = _cache_key(prompt, cache_variant)
+    if use_cache:
+        cached = await generation_cache.aget(key)
+        if cached is not None:
+            for item in cached:
+                yield (item, True) if with_source else item
+            return
+
+    parser = JsonArrayStreamParser()
+    questions = []
+    async with llm_slot():
+        stream = await acreate(
+            get_async_client(),
+            model=GENERATION_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                record_usage(GENERATION_MODEL, chunk.usage)
+            if not chunk.choices:
+                continue
+            for item in parser.feed(chunk.choices[0].delta.content or ""):
+                questions.append(item)
+                yield (item, False) if with_source else item
 
+    if questions:
+        generation_cache.set(key, questions)
+        return
+    for item in _parse_questions(parser.text):
+        yield (item, False) if with_source else item
@@ -0,0 +1,270 @@
+# llm_gateway.py
+"""
+Single entry point for chat completion calls (generation and markdown, sync and async).
+
+Every call goes through:
+- token buckets for requests/minute and estimated tokens/minute (shared per process)
+- a circuit breaker: after LLM_BREAKER_THRESHOLD consecutive failures, calls fail
+  fast with LLMUnavailableError for LLM_BREAKER_COOLDOWN seconds, then one trial
+  call decides whether to close it again
+- retries on 429, 408/409, 5xx, timeouts and connection errors with jittered
+  exponential backoff, honoring the Retry-After header when the API sends one
+- a per-call deadline covering all attempts; each attempt's timeout is what remains
+
+Configured through environment variables:
+    LLM_RPM                    requests per minute (default 500, 0 = unlimited)
+    LLM_TPM                    estimated tokens per minute (default 200000, 0 = unlimited)
+    LLM_EXPECTED_OUTPUT_TOKENS output tokens assumed per call for the TPM bucket (default 1500)
+    LLM_MAX_RETRIES            retries after the first attempt (default 4)
+    LLM_BACKOFF_BASE           first backoff in seconds (default 1)
+    LLM_BACKOFF_MAX            backoff ceiling in seconds (default 30)
+    LLM_CALL_DEADLINE          seconds per call including retries (default 180)
+    LLM_BREAKER_THRESHOLD      consecutive failures that open the breaker (default 5)
+    LLM_BREAKER_COOLDOWN       seconds the breaker stays open (default 30)
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+import openai
+
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))
+LLM_TPM = float(os.getenv("LLM_TPM", "200000"))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "1500"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "180"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+             openai.InternalServerError, openai.ConflictError)
+RETRYABLE_STATUS = {408}  # the SDK has no error class for 408 Request Timeout
+
+
+class LLMUnavailableError(RuntimeError):
+    """The breaker is open or the call deadline ran out; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to one minute's worth. `reserve(n)` takes
+    n units right away (the balance may go negative) and returns how long the caller
+    must wait before using them, so sync and async callers share one bucket.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= min(amount, self.capacity)
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def before_call(self):
+        """Raise LLMUnavailableError unless a call may go out now."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return
+            remaining = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+            raise LLMUnavailableError("LLM upstream is degraded; failing fast", retry_after=remaining or 1)
+
+    def release(self):
+        """Give back a half-open trial that ended without a verdict (e.g. cancelled)."""
+        with self._lock:
+            self._trial = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None or self.state == "half-open":
+                    print(f"[llm_gateway] circuit open after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+_usage_lock = threading.Lock()
+usage_totals = {}  # model -> {"calls", "prompt_tokens", "cached_tokens", "completion_tokens"}
+
+
+def record_usage(model: str, usage):
+    """
+    Add a response's token usage to usage_totals. cached_tokens is the part of the
+    prompt served from the provider's prompt cache (cheaper and faster input).
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    with _usage_lock:
+        totals = usage_totals.setdefault(model, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt
+        totals["cached_tokens"] += cached
+        totals["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+    print(f"[llm_gateway] {model}: prompt_tokens={prompt} cached_tokens={cached}")
+
+
+request_bucket = TokenBucket(LLM_RPM)
+token_bucket = TokenBucket(LLM_TPM)
+breaker = CircuitBreaker()
+
+
+def estimate_tokens(messages) -> int:
+    """Rough input size (~4 characters per token) plus the expected output."""
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return chars // 4 + LLM_EXPECTED_OUTPUT_TOKENS
+
+
+def _retry_after(error) -> float:
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0.0
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except ValueError:
+        return 0.0
+
+
+def _backoff(attempt: int, error) -> float:
+    # full jitter, but never sooner than the server asked for
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    return max(delay, _retry_after(error))
+
+
+def _retryable(error) -> bool:
+    return isinstance(error, RETRYABLE) or getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def _admission(kwargs) -> float:
+    breaker.before_call()
+    return max(request_bucket.reserve(1), token_bucket.reserve(estimate_tokens(kwargs.get("messages", []))))
+
+
+def _retry_delay(attempt: int, error, end: float) -> float:
+    """Record a retryable failure; return the backoff or raise when out of retries/time."""
+    breaker.record(False)
+    breaker.before_call()  # fail fast instead of sleeping if this failure opened the breaker
+    breaker.release()
+    delay = _backoff(attempt, error)
+    if attempt >= LLM_MAX_RETRIES:
+        raise LLMUnavailableError(f"LLM call failed after {LLM_MAX_RETRIES} retries: {error}",
+                                  retry_after=_retry_after(error)) from error
+    if time.monotonic() + delay >= end:
+        raise LLMUnavailableError(f"LLM call deadline exceeded: {error}", retry_after=delay) from error
+    print(f"[llm_gateway] {type(error).__name__}, retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+    return delay
+
+
+def _remaining(end: float) -> float:
+    remaining = end - time.monotonic()
+    if remaining <= 0:
+        breaker.release()
+        raise LLMUnavailableError("LLM call deadline exceeded while waiting for the rate limit")
+    return remaining
+
+
+async def acreate(client, deadline: float = LLM_CALL_DEADLINE, **kwargs):
+    """`await client.chat.completions.create(**kwargs)` through limits, retries and the breaker."""
+    end = time.monotonic() + deadline
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        wait = _admission(kwargs)
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            response = await client.chat.completions.create(timeout=_remaining(end), **kwargs)
+        except RETRYABLE + (openai.APIStatusError,) as e:
+            if not _retryable(e):
+                breaker.record(True)  # the upstream answered; the request itself was rejected
+                raise
+            await asyncio.sleep(_retry_delay(attempt, e, end))
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record(True)
+        record_usage(kwargs.get("model"), getattr(response, "usage", None))
+        return response
+
+
+def create(client, deadline: float = LLM_CALL_DEADLINE, **kwargs):
+    """Blocking variant of acreate for the sync OpenAI client."""
+    end = time.monotonic() + deadline
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        wait = _admission(kwargs)
+        try:
+            if wait:
+                time.sleep(wait)
+            response = client.chat.completions.create(timeout=_remaining(end), **kwargs)
+        except RETRYABLE + (openai.APIStatusError,) as e:
+            if not _retryable(e):
+                breaker.record(True)
+                raise
+            time.sleep(_retry_delay(attempt, e, end))
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record(True)
+        record_usage(kwargs.get("model"), getattr(response, "usage", None))
+        return response
+
+
+def gateway_stats():
+    return {
+        "breaker": breaker.state,
+        "consecutive_failures": breaker.failures,
+        "rpm_limit": LLM_RPM,
+        "tpm_limit": LLM_TPM,
+        "usage": {model: {**totals, "cached_ratio": round(totals["cached_tokens"] / totals["prompt_tokens"], 4)
+                          if totals["prompt_tokens"] else 0.0}
+                  for model, totals in usage_totals.items()},
+    }
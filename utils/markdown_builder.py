@@ -1,10 +1,25 @@
+import asyncio
 import json
 from pathlib import Path
 from openai import OpenAI
 import os
-import pandas as pd
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from exporter import write_xlsx
+from llm_cache import make_key, markdown_cache
+from llm_client import get_async_client, llm_slot
+from llm_gateway import acreate, create
+from math_formatter import format_item
+from metrics import timed
+
+# retries are handled by llm_gateway
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+MARKDOWN_MODEL = "gpt-4o-mini"
+
+# "llm": gpt-4o-mini only (default), "local": rule-based math_formatter only,
+# "local-with-llm-fallback": local, and gpt-4o-mini for the items the formatter is unsure about
+MARKDOWN_MODES = ("local", "llm", "local-with-llm-fallback")
+MARKDOWN_MODE = os.getenv("MARKDOWN_MODE", "llm")
 
 def build_markdown_prompt(json_data):
     prompt = f"""
@@ -34,19 +49,11 @@ Respond with a JSON list only, same length as input.
     return prompt
 
 
-def generate_markdown(json_data):
+def _parse_markdown(raw, json_data):
     """
-    Calls GPT-5-mini to convert JSON Q/A to Markdown JSON list.
+    Returns (md_list, parsed) where parsed is False when the reply was not valid JSON
+    and the plain question/answer text was used instead.
     """
-    prompt = build_markdown_prompt(json_data)
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}]
-    )
-
-    raw = response.choices[0].message.content
-
     try:
         md_list = json.loads(raw)
         # Ensure each item has question_markdown and answer_markdown
@@ -55,7 +62,7 @@ def generate_markdown(json_data):
                 item["question_markdown"] = item.get("question", "")
             if "answer_markdown" not in item:
                 item["answer_markdown"] = item.get("answer", "")
-        return md_list
+        return md_list, True
     except Exception as e:
         # fallback: convert manually if parse fails
         md_list = []
@@ -66,13 +73,150 @@ def generate_markdown(json_data):
                 "question_markdown": f"{q}",
                 "answer_markdown": f"{a}"
             })
+        return md_list, False
+
+
+def _markdown_key(item):
+    return make_key(MARKDOWN_MODEL, item, prompt="markdown-v1")
+
+
+def _cache_lookup(json_data):
+    """
+    Per-item cache lookup. Returns (md_list with None for misses, indexes of the misses).
+    """
+    md_list = [markdown_cache.get(_markdown_key(item)) for item in json_data]
+    return md_list, [idx for idx, md in enumerate(md_list) if md is None]
+
+
+async def _acache_lookup(json_data):
+    md_list = list(await asyncio.gather(*(markdown_cache.aget(_markdown_key(item)) for item in json_data)))
+    return md_list, [idx for idx, md in enumerate(md_list) if md is None]
+
+
+def _cache_fill(json_data, md_list, missing, fixed, parsed, fallback=None):
+    """
+    Merge the LLM reply for the `missing` items into md_list. `fallback` (one entry per
+    item of json_data, e.g. the local formatting) replaces the misses when the reply is
+    unusable; without it they get the plain text.
+    """
+    # cache per item only when the reply parsed and kept one item per input
+    if parsed and len(fixed) == len(missing):
+        for idx, md in zip(missing, fixed):
+            markdown_cache.set(_markdown_key(json_data[idx]), md)
+            md_list[idx] = md
+        return md_list
+    if fallback is None:
+        if len(missing) == len(json_data):
+            return fixed
+        fallback = _parse_markdown("", json_data)[0]
+    for idx in missing:
+        md_list[idx] = fallback[idx]
+    return md_list
+
+
+def _llm_markdown(json_data, fallback=None):
+    md_list, missing = _cache_lookup(json_data)
+    if not missing:
+        return md_list
+    fixed, parsed = _call_llm_markdown([json_data[idx] for idx in missing])
+    return _cache_fill(json_data, md_list, missing, fixed, parsed, fallback)
+
+
+async def _allm_markdown(json_data, fallback=None):
+    md_list, missing = await _acache_lookup(json_data)
+    if not missing:
         return md_list
+    fixed, parsed = await _acall_llm_markdown([json_data[idx] for idx in missing])
+    return _cache_fill(json_data, md_list, missing, fixed, parsed, fallback)
+
+
+def _call_llm_markdown(json_data):
+    prompt = build_markdown_prompt(json_data)
+
+    response = create(
+        client,
+        model=MARKDOWN_MODEL,
+        messages=[{"role": "user", "content": prompt}]
+    )
+
+    raw = response.choices[0].message.content
+    return _parse_markdown(raw, json_data)
+
+
+async def _acall_llm_markdown(json_data):
+    prompt = build_markdown_prompt(json_data)
+
+    async with llm_slot():
+        response = await acreate(
+            get_async_client(),
+            model=MARKDOWN_MODEL,
+            messages=[{"role": "user", "content": prompt}]
+        )
+
+    raw = response.choices[0].message.content
+    return _parse_markdown(raw, json_data)
+
+
+def _local_markdown(json_data, mode):
+    """
+    Format every item locally. Returns (md_list, indexes of items to send to the LLM).
+    """
+    if mode not in MARKDOWN_MODES:
+        raise ValueError(f"Unknown markdown mode '{mode}'; expected one of {MARKDOWN_MODES}")
+    md_list, unsure = [], []
+    for idx, item in enumerate(json_data):
+        md, confident = format_item(item)
+        md_list.append(md)
+        if not confident:
+            unsure.append(idx)
+    if mode != "local-with-llm-fallback":
+        unsure = []
+    return md_list, unsure
+
+
+def _merge_fallback(md_list, unsure, fixed):
+    for idx, md in zip(unsure, fixed):
+        md_list[idx] = md
+    return md_list
+
+
+@timed("generate_markdown")
+def generate_markdown(json_data, mode=None):
+    """
+    Convert JSON Q/A to Markdown JSON list, using MARKDOWN_MODE (or `mode`):
+    the local math_formatter, GPT-4o-mini, or local with GPT-4o-mini for unsure items.
+    """
+    mode = mode or MARKDOWN_MODE
+    if mode == "llm":
+        return _llm_markdown(json_data)
+    md_list, unsure = _local_markdown(json_data, mode)
+    if unsure:
+        # an unusable LLM reply keeps the local formatting of those items
+        fixed = _llm_markdown([json_data[idx] for idx in unsure], fallback=[md_list[idx] for idx in unsure])
+        md_list = _merge_fallback(md_list, unsure, fixed)
+    return md_list
+
+
+@timed("generate_markdown")
+async def agenerate_markdown(json_data, mode=None):
+    """
+    Async variant of generate_markdown using the shared pooled AsyncOpenAI client.
+    """
+    mode = mode or MARKDOWN_MODE
+    if mode == "llm":
+        return await _allm_markdown(json_data)
+    md_list, unsure = _local_markdown(json_data, mode)
+    if unsure:
+        fixed = await _allm_markdown([json_data[idx] for idx in unsure], fallback=[md_list[idx] for idx in unsure])
+        md_list = _merge_fallback(md_list, unsure, fixed)
+    return md_list
 
 
 def save_markdown_as_excel(markdown_list, output_path: Path):
     """
     Save the Markdown list into Excel file.
+    A dict of {sheet name: markdown list} writes one sheet per entry into the same workbook.
     """
-    df = pd.DataFrame(markdown_list)
-    df.to_excel(output_path, index=False, engine='openpyxl')
+    with open(output_path, "wb") as f:
+        write_xlsx(markdown_list, f)
     return output_path
@@ -0,0 +1,408 @@
+# math_formatter.py
+"""
+Deterministic, local replacement for the gpt-4o-mini markdown pass.
+
+Applies the rules of markdown_builder.build_markdown_prompt without an LLM call:
+- words and context are kept exactly as they are
+- math spans (numbers, operators, ^, fractions, sets, coordinates, function names,
+  equations and number-with-unit quantities) are wrapped in $…$
+- formulas with a function name and an "=" are wrapped in $$…$$
+- several formulas on one line are wrapped individually
+
+format_text() also reports whether it is confident about its output, so callers can
+send the unsure items to the LLM formatter instead (MARKDOWN_MODE=local-with-llm-fallback).
+"""
+import re
+
+FUNCTIONS = {"sin", "cos", "tan", "log", "ln", "exp", "sqrt"}
+UNITS = (r"(?:km|cm|mm|m)/(?:s|h)|cm|mm|km|kg|mg|ml|mol|Hz|kW|kPa|Pa|kV|mV|mA|kJ|MJ|MW|dm|nm|°C"
+         r"|g|m|s|h|N|J|W|V|A|K|L")
+GREEK = {"θ": r"\theta", "α": r"\alpha", "β": r"\beta", "γ": r"\gamma", "λ": r"\lambda",
+         "μ": r"\mu", "π": r"\pi", "σ": r"\sigma", "Σ": r"\Sigma", "Δ": r"\Delta",
+         "δ": r"\delta", "ω": r"\omega", "Ω": r"\Omega"}
+OPS = {"*": r"\times", "×": r"\times", "·": r"\cdot", "÷": r"\div", "<=": r"\le", "≤": r"\le",
+       ">=": r"\ge", "≥": r"\ge", "!=": r"\neq", "≠": r"\neq", "±": r"\pm", "−": "-",
+       "%": r"\%", "°": r"^\circ", "∘": r"^\circ"}
+SUPERSCRIPTS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹⁻", "0123456789-")
+# operators that never join two plain words ("well-known", "and/or")
+_WORD_JOINERS = {"-", "/", "–"}
+_RELATIONS = {"=", "<", ">", "<=", ">=", "!=", "≤", "≥", "≠"}
+# a number after these words is a label ("Figure 5", "Force 1:", "Step 2"), not math
+LABELS = {"figure", "fig", "table", "force", "solution", "question", "step", "stage", "part",
+          "method", "mistake", "experiment", "example", "equation", "graph", "diagram", "option"}
+# numbers: "25 000" (space as thousands separator) is one number
+_NUMBER = r"\d{1,3}(?: \d{3})+(?!\d)(?:\.\d+)?|\d+(?:\.\d+)?"
+
+_TOKEN_RE = re.compile(
+    r"(?P<space>\s+)"
+    r"|(?P<qty>(?P<qnum>" + _NUMBER + r")(?P<qsp> ?)(?P<unit>" + UNITS + r")(?P<uexp>\^?[23]|[²³])?"
+    r"(?![A-Za-z]|\.[A-Za-z]))"  # "3 s.f" is not 3 seconds
+    r"|(?P<num>" + _NUMBER + r")"
+    r"|(?P<word>[A-Za-z]+(?:['’][A-Za-z]+)?)"
+    r"|(?P<sup>[⁰¹²³⁴⁵⁶⁷⁸⁹⁻]+)"
+    r"|(?P<op><=|>=|!=|[+\-*/=^<>×÷±≤≥≠√%°∘·−–])"
+    r"|(?P<open>[(\[{])"
+    r"|(?P<close>[)\]}])"
+    r"|(?P<conn>[,:])"
+    r"|(?P<greek>[" + "".join(GREEK) + r"])"
+    r"|(?P<other>.)",
+    re.S,
+)
+_FUNC_VAR_RE = re.compile(r"^(sin|cos|tan|log|ln)([xyz])$")
+# chemical formulas (H2O, CO2, C3H7) and ions (H+, OH–, Ti4+): the rules do not cover
+# them, leave them to the LLM
+_CHEMICAL_RE = re.compile(
+    r"(?<![A-Za-z])(?=[A-Za-z]*\d)(?:[A-Z][a-z]?\d*){2,}(?![a-z])"
+    r"|(?<![A-Za-z])(?:[A-Z][a-z]?\d*)+[+\-–−](?=\s|$|[,.;)])"
+    r"|[→⇌]"
+)
+_PAIRS = {")": "(", "]": "[", "}": "{"}
+_UNIT_RE = re.compile(UNITS)
+# "2 m/s \n2\n": a superscript that lost its formatting in the source
+_LOST_EXPONENT_RE = re.compile(r"(?:" + UNITS + r")[ \t]*\n\s*[23]\s*(?:\n|$)")
+
+
+class _Tok:
+    __slots__ = ("kind", "text", "m", "math", "glued")
+
+    def __init__(self, kind, text, m):
+        self.kind, self.text, self.m = kind, text, m
+        self.math = False
+        self.glued = False
+
+
+def _tokenize(text):
+    return [_Tok(m.lastgroup if m.lastgroup not in ("qnum", "qsp", "unit", "uexp") else "qty", m.group(), m)
+            for m in _TOKEN_RE.finditer(text)]
+
+
+def _neighbour(toks, i, step):
+    j = i + step
+    while 0 <= j < len(toks) and toks[j].kind == "space":
+        j += step
+    return toks[j] if 0 <= j < len(toks) else None
+
+
+def _is_ambiguous_word(w):
+    # "a", capital letters (MCQ options, points) and short capitalised names (ABC, AB)
+    # are math only next to an operator
+    return w == "a" or (len(w) <= 3 and w.isupper())
+
+
+def _classify(text, toks):
+    """Mark math tokens; returns True if the text contains chemical formulas (see _mask_chemicals)."""
+    for i, t in enumerate(toks):
+        if t.kind == "num":
+            # digits glued to a word ("Column1", "Q2a") are labels, not math
+            glued = [n for n in (toks[i - 1] if i else None, toks[i + 1] if i + 1 < len(toks) else None)
+                     if n is not None and n.kind == "word" and len(n.text) > 1]
+            t.math = not glued
+            t.glued = bool(glued)
+            # list numbering at the start of a line or sentence ("1.", "2)") is text
+            prev_t, next_t = _neighbour(toks, i, -1), _neighbour(toks, i, 1)
+            line_start = i == 0 or (toks[i - 1].kind == "space" and "\n" in toks[i - 1].text)
+            sentence_start = (prev_t is not None and prev_t.text == "." and i + 2 < len(toks)
+                              and toks[i + 2].kind == "space")
+            if (line_start or sentence_start) and i + 1 < len(toks) and toks[i + 1].text in (".", ")"):
+                t.math = False
+            # labels ("Figure 5", "Step 1") and mark allocations ("[1 mark]")
+            if prev_t is not None and prev_t.kind == "word" and prev_t.text.lower() in LABELS and not t.glued:
+                t.math = False
+            if next_t is not None and next_t.kind == "word" and next_t.text.lower() in ("mark", "marks"):
+                t.math = False
+        elif t.kind in ("qty", "greek", "sup"):
+            t.math = True
+        elif t.kind == "conn" and t.text == ":":
+            # times and ratios (8:15, 24 : 8); otherwise a label colon ("Solution 1: ...")
+            prev_t, next_t = _neighbour(toks, i, -1), _neighbour(toks, i, 1)
+            if not (prev_t is not None and next_t is not None and prev_t.kind == "num" and next_t.kind == "num"):
+                t.kind = "other"
+        elif t.kind == "op":
+            prev_t, next_t = (toks[i - 1] if i else None), (toks[i + 1] if i + 1 < len(toks) else None)
+            joins_words = (t.text in _WORD_JOINERS and prev_t is not None and next_t is not None
+                           and prev_t.kind == "word" and next_t.kind == "word"
+                           and len(prev_t.text) > 1 and len(next_t.text) > 1)
+            t.math = not joins_words
+        elif t.kind == "word":
+            w = t.text
+            if w.lower() in FUNCTIONS or _FUNC_VAR_RE.match(w):
+                t.math = True
+            elif _UNIT_RE.fullmatch(w) and (_neighbour(toks, i, -1) or t).kind == "sup":
+                # the unit of a power of ten: "4.0 × 10⁻⁵ m³", "5.25 × 10⁵ J"
+                t.kind = "unit"
+                t.math = True
+            elif len(w) == 1 and not _is_ambiguous_word(w):
+                # abbreviations like "a.c.", "e.g." or "s.f" are text; "in terms of d." is not one
+                dotted = ((i >= 2 and toks[i - 1].text == "." and toks[i - 2].kind == "word")
+                          or (i + 2 < len(toks) and toks[i + 1].text == "." and toks[i + 2].kind == "word"))
+                # option labels at the start of a line: "b. Alkaline", "c) 12"
+                line_start = i == 0 or (toks[i - 1].kind == "space" and "\n" in toks[i - 1].text)
+                label = line_start and i + 1 < len(toks) and toks[i + 1].text in (".", ")")
+                t.math = not (dotted or label)
+    has_chemicals = _mask_chemicals(text, toks)
+    # second pass: ambiguous words count as math when an operator is next to them,
+    # or when they are applied to a bracket like a point or function: A(2, 3), P(x).
+    # "A." / "B." are option labels.
+    for i, t in enumerate(toks):
+        if t.kind == "word" and not t.math and _is_ambiguous_word(t.text):
+            if i + 1 < len(toks) and toks[i + 1].text == ".":
+                continue
+            if i + 1 < len(toks) and toks[i + 1].kind == "open":
+                t.math = True
+            if i and toks[i - 1].text == "£":
+                # an amount of money: "£C"
+                t.math = True
+            for n in (_neighbour(toks, i, -1), _neighbour(toks, i, 1)):
+                if n is not None and n.kind == "op" and n.math and n.text not in _WORD_JOINERS:
+                    t.math = True
+    return has_chemicals
+
+
+def _mask_chemicals(text, toks):
+    """Keep chemical formulas as plain text; returns True if the text contains any."""
+    spans = [m.span() for m in _CHEMICAL_RE.finditer(text)]
+    for t in toks:
+        if any(a <= t.m.start() < b for a, b in spans):
+            t.math = False
+    return bool(spans)
+
+
+def _span_ok(toks, start, end):
+    """Bracket balance of toks[start:end]: returns (unmatched opens, unmatched closes) index lists."""
+    stack, bad_close = [], []
+    for i in range(start, end):
+        t = toks[i]
+        if t.kind == "open":
+            stack.append(i)
+        elif t.kind == "close":
+            if stack and toks[stack[-1]].text == _PAIRS[t.text]:
+                stack.pop()
+            else:
+                bad_close.append(i)
+    return stack, bad_close
+
+
+def _trim(toks, start, end):
+    """Shrink [start, end) until it starts/ends on a math token with balanced edge brackets."""
+    while start < end:
+        opens, closes = _span_ok(toks, start, end)
+        unmatched = set(opens) | set(closes)
+        t_first, t_last = toks[start], toks[end - 1]
+        if t_first.kind in ("space", "conn") or start in unmatched:
+            start += 1
+        elif t_last.kind in ("space", "conn") or (end - 1) in unmatched:
+            end -= 1
+        elif t_first.kind == "op" and t_first.text in _RELATIONS:
+            # "speed = 4 m/s": the left-hand side is words, keep "=" in the text
+            start += 1
+        elif t_last.kind == "op" and t_last.text not in ("%", "°", "∘"):
+            end -= 1
+        else:
+            break
+    return start, end
+
+
+def _group_end(toks, i):
+    """Index just past the bracket group opening at toks[i]."""
+    depth = 0
+    for j in range(i, len(toks)):
+        if toks[j].kind == "open":
+            depth += 1
+        elif toks[j].kind == "close":
+            depth -= 1
+            if depth == 0:
+                return j + 1
+    return len(toks)
+
+
+def _to_latex(toks):
+    out = []
+    i = 0
+    while i < len(toks):
+        t = toks[i]
+        nxt = toks[i + 1] if i + 1 < len(toks) else None
+        if t.kind == "num" and nxt is not None and nxt.text == "/" and i + 2 < len(toks) and toks[i + 2].kind == "num":
+            out.append(r"\frac{%s}{%s}" % (t.text, toks[i + 2].text))
+            i += 3
+            continue
+        if t.kind == "qty":
+            m = t.m
+            latex = r"%s\text{ %s}" % (m.group("qnum"), m.group("unit"))
+            exp = m.group("uexp")
+            if exp:
+                latex += "^{%s}" % exp.lstrip("^").replace("²", "2").replace("³", "3")
+            out.append(latex)
+        elif t.kind == "op" and t.text in ("^", "√") and nxt is not None:
+            if nxt.kind == "open":
+                end = _group_end(toks, i + 1)
+                inner = _to_latex(toks[i + 2:end - 1])
+                out.append("^{%s}" % inner if t.text == "^" else r"\sqrt{%s}" % inner)
+                i = end
+                continue
+            inner = _to_latex([nxt])
+            out.append(("^{%s}" if t.text == "^" else r"\sqrt{%s}") % inner)
+            i += 2
+            continue
+        elif t.kind == "word" and t.text.lower() == "sqrt" and nxt is not None and nxt.kind == "open":
+            end = _group_end(toks, i + 1)
+            out.append(r"\sqrt{%s}" % _to_latex(toks[i + 2:end - 1]))
+            i = end
+            continue
+        elif t.kind == "unit":
+            if out and out[-1].isspace():
+                out.pop()
+            out.append(r"\text{ %s}" % t.text)
+        elif t.kind == "word" and t.text == "x" and _between_numbers(toks, i):
+            # "2 x 27" uses x as the multiplication sign
+            out.append(r"\times")
+        elif t.kind == "word" and t.text.lower() in FUNCTIONS:
+            out.append("\\" + t.text.lower())
+        elif t.kind == "word" and _FUNC_VAR_RE.match(t.text):
+            fn, var = _FUNC_VAR_RE.match(t.text).groups()
+            out.append(r"\%s %s" % (fn, var))
+        elif t.kind == "op":
+            out.append(OPS.get(t.text, "-" if t.text == "–" else t.text))
+        elif t.kind == "greek":
+            out.append(GREEK[t.text])
+        elif t.kind == "sup":
+            out.append("^{%s}" % t.text.translate(SUPERSCRIPTS))
+        elif t.text == "{":
+            out.append(r"\{")
+        elif t.text == "}":
+            out.append(r"\}")
+        else:
+            out.append(t.text)
+        i += 1
+    # "\times" followed by a letter needs a separating space
+    joined = ""
+    for piece in out:
+        if piece[:1].isalpha() and re.search(r"\\[A-Za-z]+$", joined):
+            joined += " "
+        joined += piece
+    return joined
+
+
+def _between_numbers(toks, i):
+    """toks[i] stands alone between two numbers (or bracket groups): "2 x 27", "(1 x 2)"."""
+    return (1 < i < len(toks) - 2 and toks[i - 1].kind == toks[i + 1].kind == "space"
+            and toks[i - 2].kind in ("num", "close") and toks[i + 2].kind in ("num", "open"))
+
+
+def _span_unsure(toks, start, stop):
+    """Spans the rules read one way but that may mean another."""
+    span = toks[start:stop]
+    for a, b, c in zip(span, span[1:], span[2:]):
+        # "0 6 . 2", "(63.5 2 + 79.5)": numbers split by a space are not one number
+        if a.kind == "num" and b.kind == "space" and b.text == " " and c.kind == "num":
+            return True
+    has_variable = any(k.kind == "word" and len(k.text) == 1 and k.math and k.text != "x" for k in span)
+    for k in span:
+        # "W=20+15h": h is an hour count here, not the unit
+        if k.kind == "qty" and has_variable and not k.m.group("qsp") and len(k.m.group("unit")) == 1:
+            return True
+    for a, b, c in zip(span, span[1:], span[2:]):
+        # a unit in brackets after the value, "= 50 (g)", would read as a variable
+        if a.kind == "open" and b.kind == "word" and _UNIT_RE.fullmatch(b.text) and c.kind == "close":
+            return True
+    # a bracket glued to a word: "gf(−2)"
+    return toks[start].kind == "open" and start > 0 and toks[start - 1].kind == "word" and not toks[start - 1].math
+
+
+def _is_formula(toks):
+    has_eq = any(t.kind == "op" and t.text == "=" for t in toks)
+    has_func = any(
+        (t.kind == "word" and (t.text.lower() in FUNCTIONS or _FUNC_VAR_RE.match(t.text)))
+        or (t.kind == "word" and len(t.text) == 1 and i + 1 < len(toks) and toks[i + 1].text == "(")
+        for i, t in enumerate(toks)
+    )
+    return has_eq and has_func
+
+
+def format_text(text):
+    """
+    Wrap the math in `text`. Returns (markdown, confident). Text that already contains
+    balanced $ delimiters is returned unchanged.
+    """
+    text = "" if text is None else str(text)
+    if "$" in text:
+        return text, text.count("$") % 2 == 0
+    if "\\" in text:
+        # raw LaTeX without delimiters: leave it alone and let the caller decide
+        return text, False
+    confident = True
+
+    toks = _tokenize(text)
+    if _classify(text, toks):
+        # chemical formulas / reaction equations: leave the text alone
+        return text, False
+
+    # a plain word glued to a math token ("age=4x", "and2x", "Kepler-445d") is ambiguous
+    if any(t.glued for t in toks):
+        confident = False
+    # LaTeX alignment ("&=") and exponents that lost their formatting
+    if "&=" in text or _LOST_EXPONENT_RE.search(text):
+        confident = False
+    # the same letter as math in one place and as text in another ("a" article and variable)
+    letters = {}
+    for t in toks:
+        if t.kind == "word" and len(t.text) == 1:
+            letters.setdefault(t.text, set()).add(t.math)
+    if any(len(seen) > 1 for seen in letters.values()):
+        confident = False
+    for i, t in enumerate(toks):
+        if t.math:
+            for n in (toks[i - 1] if i else None, toks[i + 1] if i + 1 < len(toks) else None):
+                if n is not None and n.kind == "word" and not n.math:
+                    confident = False
+
+    out = []
+    i = 0
+    while i < len(toks):
+        t = toks[i]
+        if not (t.math or t.kind == "open"):
+            out.append(t.text)
+            i += 1
+            continue
+        # grow the candidate span over math tokens, brackets, connectors and same-line spaces
+        end = i
+        while end < len(toks):
+            k = toks[end]
+            if k.math or k.kind in ("open", "close", "conn") or (k.kind == "space" and "\n" not in k.text):
+                end += 1
+            else:
+                break
+        start, stop = _trim(toks, i, end)
+        span = toks[start:stop]
+        if not any(k.math for k in span):
+            out.append(toks[i].text)
+            i += 1
+            continue
+        if (toks[start].kind == "open" and start > 0 and toks[start - 1].kind == "word"
+                and all(k.kind in ("open", "close", "word") for k in span)):
+            # a bracketed letter glued to a word is a suffix: "large(r)"
+            out.extend(k.text for k in toks[i:stop])
+            i = stop
+            continue
+        opens, closes = _span_ok(toks, start, stop)
+        if opens or closes or _span_unsure(toks, start, stop):
+            confident = False
+        if any(k.kind == "op" and k.text in _RELATIONS for k in toks[stop:end]):
+            # "F = ma": the right-hand side is words, the formula is not all math
+            confident = False
+        out.extend(k.text for k in toks[i:start])
+        latex = _to_latex(span)
+        out.append(("$$%s$$" if _is_formula(span) else "$%s$") % latex)
+        i = stop
+    return "".join(out), confident
+
+
+def format_item(item):
+    """
+    Format one {"question", "answer"} item into
+    ({"question_markdown", "answer_markdown"}, confident).
+    """
+    if not isinstance(item, dict):
+        item = {"question": str(item), "answer": ""}
+    q_md, q_ok = format_text(item.get("question", ""))
+    a_md, a_ok = format_text(item.get("answer", ""))
+    return {"question_markdown": q_md, "answer_markdown": a_md}, (q_ok and a_ok)
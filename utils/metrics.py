@@ -0,0 +1,148 @@
+# metrics.py
+"""
+Stage timings for the generation pipeline, exported two ways:
+- Prometheus text format on /metrics: qgen_stage_seconds{stage=...} and
+  qgen_http_request_seconds{route=...,status=...} histograms, plus counters collected
+  from the LLM gateway (token usage), the LLM caches, the question pool and dedup
+- a Server-Timing header on every response, one entry per stage run for that request
+
+Wrap a stage with `with span("name"):` or decorate it with `@timed("name")` (sync or
+async). Spans inside run_in_threadpool still count towards the request's header,
+since the worker thread runs in a copy of the request's context.
+"""
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            items = [(labels, list(series)) for labels, series in items]
+        for label_values, series in items:
+            base = _labels(self.label_names, label_values)
+            sep = "," if base else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+stage_seconds = Histogram("qgen_stage_seconds", "Duration of generation pipeline stages.", ("stage",))
+http_request_seconds = Histogram("qgen_http_request_seconds", "Duration of HTTP requests (until the response starts).",
+                                 ("route", "status"))
+
+_collectors = []
+
+
+def register_collector(collect):
+    """
+    Add a callable returning [(name, type, help, [(labels dict, value), ...]), ...],
+    evaluated on every /metrics scrape (for counters kept by other modules).
+    """
+    _collectors.append(collect)
+
+
+def record_stage(stage: str, seconds: float):
+    stage_seconds.observe(seconds, stage)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage: str):
+    """Decorator form of span() for plain and async functions."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def start_request():
+    """Begin collecting spans for the current request; returns the token for end_request."""
+    return _request_spans.set([])
+
+
+def end_request(token):
+    """Stop collecting and return the request's spans as a Server-Timing header value."""
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    totals = {}
+    for stage, seconds in spans:
+        total, count = totals.get(stage, (0.0, 0))
+        totals[stage] = (total + seconds, count + 1)
+    return ", ".join(f'{stage};dur={total * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+                     for stage, (total, count) in totals.items())
+
+
+def render_metrics() -> str:
+    lines = stage_seconds.render() + http_request_seconds.render()
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            print(f"[metrics] collector failed: {e}")
+            continue
+        for name, kind, help_text, samples in families:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                base = _labels(labels.keys(), labels.values())
+                lines.append(f"{name}{{{base}}} {value}" if base else f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,139 @@
+import hashlib
+import math
+import os
+import re
+from pathlib import Path
 from typing import List, Dict, Optional
 
+# input-token budget for a generation prompt (0 = unlimited)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+# tiktoken encoding; its BPE file is vendored in PROMPT_TOKENIZER_DIR (scripts/fetch_tokenizer.py)
+# and never downloaded at runtime: without it, tokens are counted with the local estimate
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "o200k_base")
+PROMPT_TOKENIZER_DIR = Path(os.getenv("PROMPT_TOKENIZER_DIR", "tokenizer"))
+# successive per-answer token caps tried before examples are dropped
+ANSWER_TOKEN_CAPS = (160, 80, 40)
+# "classic" (default): the original layout with the parameters ahead of the few-shots;
+# "cache": instructions, topic and few-shots first and the per-request parameters last, so
+# prompts for one topic share a prefix the provider can cache. It also makes few-shot
+# sampling stable (fewshot.FEWSHOT_SAMPLING), otherwise the prefix changes every request.
+# OpenAI only caches prefixes of >= 1024 tokens; the curated topics hold few enough
+# examples that most prefixes stay well below that, hence not the default.
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "classic")
+
+_BPE_URLS = {
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+}
+
+_encoding = None
+_TOKEN_RE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]|\s+")
+
+def bpe_path(name: str = PROMPT_TOKENIZER) -> Path:
+    """Vendored BPE file of encoding `name`, named the way tiktoken's TIKTOKEN_CACHE_DIR expects."""
+    return PROMPT_TOKENIZER_DIR / hashlib.sha1(_BPE_URLS[name].encode()).hexdigest()
+
+def _load_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            if not bpe_path().exists():
+                raise FileNotFoundError(f"{bpe_path()} missing, run scripts/fetch_tokenizer.py")
+            # tiktoken reads (and checks the hash of) the vendored file instead of downloading it
+            os.environ["TIKTOKEN_CACHE_DIR"] = str(PROMPT_TOKENIZER_DIR)
+            import tiktoken
+            _encoding = tiktoken.get_encoding(PROMPT_TOKENIZER)
+        except Exception as e:
+            print(f"[prompt] tokenizer {PROMPT_TOKENIZER} unavailable ({e}), using the token estimate")
+            _encoding = False
+    return _encoding
+
+def tokenizer_name() -> str:
+    return PROMPT_TOKENIZER if _load_encoding() else "estimate"
+
+def count_tokens(text: str) -> int:
+    """
+    Token count of `text` with tiktoken, or a close local estimate: words count one
+    token per ~5 letters, numbers one per 3 digits, each symbol and whitespace run one.
+    """
+    enc = _load_encoding()
+    if enc:
+        return len(enc.encode(text))
+    return sum(math.ceil(len(t) / 5) if t[0].isalpha() else 1 for t in _TOKEN_RE.findall(text))
+
+def _truncate_tokens(text, cap: int) -> str:
+    text = "" if text is None else str(text)
+    if count_tokens(text) <= cap:
+        return text
+    words = text.split(" ")
+    lo, hi = 0, len(words)
+    while lo < hi:  # longest word prefix within the cap
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= cap:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + " …"
+
+def _rank_fewshots(fewshots, difficulty):
+    # examples at the requested difficulty first (classic layout only, so the cache layout
+    # keeps one order per topic), then shorter ones; trimming drops from the end
+    def key(item):
+        idx, fs = item
+        same = PROMPT_LAYOUT != "cache" and \
+            str(fs.get("difficulty", "")).strip().lower() == str(difficulty or "").strip().lower()
+        return (not same, len(str(fs.get("question", ""))) + len(str(fs.get("answer", ""))), idx)
+    return [fs for _, fs in sorted(enumerate(fewshots), key=key)]
+
+def build_budgeted_prompt(
+    subject: str,
+    curriculam: str,
+    topic: str,
+    qtype: Optional[str],
+    difficulty: str,
+    fewshots: List[Dict],
+    num_questions: int,
+    budget: int = PROMPT_TOKEN_BUDGET
+):
+    """
+    build_generation_prompt within `budget` input tokens. Over budget, few-shots are
+    trimmed in order: hints dropped, answers truncated (ANSWER_TOKEN_CAPS), then the
+    lowest-ranked examples dropped (at least one is kept).
+    Returns (prompt, stats) with the token counts before and after trimming.
+    """
+    def render(shots, hints=True):
+        return _render_prompt(subject, curriculam, topic, qtype, difficulty, shots, num_questions, hints)
+
+    prompt = render(fewshots)
+    tokens = full_tokens = count_tokens(prompt)
+    stats = {"prompt_tokens": tokens, "untrimmed_tokens": full_tokens, "budget": budget,
+             "fewshots": len(fewshots), "fewshots_kept": len(fewshots),
+             "hints_dropped": False, "answer_cap": None, "tokenizer": tokenizer_name()}
+    if not budget or tokens <= budget or not fewshots:
+        return prompt, stats
+
+    shots = _rank_fewshots(fewshots, difficulty)
+    hints = True
+    steps = [("hints", None)] + [("answers", cap) for cap in ANSWER_TOKEN_CAPS]
+    for step, cap in steps:
+        if step == "hints":
+            hints = False
+            stats["hints_dropped"] = True
+        else:
+            shots = [{**fs, "answer": _truncate_tokens(fs.get("answer"), cap)} for fs in shots]
+            stats["answer_cap"] = cap
+        prompt = render(shots, hints)
+        tokens = count_tokens(prompt)
+        if tokens <= budget:
+            break
+    while tokens > budget and len(shots) > 1:
+        shots = shots[:-1]
+        prompt = render(shots, hints)
+        tokens = count_tokens(prompt)
+
+    stats.update(prompt_tokens=tokens, fewshots_kept=len(shots))
+    return prompt, stats
+
 def build_generation_prompt(
     subject: str,
     curriculam: str,
@@ -9,6 +143,11 @@ def build_generation_prompt(
     fewshots: List[Dict],
     num_questions: int
 ):
+    """Generation prompt with the few-shots trimmed to PROMPT_TOKEN_BUDGET."""
+    prompt, _ = build_budgeted_prompt(subject, curriculam, topic, qtype, difficulty, fewshots, num_questions)
+    return prompt
+
+def _render_prompt(subject, curriculam, topic, qtype, difficulty, fewshots, num_questions, include_hints=True):
     s = subject.lower()
 
     if s in ["math"]:
@@ -17,7 +156,8 @@ def build_generation_prompt(
              topic=topic,
              difficulty=difficulty,
              fewshots=fewshots,
-             num_questions=num_questions)
+             num_questions=num_questions,
+             include_hints=include_hints)
 
     if s in ["physics", "chemistry"]:
         return prompt_science(
@@ -36,17 +176,26 @@ def build_generation_prompt(
          fewshots=fewshots,
          num_questions=num_questions)
 
-def prompt_math(curriculam, topic, difficulty, fewshots, num_questions):
+def prompt_math(curriculam, topic, difficulty, fewshots, num_questions, include_hints=True):
 
     fewshot_text = ""
     for fs in fewshots:
+        fewshot_text += f"Q: {fs['question']}\n"
+        if include_hints:
+            fewshot_text += f"Hint: {fs['hint']}\n"
         fewshot_text += (
-            f"Q: {fs['question']}\n"
-            f"Hint: {fs['hint']}\n"
             f"A: {fs['answer']}\n"
             f"Diff: {fs['difficulty']}\n\n"
         )
 
+    if PROMPT_LAYOUT == "cache":
+        return _cache_layout_prompt(
+            "You are a math question generator. You must create clear, accurate, logically consistent math questions.",
+            curriculam, topic, fewshot_text,
+            request_lines=[f"Difficulty: {difficulty}", f"Number of questions: {num_questions}"],
+            level=f"{difficulty} level",
+            num_questions=num_questions)
+
     prompt = f"""
     You are a math question generator. You must create clear, accurate, logically consistent math questions.
 
@@ -79,6 +228,14 @@ def prompt_science(curriculam, subject, topic, qtype, difficulty, fewshots, num_
             f"Qtype: {fs['question_type']}\n"
         )
 
+    if PROMPT_LAYOUT == "cache":
+        return _cache_layout_prompt(
+            f"You are a {subject} question generator. You must create clear, accurate, logically consistent {subject} questions.",
+            curriculam, topic, fewshot_text,
+            request_lines=[f"Question Type: {qtype}", f"Difficulty: {difficulty}", f"Number of questions: {num_questions}"],
+            level=f"{difficulty} level and {qtype} type",
+            num_questions=num_questions)
+
     prompt = f"""
     You are a {subject} question generator. You must create clear, accurate, logically consistent {subject} questions.
 
@@ -102,6 +259,28 @@ def prompt_science(curriculam, subject, topic, qtype, difficulty, fewshots, num_
     """
     return prompt
 
+def _cache_layout_prompt(role, curriculam, topic, fewshot_text, request_lines, level, num_questions):
+    """Static instructions + per-topic few-shots first, per-request parameters last."""
+    request = "\n".join(request_lines)
+    return f"""{role}
+Generate answers only. DON'T generate hint.
+Respond ONLY in strict JSON list format:
+[
+{{"question": "...", "answer": "..."}},
+...
+]
+
+Curriculam: {curriculam}
+Topic: {topic}
+
+Here are few-shot examples for reference:
+{fewshot_text}
+Request:
+{request}
+Now generate {num_questions} NEW questions and their answers of the {curriculam} standard curriculam.
+You MUST generate questions of {level}.
+"""
+
 def prompt_default(topic, difficulty, fewshots, num_questions):
 
         return f"""
@@ -0,0 +1,212 @@
+# question_pool.py
+"""
+Pre-generated question pool.
+
+Keeps up to QUESTION_POOL_SIZE already markdown-formatted questions per combination
+(subject, curriculum, chapter, topic, question type, difficulty) listed in the
+topic catalog; the list follows the catalog when it is reloaded. /generate takes from a pool when it holds enough items;
+a pool that drops below QUESTION_POOL_LOW_WATER (or misses) is queued for a
+background refill. With QUESTION_POOL_OFFPEAK_HOURS set (e.g. "1-6"), every
+combination below the low-water mark is also topped up during those hours.
+
+Configured through environment variables:
+    QUESTION_POOL_ENABLED        "1" to serve from and refill pools (default off)
+    QUESTION_POOL_SIZE           items kept per combination (default 40)
+    QUESTION_POOL_LOW_WATER      refill below this many items (default 10)
+    QUESTION_POOL_BATCH          questions per refill LLM request (default 10)
+    QUESTION_POOL_WORKERS        concurrent refills (default 2)
+    QUESTION_POOL_OFFPEAK_HOURS  local hours for the full sweep, "start-end" (default: none)
+"""
+import asyncio
+import datetime
+import os
+from collections import deque
+
+QUESTION_POOL_ENABLED = os.getenv("QUESTION_POOL_ENABLED", "0") == "1"
+QUESTION_POOL_SIZE = int(os.getenv("QUESTION_POOL_SIZE", "40"))
+QUESTION_POOL_LOW_WATER = int(os.getenv("QUESTION_POOL_LOW_WATER", "10"))
+QUESTION_POOL_BATCH = int(os.getenv("QUESTION_POOL_BATCH", "10"))
+QUESTION_POOL_WORKERS = int(os.getenv("QUESTION_POOL_WORKERS", "2"))
+QUESTION_POOL_OFFPEAK_HOURS = os.getenv("QUESTION_POOL_OFFPEAK_HOURS", "")
+
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+SWEEP_INTERVAL = 600  # seconds between off-peak sweeps
+
+
+def pool_key(fields: dict):
+    """Case-folded key of a /generate request (QuestionRequest fields)."""
+    subject = str(fields.get("subject") or "Math").strip().casefold()
+    curriculum = str(fields.get("curriculum") or "").strip().casefold()
+    if subject == "math" and curriculum == "gcse":
+        chapter = fields.get("chapter_num")
+    else:
+        chapter = fields.get("chapter_name")
+    qtype = fields.get("question_type") if subject != "math" else None
+    return tuple(str(v or "").strip().casefold()
+                 for v in (subject, curriculum, chapter, fields.get("topic"), qtype, fields.get("difficulty")))
+
+
+def iter_combinations(snap):
+    """Yield the request fields of every combination in a catalog.CatalogSnapshot."""
+    for difficulty in DIFFICULTIES:
+        for chapter, topics in (snap.math_gcse or {}).items():
+            for topic in topics:
+                yield {"subject": "Math", "curriculum": "GCSE", "chapter_num": int(chapter),
+                       "topic": topic, "difficulty": difficulty}
+        for chapter, topics in (snap.math_alevel or {}).values():
+            for topic in topics:
+                yield {"subject": "Math", "curriculum": "ALEVEL", "chapter_name": chapter,
+                       "topic": topic, "difficulty": difficulty}
+        for (subject, curriculum), entry in sorted(snap.science.items()):
+            if curriculum != "gcse":
+                continue
+            for chapter, topics, qtypes in entry["by_chapter"].values():
+                for topic in topics:
+                    for qtype in qtypes:
+                        yield {"subject": subject.capitalize(), "curriculum": "GCSE", "chapter_name": chapter,
+                               "topic": topic, "question_type": qtype, "difficulty": difficulty}
+
+
+def _offpeak_hours(spec: str):
+    if not spec:
+        return set()
+    start, end = (int(h) % 24 for h in spec.split("-"))
+    if start <= end:
+        return set(range(start, end + 1))
+    return set(range(start, 24)) | set(range(0, end + 1))
+
+
+class QuestionPool:
+    def __init__(self, size: int = QUESTION_POOL_SIZE, low_water: int = QUESTION_POOL_LOW_WATER,
+                 batch: int = QUESTION_POOL_BATCH, workers: int = QUESTION_POOL_WORKERS,
+                 offpeak_hours: str = QUESTION_POOL_OFFPEAK_HOURS):
+        self.size = size
+        self.low_water = low_water
+        self.batch = batch
+        self.workers = workers
+        self.offpeak = _offpeak_hours(offpeak_hours)
+        self.combinations = {}   # key -> request fields
+        self._snapshot = None    # callable returning the current catalog snapshot
+        self._snap = None        # snapshot self.combinations was built from
+        self._pools = {}         # key -> deque of (question, markdown)
+        self._pending = set()
+        self._empty = set()      # combinations without any few-shot examples
+        self._queue = None
+        self._tasks = []
+        self._fill = None
+        self.hits = 0
+        self.misses = 0
+        self.refilled = 0
+
+    def start(self, fill, snapshot):
+        """
+        Start the refill workers. `fill(fields, count)` is a coroutine returning a list
+        of (question, markdown) pairs for the combination described by `fields`;
+        the combinations come from `snapshot()`, the current catalog snapshot
+        (e.g. catalog.snapshot), and are rebuilt whenever it returns a new one.
+        """
+        self._fill = fill
+        self._snapshot = snapshot
+        self.refresh()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.offpeak:
+            self._tasks.append(asyncio.create_task(self._sweep()))
+        print(f"[question_pool] {len(self.combinations)} combinations, size={self.size}, low_water={self.low_water}")
+
+    def refresh(self):
+        """Rebuild the combinations if the catalog snapshot changed; drop pools no longer listed."""
+        snap = self._snapshot()
+        if snap is self._snap:
+            return
+        combinations = {pool_key(fields): fields for fields in iter_combinations(snap)}
+        if self._snap is not None:
+            for key in [key for key in self._pools if key not in combinations]:
+                del self._pools[key]
+            # a reloaded catalog usually means new curated examples: retry empty combinations
+            self._empty.clear()
+            print(f"[question_pool] catalog reloaded: {len(self.combinations)} -> {len(combinations)} combinations")
+        self.combinations = combinations
+        self._snap = snap
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def take(self, key, count: int):
+        """
+        Pop `count` pooled (question, markdown) pairs for `key`, or None when the pool
+        holds fewer. Either way the pool is queued for refill once it runs low.
+        """
+        if self._queue is None:
+            return None
+        self.refresh()
+        if key not in self.combinations:
+            return None
+        pool = self._pools.setdefault(key, deque())
+        items = None
+        if len(pool) >= count:
+            items = [pool.popleft() for _ in range(count)]
+            self.hits += 1
+        else:
+            self.misses += 1
+        if len(pool) < self.low_water:
+            self.schedule(key)
+        return items
+
+    def schedule(self, key):
+        if key in self._pending or key in self._empty or self._queue is None:
+            return
+        self._pending.add(key)
+        self._queue.put_nowait(key)
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._refill(key)
+            except Exception as e:
+                print(f"[question_pool] refill failed for {key}: {e}")
+            finally:
+                self._pending.discard(key)
+
+    async def _refill(self, key):
+        pool = self._pools.setdefault(key, deque())
+        while len(pool) < self.size:
+            fields = self.combinations.get(key)
+            if fields is None:  # dropped from the catalog meanwhile
+                self._pools.pop(key, None)
+                return
+            items = await self._fill(fields, min(self.batch, self.size - len(pool)))
+            if not items:
+                if not pool:
+                    self._empty.add(key)
+                return
+            pool.extend(items[:self.size - len(pool)])
+            self.refilled += len(items)
+
+    async def _sweep(self):
+        while True:
+            if datetime.datetime.now().hour in self.offpeak:
+                self.refresh()
+                for key in self.combinations:
+                    if len(self._pools.get(key, ())) < self.low_water:
+                        self.schedule(key)
+            await asyncio.sleep(SWEEP_INTERVAL)
+
+    def stats(self):
+        return {
+            "enabled": self._queue is not None,
+            "combinations": len(self.combinations),
+            "pooled_combinations": sum(1 for pool in self._pools.values() if pool),
+            "pooled_questions": sum(len(pool) for pool in self._pools.values()),
+            "pending_refills": len(self._pending),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refilled": self.refilled,
+        }
+
+
+question_pool = QuestionPool()
@@ -0,0 +1,252 @@
+# semantic_index.py
+"""
+Local vector index over the curated questions, used when a requested topic does not
+match any topic/subtopic name (misspellings such as "Intersectionn of Sets").
+
+Every row is embedded with a hashed TF-IDF vectorizer: lowercased words plus the
+character trigrams of each word, hashed (crc32) into SEMANTIC_DIM buckets, with
+sublinear tf, corpus idf and L2 normalisation. The row text is the topic label
+(weighted twice) plus the question, so a topic string lands near its questions.
+
+scripts/build_semantic_index.py writes
+    compiled_corpus/semantic/vectors.npy   float32 [rows, SEMANTIC_DIM], opened memory-mapped
+    compiled_corpus/semantic/index.json    dim, idf and one block of rows per corpus frame
+Frames are identified by frame_fingerprint (hash of their Question and label columns),
+so a workbook edited since the build gets no semantic results until update_index
+(run by the curated_excels watcher) embeds its new frames with the stored idf.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import weakref
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from corpus import CORPUS_DIR
+
+SEMANTIC_DIR = CORPUS_DIR / "semantic"
+SEMANTIC_DIM = 4096
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.2"))
+SEMANTIC_TOP_N = int(os.getenv("SEMANTIC_TOP_N", "40"))
+SEMANTIC_MMR_LAMBDA = float(os.getenv("SEMANTIC_MMR_LAMBDA", "0.7"))
+
+LABEL_COLUMNS = ("Topic Name", "Subtopic")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def _features(text: str):
+    feats = []
+    for word in _WORD_RE.findall(str(text).lower()):
+        feats.append("w:" + word)
+        padded = f" {word} "
+        feats.extend("c:" + padded[i:i + 3] for i in range(len(padded) - 2))
+    return feats
+
+
+def _hashed_counts(text: str, dim: int = SEMANTIC_DIM):
+    """{bucket: count} of the hashed features of `text`."""
+    counts = {}
+    for f in _features(text):
+        h = zlib.crc32(f.encode("utf-8")) % dim
+        counts[h] = counts.get(h, 0) + 1
+    return counts
+
+
+def _label_column(df: pd.DataFrame):
+    return next((c for c in LABEL_COLUMNS if c in df.columns), None)
+
+
+def row_texts(df: pd.DataFrame):
+    label_col = _label_column(df)
+    labels = df[label_col] if label_col else pd.Series([""] * len(df))
+    questions = df["Question"] if "Question" in df.columns else pd.Series([""] * len(df))
+    out = []
+    for label, question in zip(labels, questions):
+        label = "" if pd.isna(label) else str(label)
+        question = "" if pd.isna(question) else str(question)
+        out.append(f"{label} {label} {question}")
+    return out
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Identifies a corpus frame by its row count, Question and topic label columns."""
+    h = hashlib.sha1(str(len(df)).encode())
+    for text in row_texts(df):
+        h.update(text.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _embed(counts, idf, dim: int):
+    """Rows of sublinear-tf * idf, L2-normalised, for a list of {bucket: count}."""
+    matrix = np.zeros((len(counts), dim), dtype=np.float32)
+    for i, c in enumerate(counts):
+        cols = np.fromiter(c.keys(), dtype=np.int64, count=len(c))
+        vals = (1 + np.log(np.fromiter(c.values(), dtype=np.float32, count=len(c)))) * idf[cols]
+        matrix[i, cols] = vals / (np.linalg.norm(vals) or 1.0)
+    return matrix
+
+
+def build_vectors(frames, dim: int = SEMANTIC_DIM):
+    """
+    Embed every row of `frames` (list of DataFrames). Returns (matrix, idf, blocks)
+    where blocks maps frame_fingerprint -> [start, stop) rows of the matrix.
+    """
+    counts, blocks, start = [], {}, 0
+    for df in frames:
+        fp = frame_fingerprint(df)
+        if fp in blocks:  # e.g. a workbook's default frame and its first sheet
+            continue
+        counts.extend(_hashed_counts(t, dim) for t in row_texts(df))
+        blocks[fp] = [start, len(counts)]
+        start = len(counts)
+    doc_freq = np.zeros(dim, dtype=np.float64)
+    for c in counts:
+        doc_freq[list(c)] += 1
+    idf = (np.log((1 + len(counts)) / (1 + doc_freq)) + 1).astype(np.float32)
+    return _embed(counts, idf, dim), idf, blocks
+
+
+def write_index(matrix, idf, blocks, directory=SEMANTIC_DIR):
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp = directory / "vectors.tmp.npy"
+    np.save(tmp, matrix)
+    os.replace(tmp, directory / "vectors.npy")
+    meta = {"dim": int(matrix.shape[1]), "rows": int(matrix.shape[0]), "idf": idf.tolist(), "blocks": blocks}
+    tmp = directory / "index.json.tmp"
+    tmp.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp, directory / "index.json")
+
+
+def update_index(frames, directory=SEMANTIC_DIR):
+    """
+    Bring the index in `directory` up to date with `frames` (all current corpus frames):
+    blocks of frames still present are copied over, frames not indexed yet are embedded
+    with the stored idf, blocks of frames that are gone are dropped. Without an index
+    this is a full build. Returns the number of frames embedded.
+    """
+    try:
+        meta = json.loads((directory / "index.json").read_text(encoding="utf-8"))
+        old = np.load(directory / "vectors.npy", mmap_mode="r")
+    except FileNotFoundError:
+        matrix, idf, blocks = build_vectors(frames)
+        write_index(matrix, idf, blocks, directory)
+        return len(blocks)
+    dim, idf = meta["dim"], np.asarray(meta["idf"], dtype=np.float32)
+    parts, blocks, start, embedded = [], {}, 0, 0
+    for df in frames:
+        fp = frame_fingerprint(df)
+        if fp in blocks:
+            continue
+        span = meta["blocks"].get(fp)
+        if span is not None:
+            part = np.asarray(old[span[0]:span[1]])
+        else:
+            part = _embed([_hashed_counts(t, dim) for t in row_texts(df)], idf, dim)
+            embedded += 1
+        parts.append(part)
+        blocks[fp] = [start, start + len(part)]
+        start += len(part)
+    if not embedded and blocks.keys() == meta["blocks"].keys():
+        return 0
+    matrix = np.concatenate(parts) if parts else np.zeros((0, dim), dtype=np.float32)
+    write_index(matrix, idf, blocks, directory)
+    return embedded
+
+
+class SemanticIndex:
+    def __init__(self, directory=SEMANTIC_DIR):
+        self.directory = directory
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        self.matrix = None
+        self.idf = None
+        self.blocks = {}
+        self._fingerprints = {}  # id(df) -> fingerprint, dropped with the frame
+
+    def _load(self):
+        """(Re)open the memory-mapped matrix when the build output changed; False if there is none."""
+        meta_path = self.directory / "index.json"
+        try:
+            mtime = meta_path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime != self._loaded_mtime:
+            with self._lock:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                self.matrix = np.load(self.directory / "vectors.npy", mmap_mode="r")
+                self.idf = np.asarray(meta["idf"], dtype=np.float32)
+                self.blocks = meta["blocks"]
+                self._fingerprints = {}
+                self._loaded_mtime = mtime
+        return True
+
+    def block(self, df: pd.DataFrame):
+        """Rows of `df` in the matrix (a memory-mapped view), or None if it is not indexed."""
+        if not self._load():
+            return None
+        fp = self._fingerprints.get(id(df))
+        if fp is None:
+            fp = self._fingerprints[id(df)] = frame_fingerprint(df)
+            weakref.finalize(df, self._fingerprints.pop, id(df), None)
+        span = self.blocks.get(fp)
+        if span is None:
+            return None
+        return self.matrix[span[0]:span[1]]
+
+    def embed(self, text: str):
+        counts = _hashed_counts(text, len(self.idf))
+        cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        vals = (1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self.idf[cols]
+        return cols, vals / (np.linalg.norm(vals) or 1.0)
+
+    def nearest(self, df: pd.DataFrame, query: str, rows=None, top_n: int = SEMANTIC_TOP_N,
+                min_score: float = SEMANTIC_MIN_SCORE):
+        """
+        Row positions of `df` (optionally limited to `rows`) most similar to `query`,
+        best first, with their cosine scores. Empty when nothing scores >= min_score.
+        """
+        block = self.block(df)
+        if block is None or not str(query or "").strip():
+            return _EMPTY, np.empty(0, dtype=np.float32)
+        cols, vals = self.embed(query)
+        if rows is None:
+            rows = np.arange(block.shape[0])
+        rows = np.asarray(rows, dtype=np.int64)
+        # read only the (row, query bucket) cells, not whole columns of the mapped block
+        scores = block[np.ix_(rows, cols)] @ vals
+        keep = scores >= min_score
+        rows, scores = rows[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")[:top_n]
+        return rows[order], scores[order]
+
+    def mmr(self, df: pd.DataFrame, query: str, rows, k: int, lam: float = SEMANTIC_MMR_LAMBDA):
+        """
+        Pick k of `rows` by maximal marginal relevance: similar to `query` but not to the
+        rows already picked, so the few-shots are not near-copies of each other.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        block = self.block(df)
+        if block is None or len(rows) <= 1 or k <= 0:
+            return rows[:k]
+        vectors = np.asarray(block[rows])
+        cols, vals = self.embed(query)
+        relevance = vectors[:, cols] @ vals
+        pairwise = vectors @ vectors.T
+        picked = [int(np.argmax(relevance))]
+        redundancy = pairwise[picked[0]].copy()
+        while len(picked) < min(k, len(rows)):
+            score = lam * relevance - (1 - lam) * redundancy
+            score[picked] = -np.inf
+            nxt = int(np.argmax(score))
+            picked.append(nxt)
+            redundancy = np.maximum(redundancy, pairwise[nxt])
+        return rows[picked]
+
+
+semantic_index = SemanticIndex()
@@ -0,0 +1,56 @@
+# stream_parser.py
+"""
+Incremental parser for a streamed JSON list of objects, e.g. the generation reply
+    [ {"question": "...", "answer": "..."}, ... ]
+arriving a few characters at a time. Each top-level object is returned as soon as
+its closing brace arrives; anything around the list (```json fences, prose) is ignored.
+"""
+import json
+
+
+class JsonArrayStreamParser:
+    def __init__(self):
+        self.text = ""        # everything received so far
+        self._pos = 0         # next character to scan
+        self._depth = 0       # bracket/brace depth, the outer list is depth 1
+        self._in_string = False
+        self._escape = False
+        self._obj_start = None
+
+    def feed(self, chunk: str):
+        """Add streamed text; returns the list of objects completed by it."""
+        self.text += chunk or ""
+        items = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch in "[{":
+                if self._depth == 0 and ch == "{":
+                    # not inside the list yet (prose before it); ignore
+                    continue
+                self._depth += 1
+                if self._depth == 2 and ch == "{":
+                    self._obj_start = i
+            elif ch in "]}":
+                if self._depth == 0:
+                    continue
+                if self._depth == 2 and ch == "}" and self._obj_start is not None:
+                    try:
+                        items.append(json.loads(text[self._obj_start:i + 1]))
+                    except ValueError:
+                        pass
+                    self._obj_start = None
+                self._depth -= 1
+        self._pos = len(text)
+        return items
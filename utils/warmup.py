@@ -0,0 +1,138 @@
+# warmup.py
+"""
+Startup warm-up: load every curated frame before the worker takes traffic.
+
+Workbooks without an up-to-date compiled corpus copy are parsed and compiled in a
+process pool (one workbook per process; openpyxl parsing is CPU-bound). Then every
+frame the server reads (each Math sheet plus the default first-sheet frame, each
+science workbook's combined frame) is loaded from the compiled corpus into the
+in-process frame cache and its FewshotIndexes are built, so the first request
+neither parses nor indexes anything. Math sheet names come from the compiled
+corpus manifest rather than from opening the workbook. Follow-up steps (e.g. the near-duplicate index) run last.
+Until all of it is done, /healthz/ready answers 503.
+
+Several uvicorn workers warm up at the same time. Compilation is serialised by an
+exclusive lock on compiled_corpus/.build.lock: the first worker compiles, the others
+wait, re-check freshness and find the Arrow files already there. Every worker then
+memory-maps the same files (see corpus.py), so the parsed corpus sits in the page
+cache once rather than once per worker.
+
+Configured through environment variables:
+    WARMUP_ENABLED   "0" to skip the warm-up and report ready at once (default "1")
+    WARMUP_WORKERS   processes for compiling stale workbooks (default min(4, CPUs))
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from corpus import build_lock, is_fresh
+from fewshot import (
+    _read_excel_cached,
+    compile_workbook,
+    corpus_workbooks,
+    prime_fewshot_indexes,
+    read_science_workbook,
+    sheet_names,
+)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_WORKERS = int(os.getenv("WARMUP_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _compile_timed(path):
+    start = time.perf_counter()
+    written = compile_workbook(path)
+    return written, time.perf_counter() - start
+
+
+class Warmup:
+    def __init__(self, workers: int = WARMUP_WORKERS):
+        self.workers = workers
+        self.ready = False
+        self.started_at = None
+        self.finished_at = None
+        self.files = {}    # workbook -> {"frames", "compiled", "compile_s", "load_s"}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def mark_ready(self):
+        self.ready = True
+
+    def _compile_stale(self, stale):
+        """Compile workbooks in worker processes; returns {path: seconds} of the successful ones."""
+        if not stale:
+            return {}
+        timings = {}
+        # spawn: forking a process that already runs the server's threads is not safe
+        with ProcessPoolExecutor(max_workers=max(1, min(self.workers, len(stale))),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {path: pool.submit(_compile_timed, str(path)) for path in stale}
+            for path, future in futures.items():
+                try:
+                    _, timings[path] = future.result()
+                except Exception as e:
+                    self.errors[str(path)] = f"compile failed: {e}"
+                    print(f"[warmup] compiling {path} failed: {e}")
+        return timings
+
+    def run(self, after=()):
+        """Blocking warm-up (run it in a thread); `after` are callables run once frames are loaded."""
+        with self._lock:
+            if self.ready:
+                return
+            self.started_at = time.time()
+            start = time.perf_counter()
+            workbooks = list(corpus_workbooks())
+            compiled = {}
+            if any(not is_fresh(path) for path, _ in workbooks):
+                with build_lock():
+                    # another worker may have compiled them while this one waited
+                    compiled = self._compile_stale([path for path, _ in workbooks if not is_fresh(path)])
+
+            for path, science in workbooks:
+                t0 = time.perf_counter()
+                try:
+                    if science:
+                        prime_fewshot_indexes(_read_excel_cached(path, reader=read_science_workbook))
+                        frames = 1
+                    else:
+                        sheets = [None] + sheet_names(path)
+                        for sheet in sheets:
+                            prime_fewshot_indexes(_read_excel_cached(path, sheet_name=sheet))
+                        frames = len(sheets)
+                except Exception as e:
+                    self.errors[str(path)] = f"load failed: {e}"
+                    print(f"[warmup] loading {path} failed: {e}")
+                    continue
+                entry = {"frames": frames, "compiled": path in compiled,
+                         "compile_s": round(compiled.get(path, 0.0), 3),
+                         "load_s": round(time.perf_counter() - t0, 3)}
+                self.files[str(path)] = entry
+                print(f"[warmup] {path.name}: {frames} frame(s), load {entry['load_s']}s"
+                      + (f", compiled in {entry['compile_s']}s" if entry["compiled"] else ""))
+
+            for step in after:
+                try:
+                    step()
+                except Exception as e:
+                    self.errors[getattr(step, "__qualname__", str(step))] = str(e)
+                    print(f"[warmup] {step} failed: {e}")
+            self.finished_at = time.time()
+            self.ready = True
+            print(f"[warmup] ready after {time.perf_counter() - start:.2f}s "
+                  f"({len(self.files)} workbooks, {len(compiled)} compiled, {len(self.errors)} errors)")
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+            "files": self.files,
+            "errors": self.errors,
+        }
+
+
+warmup = Warmup()